@@ -0,0 +1,143 @@
+import asyncio
+import functools
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from jobs import JobProgress
+from query_executor import DEFAULT_MAX_WORKERS, QueryCancelled, execute_query, reserve_connections
+
+DEFAULT_CONCURRENCY = 4  # Parallel queries allowed against a single endpoint
+DEFAULT_QUERY_TIMEOUT = 600  # Seconds before a query is abandoned
+
+
+def template_jobs(endpoint, templates):
+    """
+    Builds batch jobs for every non-empty entry of a template dictionary.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - templates: Mapping of template name to query text, e.g. query_templates.query_templates.
+
+    Returns:
+    A list of job dictionaries with 'name', 'endpoint' and 'query' keys.
+    """
+    return [{'name': name, 'endpoint': endpoint, 'query': query}
+            for name, query in templates.items() if query.strip()]
+
+
+async def run_batch(jobs, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_QUERY_TIMEOUT, **execute_options):
+    """
+    Runs many queries concurrently and yields each outcome as soon as its query completes.
+
+    Every endpoint gets its own concurrency limit, so a slow endpoint does not hold back the
+    others. Queries run in worker threads through execute_query (cache and paging options pass
+    through execute_options), each with its own jobs.JobProgress: a query that times out or is
+    still running when the generator is closed is cancelled, and stops at its next request or
+    read. The timeout only starts once the query has a worker thread, and its slot on the
+    endpoint is only given back when that thread is done with it.
+
+    Parameters:
+    - jobs: Iterable of dictionaries with 'name', 'endpoint' and 'query' keys.
+    - concurrency: Maximum number of simultaneous queries per endpoint.
+    - timeout: Seconds after which a query is reported as failed. The same value bounds each
+      HTTP read, so the worker thread also gives up on the endpoint.
+
+    Yields:
+    Dictionaries with the following keys:
+    - 'name', 'endpoint', 'query': Copied from the job.
+    - 'result': The execute_query result dictionary.
+    - 'queued_time': Seconds spent waiting for a free slot on the endpoint.
+    - 'elapsed_time': Seconds from the start of the query to its completion.
+    """
+    jobs = list(jobs)
+    semaphores = defaultdict(lambda: asyncio.Semaphore(concurrency))
+    for endpoint in {job['endpoint'] for job in jobs}:
+        reserve_connections(endpoint, concurrency, paged=execute_options.get('paged', False),
+                            max_workers=execute_options.get('max_workers', DEFAULT_MAX_WORKERS))
+    # Dedicated threads, so the per-endpoint limits rather than the default executor size bound parallelism
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency * len({job['endpoint'] for job in jobs})))
+    loop = asyncio.get_running_loop()
+    batch_start = time.perf_counter()
+
+    progresses = []
+
+    def execute(job, progress, started):
+        # Runs in the worker thread: the deadline starts with the query, not while it was queued
+        progress.deadline = time.monotonic() + timeout if timeout else None
+        loop.call_soon_threadsafe(started.set)
+        progress.check()
+        return execute_query(job['endpoint'], job['query'], timeout=timeout, progress=progress, **execute_options)
+
+    async def run_job(job):
+        semaphore = semaphores[job['endpoint']]
+        await semaphore.acquire()
+        progress = JobProgress()
+        progresses.append(progress)
+        started_event = asyncio.Event()
+        work = loop.run_in_executor(pool, execute, job, progress, started_event)
+        # The slot is released when the thread returns, even if the job was reported earlier
+        work.add_done_callback(lambda _: semaphore.release())
+        started = time.perf_counter()
+        try:
+            await started_event.wait()
+            started = time.perf_counter()
+            result = await asyncio.wait_for(asyncio.shield(work), timeout)
+            if progress.timed_out:
+                result = dict(result, error=f"Query timed out after {timeout} seconds.")
+        except asyncio.TimeoutError:
+            progress.timed_out = True
+            progress.cancelled.set()
+            result = {
+                'success': False,
+                'columns': [],
+                'data': [],
+                'error': f"Query timed out after {timeout} seconds.",
+                'execution_time': time.perf_counter() - started,
+                'cached': False
+            }
+        except QueryCancelled as e:  # Cancelled before it started
+            result = {'success': False, 'columns': [], 'data': [], 'error': str(e),
+                      'execution_time': 0.0, 'cached': False}
+        return {
+            'name': job['name'],
+            'endpoint': job['endpoint'],
+            'query': job['query'],
+            'result': result,
+            'queued_time': started - batch_start,
+            'elapsed_time': time.perf_counter() - started,
+        }
+
+    tasks = [asyncio.create_task(run_job(job)) for job in jobs]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for progress in progresses:
+            progress.cancelled.set()
+        for task in tasks:
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_batch_sync(jobs, on_result=None, **batch_options):
+    """
+    Runs run_batch to completion from synchronous code, such as the Streamlit script.
+
+    Parameters:
+    - jobs: Iterable of job dictionaries (see run_batch).
+    - on_result: Optional callback invoked with each outcome as it completes.
+    - batch_options: concurrency, timeout and execute_query options passed to run_batch.
+
+    Returns:
+    The list of outcomes in completion order.
+    """
+    async def collect():
+        outcomes = []
+        async for outcome in run_batch(jobs, **batch_options):
+            outcomes.append(outcome)
+            if on_result is not None:
+                on_result(outcome)
+        return outcomes
+
+    return asyncio.run(collect())
@@ -0,0 +1,204 @@
+"""
+Benchmarks the query-to-chart pipeline against a local stand-in endpoint.
+
+Starts benchmarks/stub_endpoint.py (or uses --endpoint), then times execute_query end to end
+per results format, DataFrame construction, every export format, perform_regression and the
+figure construction in visualize_data. Results are written as JSON; pass a previous run as
+--baseline to print the change per benchmark.
+
+    python benchmarks/run_benchmarks.py --rows 200000 --output bench.json
+    python benchmarks/run_benchmarks.py --rows 200000 --baseline bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from stub_endpoint import DEFAULT_TYPES  # noqa: E402
+
+QUERY = 'SELECT * WHERE { ?s ?p ?o }'  # The stand-in answers any SELECT with its table
+VISUALIZATIONS = ("Line Chart", "Bar Chart", "Pie Chart")
+
+
+def _measure(function, repeat):
+    """
+    Calls function repeat times; returns (timings in seconds, return value of the last call).
+    """
+    timings = []
+    value = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        timings.append(time.perf_counter() - start)
+    return timings, value
+
+
+def _record(results, name, timings, **details):
+    entry = {
+        'name': name,
+        'repeat': len(timings),
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'timings': timings,
+    }
+    entry.update(details)
+    results.append(entry)
+    print(f"{name:<40} median {entry['median'] * 1000:10.1f} ms", file=sys.stderr)
+    return entry
+
+
+def _start_stub(args):
+    command = [sys.executable, os.path.join(BENCHMARK_DIR, 'stub_endpoint.py'), '--rows', str(args.rows),
+               '--types', args.types, '--null-fraction', str(args.null_fraction), '--latency', str(args.latency)]
+    if args.bandwidth:
+        command += ['--bandwidth', str(args.bandwidth)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('Serving'):
+        process.kill()
+        raise RuntimeError(f"The stub endpoint did not start: {line!r}")
+    return process, line.split(' at ', 1)[1].strip()
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _numeric_columns(result_set):
+    return [name for name in result_set.columns if result_set.column(name).kind in ('integer', 'float')]
+
+
+def run(args, endpoint):
+    # Imported here so the stub subprocess is running before the heavy imports start
+    from query_executor import execute_query
+    from regression_analysis import perform_regression
+    from result_set import ResultSet
+    from results_export import available_formats, export_to_file
+
+    results = []
+    result_set = None
+    for results_format in args.formats.split(','):
+        for paged in ([False, True] if args.paged else [False]):
+            timings, result = _measure(
+                lambda: execute_query(endpoint, QUERY, use_cache=False, paged=paged, results_format=results_format),
+                args.repeat)
+            if not result['success']:
+                raise RuntimeError(f"execute_query failed: {result['error']}")
+            _record(results, f"execute_query[{results_format}{',paged' if paged else ''}]", timings,
+                    rows=len(result['data']), bytes_received=result['bytes_received'],
+                    parse_time=result['parse_time'], stages=result['stages'])
+            if result_set is None or results_format == 'json':
+                result_set = result['data']
+
+    def fresh():
+        # A new ResultSet over the same columns, so to_dataframe() is not answered from its cache
+        return ResultSet([result_set.column(name) for name in result_set.columns])
+
+    timings, _ = _measure(lambda: fresh().to_dataframe(), args.repeat)
+    _record(results, 'to_dataframe', timings, rows=len(result_set))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for export_format in available_formats():
+            path = os.path.join(directory, f"export.{export_format.lower()}")
+            timings, _ = _measure(lambda: export_to_file(fresh(), result_set.columns, export_format, path),
+                                  args.repeat)
+            _record(results, f"export[{export_format}]", timings, bytes_written=os.path.getsize(path))
+
+    numeric = _numeric_columns(result_set)
+    if len(numeric) >= 2:
+        frame = result_set.to_dataframe()
+        timings, (_, _, error) = _measure(lambda: perform_regression(frame, numeric[0], numeric[1:]), args.repeat)
+        _record(results, 'perform_regression', timings, variables=len(numeric), error=error)
+
+    if len(result_set.columns) >= 2:
+        from streamlit.logger import set_log_level
+        from data_visualization import visualize_data
+        # visualize_data runs outside `streamlit run` here: widgets return their defaults and charts are
+        # built but not sent. A first untimed call loads Streamlit's configuration, after which its
+        # per-widget warnings can be silenced.
+        visualize_data(fresh().slice(0, 10), result_set.columns, VISUALIZATIONS[0])
+        set_log_level('error')
+        for viz_type in VISUALIZATIONS:
+            timings, _ = _measure(lambda: visualize_data(fresh(), result_set.columns, viz_type), args.repeat)
+            _record(results, f"visualize_data[{viz_type}]", timings)
+    return results
+
+
+def compare(results, baseline_path):
+    """
+    Prints the median of every benchmark relative to the same benchmark in a baseline run.
+    """
+    with open(baseline_path) as handle:
+        baseline = {entry['name']: entry for entry in json.load(handle)['results']}
+    print(f"\n{'benchmark':<40}{'baseline ms':>14}{'current ms':>14}{'change':>10}", file=sys.stderr)
+    for entry in results:
+        previous = baseline.get(entry['name'])
+        if previous is None:
+            continue
+        change = entry['median'] / previous['median'] - 1
+        print(f"{entry['name']:<40}{previous['median'] * 1000:>14.1f}{entry['median'] * 1000:>14.1f}{change:>+10.1%}",
+              file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="Rows served by the stand-in endpoint.")
+    parser.add_argument('--types', default=DEFAULT_TYPES, help="Column types of the synthetic result (see stub_endpoint.py).")
+    parser.add_argument('--null-fraction', type=float, default=0.05, help="Share of unbound cells.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds the endpoint waits before answering.")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Endpoint throughput cap in MB/s.")
+    parser.add_argument('--formats', default='json,tsv,csv', help="Results formats to fetch.")
+    parser.add_argument('--paged', action='store_true', help="Also measure paged fetching.")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per benchmark.")
+    parser.add_argument('--endpoint', help="Benchmark against this endpoint instead of starting the stand-in.")
+    parser.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    parser.add_argument('--baseline', help="Earlier JSON report to compare against.")
+    args = parser.parse_args(argv)
+
+    process = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        process, endpoint = _start_stub(args)
+    try:
+        results = run(args, endpoint)
+    finally:
+        if process is not None:
+            process.kill()
+            process.wait()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
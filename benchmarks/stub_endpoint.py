@@ -0,0 +1,235 @@
+"""
+Local stand-in for a SPARQL endpoint, serving a synthetic result set.
+
+Every SELECT query gets the same table back (only LIMIT/OFFSET are honoured, so paged fetching
+works); ASK queries get true. The table is rendered once at startup, so serving costs little
+besides copying bytes and the configured latency.
+
+    python benchmarks/stub_endpoint.py --rows 100000 --types iri,string,integer,double,dateTime --latency 0.05
+"""
+import argparse
+import gzip
+import json
+import re
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+COLUMN_TYPES = ('iri', 'string', 'integer', 'decimal', 'double', 'dateTime', 'date', 'boolean')
+DEFAULT_TYPES = 'iri,string,integer,decimal,double,dateTime'
+CHUNK_SIZE = 65536
+
+_LIMIT_PATTERN = re.compile(r'\bLIMIT\s+(\d+)', re.IGNORECASE)
+_OFFSET_PATTERN = re.compile(r'\bOFFSET\s+(\d+)', re.IGNORECASE)
+_ASK_PATTERN = re.compile(r'^(?:\s*(?:PREFIX|BASE)[^<]*<[^>]*>)*\s*ASK\b', re.IGNORECASE)
+
+
+def _column_values(column_type, rows, rng):
+    """
+    Returns (lexical values, datatype IRI or None) for one synthetic column.
+    """
+    index = np.arange(rows)
+    if column_type == 'iri':
+        return [f"http://example.org/resource/{value}" for value in rng.integers(0, max(1, rows // 10), rows)], None
+    if column_type == 'string':
+        return [f"Label {value}" for value in rng.integers(0, 5000, rows)], None
+    if column_type == 'integer':
+        return [str(value) for value in rng.integers(-10 ** 6, 10 ** 6, rows)], XSD + 'integer'
+    if column_type == 'decimal':
+        return [f"{value:.2f}" for value in rng.uniform(0, 10 ** 5, rows)], XSD + 'decimal'
+    if column_type == 'double':
+        return [repr(value) for value in rng.normal(0, 1000, rows).tolist()], XSD + 'double'
+    if column_type == 'dateTime':
+        stamps = np.datetime64('2020-01-01T00:00:00') + index.astype('timedelta64[m]')
+        return [f"{stamp}Z" for stamp in stamps.astype(str)], XSD + 'dateTime'
+    if column_type == 'date':
+        days = np.datetime64('2000-01-01') + (index % 9000).astype('timedelta64[D]')
+        return list(days.astype(str)), XSD + 'date'
+    if column_type == 'boolean':
+        return ['true' if value else 'false' for value in rng.integers(0, 2, rows)], XSD + 'boolean'
+    raise ValueError(f"Unknown column type {column_type!r}; expected one of {', '.join(COLUMN_TYPES)}.")
+
+
+def _json_term(value, column_type, datatype):
+    if column_type == 'iri':
+        return json.dumps({'type': 'uri', 'value': value})
+    if datatype is None:
+        return json.dumps({'type': 'literal', 'value': value})
+    return json.dumps({'type': 'literal', 'datatype': datatype, 'value': value})
+
+
+def _tsv_term(value, column_type, datatype):
+    if column_type == 'iri':
+        return f"<{value}>"
+    if datatype is None:
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    if column_type in ('integer', 'decimal', 'double', 'boolean'):
+        return value  # Bare numbers and booleans, as most endpoints write them
+    return f'"{value}"^^<{datatype}>'
+
+
+def _csv_term(value, column_type, datatype):
+    return '"' + value.replace('"', '""') + '"' if ',' in value or '"' in value else value
+
+
+class SyntheticResults:
+    """
+    A synthetic SELECT result pre-rendered as JSON, TSV and CSV row fragments.
+
+    Parameters:
+    - rows: Number of result rows.
+    - types: Column types, one column per entry (see COLUMN_TYPES).
+    - null_fraction: Share of cells left unbound.
+    - seed: Random seed, so runs are comparable.
+    """
+
+    def __init__(self, rows, types, null_fraction=0.0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rows = rows
+        self.names = [f"{column_type.lower()}{position}" for position, column_type in enumerate(types)]
+        json_cells, tsv_cells, csv_cells = [], [], []
+        for name, column_type in zip(self.names, types):
+            values, datatype = _column_values(column_type, rows, rng)
+            unbound = rng.random(rows) < null_fraction
+            key = json.dumps(name) + ':'
+            json_cells.append([None if unbound[row] else key + _json_term(value, column_type, datatype)
+                               for row, value in enumerate(values)])
+            tsv_cells.append(['' if unbound[row] else _tsv_term(value, column_type, datatype)
+                              for row, value in enumerate(values)])
+            csv_cells.append(['' if unbound[row] else _csv_term(value, column_type, datatype)
+                              for row, value in enumerate(values)])
+        self.json_rows = [('{' + ','.join(cell for cell in row if cell is not None) + '}').encode('utf-8')
+                          for row in zip(*json_cells)]
+        self.tsv_rows = [('\t'.join(row) + '\n').encode('utf-8') for row in zip(*tsv_cells)]
+        self.csv_rows = [(','.join(row) + '\r\n').encode('utf-8') for row in zip(*csv_cells)]
+
+    def render(self, results_format, offset=0, limit=None):
+        """
+        Returns the response body for rows [offset, offset + limit) in the given format.
+        """
+        stop = self.rows if limit is None else min(self.rows, offset + limit)
+        if results_format == 'tsv':
+            header = ('\t'.join('?' + name for name in self.names) + '\n').encode('utf-8')
+            return header + b''.join(self.tsv_rows[offset:stop])
+        if results_format == 'csv':
+            return (','.join(self.names) + '\r\n').encode('utf-8') + b''.join(self.csv_rows[offset:stop])
+        head = json.dumps({'vars': self.names}).encode('utf-8')
+        return b'{"head":' + head + b',"results":{"bindings":[' + b',\n'.join(self.json_rows[offset:stop]) + b']}}'
+
+
+CONTENT_TYPES = {
+    'json': 'application/sparql-results+json',
+    'tsv': 'text/tab-separated-values; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _negotiate(accept):
+    """
+    Picks the results format with the highest q-value in an Accept header (JSON by default).
+    """
+    best, best_quality = 'json', -1.0
+    for entry in accept.split(','):
+        media_type, _, parameters = entry.strip().partition(';')
+        quality = 1.0
+        match = re.search(r'q=([\d.]+)', parameters)
+        if match:
+            quality = float(match.group(1))
+        for results_format, content_type in CONTENT_TYPES.items():
+            if media_type.strip() == content_type.split(';')[0] and quality > best_quality:
+                best, best_quality = results_format, quality
+    return best
+
+
+def make_handler(results, latency=0.0, bandwidth=None, compress=True):
+    """
+    Builds the request handler class serving the given SyntheticResults.
+
+    Parameters:
+    - latency: Seconds to wait before answering each request (time to first byte).
+    - bandwidth: Optional throughput cap in bytes per second.
+    - compress: Whether to honour Accept-Encoding: gzip.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, as real endpoints do
+
+        def do_GET(self):
+            self._answer(parse_qs(urlparse(self.path).query).get('query', [''])[0])
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+            if self.headers.get('Content-Type', '').startswith('application/sparql-query'):
+                self._answer(body)
+            else:
+                self._answer(parse_qs(body).get('query', [''])[0])
+
+        def _answer(self, query):
+            if latency:
+                time.sleep(latency)
+            if _ASK_PATTERN.match(query):
+                results_format, body = 'json', b'{"head":{},"boolean":true}'
+            else:
+                limit = _LIMIT_PATTERN.findall(query)
+                offset = _OFFSET_PATTERN.findall(query)
+                results_format = _negotiate(self.headers.get('Accept', ''))
+                body = results.render(results_format, int(offset[-1]) if offset else 0,
+                                      int(limit[-1]) if limit else None)
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPES[results_format])
+            if compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=1)
+                self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            for start in range(0, len(body), CHUNK_SIZE):
+                self.wfile.write(body[start:start + CHUNK_SIZE])
+                if bandwidth:
+                    time.sleep(min(CHUNK_SIZE, len(body) - start) / bandwidth)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(rows, types, null_fraction=0.0, latency=0.0, bandwidth=None, compress=True, host='127.0.0.1', port=0):
+    """
+    Creates the HTTP server (not yet serving). The bound port is server.server_address[1].
+    """
+    results = SyntheticResults(rows, types, null_fraction)
+    return ThreadingHTTPServer((host, port), make_handler(results, latency, bandwidth, compress))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="Rows in the result set.")
+    parser.add_argument('--types', default=DEFAULT_TYPES,
+                        help=f"Comma-separated column types, one per column; from {', '.join(COLUMN_TYPES)}.")
+    parser.add_argument('--null-fraction', type=float, default=0.0, help="Share of unbound cells.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before each response starts.")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Throughput cap in MB/s.")
+    parser.add_argument('--no-gzip', action='store_true', help="Ignore Accept-Encoding: gzip.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help="Port to listen on (0 picks a free one).")
+    args = parser.parse_args(argv)
+
+    server = serve(args.rows, args.types.split(','), args.null_fraction, args.latency,
+                   args.bandwidth * 1e6 if args.bandwidth else None, not args.no_gzip, args.host, args.port)
+    host, port = server.server_address[:2]
+    # The benchmark runner reads this line to find the endpoint
+    print(f"Serving {args.rows} rows at http://{host}:{port}/sparql", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""
+Command line for running queries without the app, e.g. from cron jobs.
+
+    python cli.py query https://example.org/sparql --template "Count the number of notices" > notices.csv
+    python cli.py query https://example.org/sparql --query-file buyers.rq --param start=2023-01-01 \\
+        --output buyers.parquet
+    python cli.py batch manifest.json --output-dir exports
+    python cli.py templates
+
+Queries are checked as in the app before they are sent (see query_analysis.py): syntax errors stop
+the run, cost hazards are reported on stderr (and stop it with --strict). Results go through the
+same cache as the app's, so scheduled exports and the app share the queries they both run.
+
+A batch manifest is a JSON object:
+
+    {
+        "endpoint": "https://example.org/sparql",
+        "format": "csv",
+        "options": {"results_format": "tsv", "paged": true},
+        "queries": [
+            {"name": "monthly", "template": "Count the number of notices per month",
+             "params": {"start": "2023-01-01", "end": "2024-01-01"}},
+            {"name": "buyers", "query_file": "buyers.rq", "format": "parquet", "output": "buyers.parquet"}
+        ]
+    }
+
+Each query has a template, a query_file (relative to the manifest) or an inline query, and may
+override the endpoint and the format; it is written to its output, by default <name> with the
+extension of its format, in the output directory. The options apply to every query (see
+execute_query) and are overridden by the same options given on the command line.
+
+Only the query path is imported at start-up: charts, regression analysis and the app are never
+loaded, and pandas only when the output format needs it, while the endpoint works on the query.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from batch_runner import DEFAULT_CONCURRENCY, run_batch_sync
+from query_analysis import SparqlSyntaxError, analyze_query
+from query_executor import RESULTS_FORMATS, execute_query, iter_query_batches
+from query_partitioning import QueryTemplate, run_partitioned
+from query_templates import parameterized_templates, query_templates
+from results_export import EXPORT_FORMATS, available_formats, write_csv, write_ndjson
+
+EXIT_FAILED = 1  # A query failed or its results could not be written
+EXIT_INVALID = 2  # Invalid arguments, manifest or query; nothing was run (argparse uses it too)
+FORMAT_NAMES = {name.lower(): name for name in EXPORT_FORMATS}
+STREAMING_FORMATS = ('CSV', 'NDJSON')  # Formats that can be appended to batch by batch
+PANDAS_FORMATS = ('CSV', 'JSON', 'NDJSON')  # Formats whose writers render through pandas
+# execute_query options a manifest may set for all of its queries
+MANIFEST_OPTIONS = ('use_cache', 'refresh', 'paged', 'page_size', 'max_workers', 'results_format', 'timeout')
+
+_EXTENSION_FORMATS = {os.path.splitext(file_name)[1]: name for name, (_, file_name, _) in EXPORT_FORMATS.items()}
+_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+_DATETIME_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}T')
+_UNSAFE_NAME_PATTERN = re.compile(r'[^\w.-]+')
+
+
+class CliError(ValueError):
+    """
+    Raised for invalid arguments, manifests or queries; reported as a message without a traceback.
+    """
+
+
+def parse_value(value):
+    """
+    Converts a template parameter given as text: ISO dates and date-times become date and
+    datetime objects, integers and decimals become numbers, anything else stays a string
+    (see query_partitioning.sparql_literal for how each is written into the query).
+    """
+    if not isinstance(value, str):
+        return value  # Already typed, e.g. a number in a manifest
+    try:
+        if _DATE_PATTERN.fullmatch(value):
+            return datetime.date.fromisoformat(value)
+        if _DATETIME_PATTERN.match(value):
+            return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise CliError(f"Invalid date: {value}") from None
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def _param(text):
+    name, separator, value = text.partition('=')
+    if not separator or not name.strip():
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    return name.strip(), value
+
+
+def resolve_query(template=None, query_file=None, query=None, params=None, base_dir=''):
+    """
+    Builds the query to run from exactly one of a template name, a query file or a query text.
+
+    Parameters:
+    - template: Name of an entry of query_templates.query_templates or parameterized_templates.
+    - query_file: Path of a file holding the query, relative to base_dir.
+    - query: The query text.
+    - params: Values for the {{name}} placeholders, as text (see parse_value) or typed values;
+      the defaults of a parameterized template apply to those not given.
+
+    Returns:
+    A tuple (query text, QueryTemplate, parameter values).
+
+    Raises:
+    CliError if the template or file is not found, or a parameter is unknown or missing.
+    """
+    if template is not None:
+        if template in parameterized_templates:
+            query_template = parameterized_templates[template]
+        elif query_templates.get(template, '').strip():
+            query_template = QueryTemplate(query_templates[template])
+        else:
+            raise CliError(f"Unknown template {template!r}; 'python cli.py templates' lists them.")
+    elif query_file is not None:
+        try:
+            with open(os.path.join(base_dir, query_file), encoding='utf-8') as handle:
+                query_template = QueryTemplate(handle.read())
+        except OSError as e:
+            raise CliError(f"Cannot read the query file: {e}") from None
+    else:
+        query_template = QueryTemplate(query)
+
+    values = {name: parse_value(value) for name, value in (params or {}).items()}
+    unknown = sorted(set(values) - set(query_template.parameters))
+    if unknown:
+        raise CliError(f"The query has no {{{{{unknown[0]}}}}} placeholder.")
+    try:
+        return query_template.render(**values), query_template, values
+    except KeyError as e:
+        raise CliError(e.args[0]) from None
+
+
+def check_query(query, strict=False, quiet=False, label=''):
+    """
+    Analyzes a query before it is sent, writing its cost hazards to stderr unless quiet.
+
+    Raises:
+    CliError if the query does not parse, or has hazards and strict is set.
+    """
+    prefix = f"{label}: " if label else ''
+    try:
+        analysis = analyze_query(query)
+    except SparqlSyntaxError as e:
+        raise CliError(f"{prefix}Invalid query: {e}") from None
+    hazards = analysis['hazards']
+    if not quiet:
+        if not analysis['parsed']:
+            print(f"{prefix}warning: rdflib is not installed, so the query could not be parsed: "
+                  f"only its query form was checked.", file=sys.stderr)
+        for hazard in hazards:
+            print(f"{prefix}warning: {hazard['message']}", file=sys.stderr)
+    if strict and hazards:
+        raise CliError(f"{prefix}Not run because of cost warnings ({', '.join(h['code'] for h in hazards)}).")
+
+
+def export_format(name=None, output=None):
+    """
+    Returns the EXPORT_FORMATS key for a format name, or the one matching the extension of the
+    output file (CSV if neither tells).
+
+    Raises:
+    CliError if the format needs a package that is not installed.
+    """
+    if name:
+        selected = FORMAT_NAMES.get(name.lower())
+        if selected is None:
+            raise CliError(f"Unknown format {name!r}; expected one of {', '.join(FORMAT_NAMES)}.")
+    else:
+        selected = _EXTENSION_FORMATS.get(os.path.splitext(output or '')[1].lower(), 'CSV')
+    if selected not in available_formats():
+        raise CliError(f"{selected} output needs the optional 'pyarrow' package (pip install pyarrow).")
+    return selected
+
+
+@contextmanager
+def _output(path):
+    """
+    Yields a binary file for path, or stdout for '-'. Files are written under a temporary name and
+    renamed once complete, so a failed run never leaves a truncated export behind.
+    """
+    if path == '-':
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as handle:
+            yield handle
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _preload(module):
+    """
+    Imports a module on a background thread, so that its import overlaps the wait for the endpoint.
+    """
+    threading.Thread(target=importlib.import_module, args=(module,), daemon=True).start()
+
+
+def _execute_options(args):
+    """
+    Returns the execute_query options given on the command line (those left out keep their defaults).
+    """
+    options = {
+        'use_cache': False if args.no_cache else None,
+        'refresh': args.refresh or None,
+        'paged': args.paged or None,
+        'page_size': args.page_size,
+        'results_format': args.results_format,
+        'timeout': args.timeout,
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
+def _write(export_format, result_set, columns, path):
+    writer, _, _ = EXPORT_FORMATS[export_format]
+    with _output(path) as handle:
+        writer(result_set, columns, handle)
+
+
+def _stream(export_format, endpoint, query, path, options):
+    """
+    Writes the results batch by batch as they arrive (pages with paged=True), without holding
+    them all in memory or caching them. Returns the number of rows written.
+    """
+    options = {name: value for name, value in options.items() if name not in ('use_cache', 'refresh')}
+    rows = 0
+    with _output(path) as handle:
+        for index, batch in enumerate(iter_query_batches(endpoint, query, **options)):
+            if export_format == 'CSV':
+                write_csv(batch, batch.columns, handle, header=index == 0)
+            else:
+                write_ndjson(batch, batch.columns, handle)
+            rows += len(batch)
+    return rows
+
+
+def run_query(args):
+    selected_format = export_format(args.format, args.output)
+    if args.stream and selected_format not in STREAMING_FORMATS:
+        raise CliError(f"--stream writes {' or '.join(STREAMING_FORMATS)} only.")
+    if args.stream and args.incremental:
+        raise CliError("--stream and --incremental cannot be combined.")
+    query, template, values = resolve_query(args.template, args.query_file, args.query, dict(args.param))
+    if args.incremental and not template.is_ranged:
+        raise CliError("--incremental needs a template with {{start}} and {{end}} placeholders.")
+    if not args.no_check:
+        check_query(query, args.strict, args.quiet)
+
+    if selected_format in PANDAS_FORMATS:
+        _preload('pandas')
+    options = _execute_options(args)
+    started = time.perf_counter()
+    try:
+        if args.stream:
+            rows, cached = _stream(selected_format, args.endpoint, query, args.output, options), False
+        else:
+            if args.incremental:
+                result = run_partitioned(args.endpoint, template, start=values.get('start'), end=values.get('end'),
+                                         **options)
+            else:
+                result = execute_query(args.endpoint, query, **options)
+            if not result['success']:
+                print(f"error: {result['error']}", file=sys.stderr)
+                return EXIT_FAILED
+            _write(selected_format, result['data'], result['columns'], args.output)
+            rows, cached = len(result['data']), result['cached']
+    except BrokenPipeError:
+        raise
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    if not args.quiet:
+        print(f"{rows} rows in {time.perf_counter() - started:.2f} s{' (cached)' if cached else ''}", file=sys.stderr)
+    return 0
+
+
+def load_manifest(path, output_dir=None):
+    """
+    Reads a batch manifest (see the module description) and resolves its queries.
+
+    Parameters:
+    - path: The manifest file.
+    - output_dir: Directory for the outputs given as relative paths (the current directory by default).
+
+    Returns:
+    A tuple (jobs, options): job dictionaries for batch_runner.run_batch with 'name',
+    'endpoint' and 'query' plus the 'format' and 'output' of their results, and the
+    execute_query options of the manifest.
+
+    Raises:
+    CliError if the manifest is not valid or one of its queries cannot be built.
+    """
+    try:
+        with open(path, encoding='utf-8') as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError) as e:
+        raise CliError(f"Cannot read the manifest: {e}") from None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get('queries'), list) or not manifest['queries']:
+        raise CliError("The manifest must be an object with a non-empty 'queries' list.")
+    options = manifest.get('options') or {}
+    unknown = sorted(set(options) - set(MANIFEST_OPTIONS))
+    if unknown:
+        raise CliError(f"Unknown manifest option {unknown[0]!r}; expected one of {', '.join(MANIFEST_OPTIONS)}.")
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for index, entry in enumerate(manifest['queries']):
+        sources = [key for key in ('template', 'query_file', 'query') if entry.get(key)]
+        if len(sources) != 1:
+            raise CliError(f"Query {index + 1} of the manifest needs exactly one of 'template', 'query_file' or 'query'.")
+        name = entry.get('name') or (os.path.splitext(os.path.basename(entry['query_file']))[0]
+                                     if 'query_file' in sources else entry.get('template') or f"query{index + 1}")
+        if any(job['name'] == name for job in jobs):
+            raise CliError(f"Two queries of the manifest are named {name!r}.")
+        endpoint = entry.get('endpoint') or manifest.get('endpoint')
+        if not endpoint:
+            raise CliError(f"{name}: No endpoint, in the query or the manifest.")
+        try:
+            query, _, _ = resolve_query(entry.get('template'), entry.get('query_file'), entry.get('query'),
+                                        entry.get('params'), base_dir)
+            selected_format = export_format(entry.get('format') or manifest.get('format'), entry.get('output'))
+        except CliError as e:
+            raise CliError(f"{name}: {e}") from None
+        extension = os.path.splitext(EXPORT_FORMATS[selected_format][1])[1]
+        output = entry.get('output') or _UNSAFE_NAME_PATTERN.sub('_', name).strip('_') + extension
+        jobs.append({'name': name, 'endpoint': endpoint, 'query': query, 'format': selected_format,
+                     'output': os.path.join(output_dir or '', output)})
+    return jobs, options
+
+
+def run_batch_manifest(args):
+    jobs, options = load_manifest(args.manifest, args.output_dir)
+    if not args.no_check:
+        for job in jobs:
+            check_query(job['query'], args.strict, args.quiet, label=job['name'])
+    options = {**options, **_execute_options(args)}
+    if options.get('results_format', 'json') not in RESULTS_FORMATS:
+        raise CliError(f"Unknown results format {options['results_format']!r}.")
+    if any(job['format'] in PANDAS_FORMATS for job in jobs):
+        _preload('pandas')
+
+    jobs_by_name = {job['name']: job for job in jobs}
+    failed = []
+
+    def write(outcome):
+        job = jobs_by_name[outcome['name']]
+        result = outcome['result']
+        try:
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            _write(job['format'], result['data'], result['columns'], job['output'])
+        except Exception as e:
+            failed.append(job['name'])
+            print(f"{job['name']}: error: {e}", file=sys.stderr)
+            return
+        if not args.quiet:
+            print(f"{job['name']}: {len(result['data'])} rows in {outcome['elapsed_time']:.2f} s"
+                  f"{' (cached)' if result['cached'] else ''} -> {job['output']}", file=sys.stderr)
+
+    run_batch_sync(jobs, on_result=write, concurrency=args.concurrency, **options)
+    if failed:
+        print(f"{len(failed)} of {len(jobs)} queries failed: {', '.join(failed)}", file=sys.stderr)
+        return EXIT_FAILED
+    return 0
+
+
+def list_templates(args):
+    for name, query in query_templates.items():
+        if not query.strip():
+            continue
+        template = parameterized_templates.get(name)
+        if template is None:
+            print(name)
+        else:
+            defaults = ' '.join(f"{parameter}={template.defaults.get(parameter, '')}" for parameter in template.parameters)
+            incremental = f" (--incremental by {template.partition})" if template.partition and template.is_ranged else ''
+            print(f"{name}\t{defaults}{incremental}")
+    return 0
+
+
+def _add_execute_arguments(parser):
+    parser.add_argument('--results-format', choices=list(RESULTS_FORMATS), help="Wire format requested from the endpoint (json by default).")
+    parser.add_argument('--paged', action='store_true', help="Fetch SELECT results in concurrent LIMIT/OFFSET windows.")
+    parser.add_argument('--page-size', type=int, help="Rows per window with --paged.")
+    parser.add_argument('--timeout', type=float, help="Seconds to wait for the endpoint.")
+    parser.add_argument('--refresh', action='store_true', help="Re-run the query instead of using cached results.")
+    parser.add_argument('--no-cache', action='store_true', help="Neither read nor write the result cache.")
+    parser.add_argument('--no-check', action='store_true', help="Send queries without parsing them first.")
+    parser.add_argument('--strict', action='store_true', help="Do not run queries with cost warnings.")
+    parser.add_argument('--quiet', action='store_true', help="Only report errors on stderr.")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run SPARQL queries and export their results without the app.")
+    commands = parser.add_subparsers(dest='command_name', required=True)
+
+    query_parser = commands.add_parser('query', help="Run one query and write its results.")
+    query_parser.add_argument('endpoint', help="SPARQL endpoint URL, or local:<directory> (see local_store.py).")
+    source = query_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--template', help="Name of a predefined template (see the templates command).")
+    source.add_argument('--query-file', help="File holding the query.")
+    source.add_argument('--query', help="The query text.")
+    query_parser.add_argument('--param', type=_param, action='append', default=[], metavar='NAME=VALUE',
+                              help="Value of a {{NAME}} placeholder; ISO dates and numbers are typed. Repeatable.")
+    query_parser.add_argument('--format', choices=list(FORMAT_NAMES), help="Output format (by default from the --output extension, else csv).")
+    query_parser.add_argument('--output', default='-', help="Output file, or - for stdout (the default).")
+    query_parser.add_argument('--stream', action='store_true', help="Write csv/ndjson batch by batch as it arrives, without caching; use with --paged for bounded memory.")
+    query_parser.add_argument('--incremental', action='store_true', help="Run a ranged template once per partition, caching closed partitions for good.")
+    _add_execute_arguments(query_parser)
+    query_parser.set_defaults(command=run_query)
+
+    batch_parser = commands.add_parser('batch', help="Run the queries of a JSON manifest concurrently.")
+    batch_parser.add_argument('manifest', help="Manifest file (see the module description of cli.py).")
+    batch_parser.add_argument('--output-dir', help="Directory for relative output paths (the current directory by default).")
+    batch_parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Queries run at the same time per endpoint.")
+    _add_execute_arguments(batch_parser)
+    batch_parser.set_defaults(command=run_batch_manifest)
+
+    templates_parser = commands.add_parser('templates', help="List the predefined templates and their parameters.")
+    templates_parser.set_defaults(command=list_templates)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.command(args)
+    except CliError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_INVALID
+    except BrokenPipeError:
+        # The reader of stdout went away (e.g. `| head`): stop quietly, as other command line tools do
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_FAILED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
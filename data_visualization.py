@@ -1,53 +1,172 @@
+import math
+import time
+import weakref
+
 import pandas as pd
 import plotly.express as px
 import streamlit as st
-from streamlit_extras.dataframe_explorer import dataframe_explorer
+from downsampling import (DEFAULT_POINT_BUDGET, DEFAULT_TOP_N, WEBGL_THRESHOLD, aggregate_top_n, downsample_line,
+                          reduction_note)
+from metrics import default_registry
+from query_executor import execute_query
+from query_rewriting import AGGREGATES, aggregate_query
+from result_set import as_dataframe
+from result_table import DEFAULT_PAGE_SIZE, MAX_LISTED_VALUES, PAGE_SIZES, table_view
+from results_export import download_button
 
-def professional_styled_table(df, page_size=100):
+def _table_filters(view, columns):
     """
-    Applies advanced styling to a DataFrame for a professional look and displays it in the Streamlit app with pagination.
-    
-    Parameters:
-    - df: The DataFrame to display.
-    - page_size: Number of rows to display per page.
+    Renders a filter input for each column the user picks and returns the TableView filters.
     """
-    # Determine the total number of pages
-    total_pages = len(df) // page_size + (1 if len(df) % page_size > 0 else 0)
-    
-    # Initialize or update the current page number in the session state
-    if 'current_page' not in st.session_state:
-        st.session_state['current_page'] = 1  # Start with the first page
-    
-    # Display current page number and total pages
-    st.write(f"Page {st.session_state['current_page']} of {total_pages}")
-    
-    # Pagination controls
-    col1, col2, col3 = st.columns([1,1,1])
-    with col1:
-        if st.button('Previous'):
-            if st.session_state['current_page'] > 1:
-                st.session_state['current_page'] -= 1
-    with col3:
-        if st.button('Next'):
-            if st.session_state['current_page'] < total_pages:
-                st.session_state['current_page'] += 1
-    
-    # Determine the portion of the DataFrame to display
-    start_idx = (st.session_state['current_page'] - 1) * page_size
-    end_idx = start_idx + page_size
-    df_subset = df.iloc[start_idx:end_idx]
-    
-    # Display the styled DataFrame (subset)
-    st.dataframe(df_subset)  # You may apply styling here as needed
+    filters = {}
+    with st.expander("Filters"):
+        for name in st.multiselect("Filter on columns:", columns, key="table_filter_columns"):
+            column = view.result_set.column(name)
+            key = "table_filter_" + name
+            if column.kind == 'categorical' and len(column.dictionary) <= MAX_LISTED_VALUES:
+                chosen = st.multiselect(f"{name} is one of:", view.distinct_values(name), key=key)
+                if chosen:
+                    filters[name] = {'values': chosen}
+            elif column.kind == 'categorical':
+                text = st.text_input(f"{name} contains:", key=key)
+                if text:
+                    filters[name] = {'contains': text}
+            elif column.kind == 'boolean':
+                chosen = st.multiselect(f"{name} is:", [True, False], key=key)
+                if chosen:
+                    filters[name] = {'values': chosen}
+            else:
+                low_column, high_column = st.columns(2)
+                if column.kind == 'datetime':
+                    low = low_column.date_input(f"{name} from:", value=None, key=key + "_min")
+                    high = high_column.date_input(f"{name} to (inclusive):", value=None, key=key + "_max")
+                    if high is not None:
+                        high = pd.Timestamp(high) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+                else:
+                    low = low_column.number_input(f"{name} from:", value=None, key=key + "_min")
+                    high = high_column.number_input(f"{name} to:", value=None, key=key + "_max")
+                if low is not None or high is not None:
+                    filters[name] = {'min': low, 'max': high}
+    return filters
+
+def show_table(data, columns):
+    """
+    Displays the results as a paged table. Search, filters and sorting run on the result columns
+    (see result_table.TableView) and only the rows of the visible page are sent to the browser.
+    """
+    view = table_view(data, columns)
+    search = st.text_input("Search:", key="table_search", help="Keeps the rows where any text or IRI column contains this text, ignoring case.")
+    filters = _table_filters(view, columns)
+    sort_column, order_column, size_column = st.columns([2, 1, 1])
+    sort = sort_column.selectbox("Sort by:", [None] + list(columns), key="table_sort",
+                                 format_func=lambda name: "(result order)" if name is None else name)
+    descending = order_column.radio("Order:", ["Ascending", "Descending"], horizontal=True, key="table_order") == "Descending"
+    page_size = size_column.selectbox("Rows per page:", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key="table_page_size")
+
+    start = time.perf_counter()
+    rows = view.rows(filters=filters, search=search, sort=sort, descending=descending)
+    pages = max(1, math.ceil(len(rows) / page_size))
+    if st.session_state.get('table_page', 1) > pages:
+        st.session_state['table_page'] = pages  # The filters left fewer pages
+    page = st.number_input(f"Page (of {pages}):", min_value=1, max_value=pages, step=1, key="table_page")
+    frame = view.page(rows, page, page_size)
+    elapsed = time.perf_counter() - start
+
+    st.dataframe(frame, use_container_width=True)
+    first = (page - 1) * page_size + 1 if len(rows) else 0
+    shown = f"Rows {first}-{first + len(frame) - 1 if len(rows) else 0} of {len(rows)}"
+    if len(rows) < view.row_count:
+        shown += f" (filtered from {view.row_count})"
+    st.caption(f"{shown}, selected in {elapsed * 1000:.0f} ms.")
+
+def _rendering_options(viz_type, point_budget):
+    """
+    Lets the user change the point budget (and, for line charts, the downsampling method).
+    """
+    with st.expander("Rendering options"):
+        point_budget = st.number_input("Maximum points drawn:", min_value=100, value=point_budget, step=1000,
+                                       key="point_budget_" + viz_type,
+                                       help="Larger results are downsampled or aggregated before they are sent to the browser.")
+        method = 'lttb'
+        if viz_type == "Line Chart":
+            method = st.radio("Downsampling method:", ['lttb', 'minmax'], horizontal=True, key="downsampling_method",
+                              format_func={'lttb': "Largest triangle (shape)", 'minmax': "Min/max (extremes)"}.get)
+    return int(point_budget), method
 
-def visualize_data(data, columns, viz_type):
-    df = pd.DataFrame(data, columns=columns)
+def _grouped_frame(df, names_col, values_col, point_budget, endpoint, query, viz_type):
+    """
+    Returns (DataFrame, values column, note) for a bar or pie chart.
+
+    With an endpoint and query available the user can have the grouping done by the endpoint:
+    the query is rewritten with GROUP BY and COUNT/SUM/AVG, and only one row per group is fetched
+    (and cached like any other query). Otherwise large results are aggregated locally.
+    """
+    if endpoint and query and st.checkbox("Aggregate on the endpoint", key="pushdown_" + viz_type,
+                                          help="Rewrites the query with GROUP BY so only one row per group is downloaded."):
+        aggregate = st.selectbox("Aggregate:", AGGREGATES, index=1, key="aggregate_" + viz_type)
+        try:
+            rewritten, alias = aggregate_query(query, names_col, values_col, aggregate)
+        except ValueError as e:
+            st.warning(f"The query cannot be aggregated on the endpoint: {e}")
+        else:
+            result = execute_query(endpoint, rewritten)
+            if result['success']:
+                grouped = as_dataframe(result['data'], result['columns'])
+                note = f"{aggregate} of {values_col} per {names_col}, computed by the endpoint"
+                if result['cached']:
+                    note += ", from the cache"
+                if len(grouped) > point_budget:
+                    grouped, reduced = aggregate_top_n(grouped, names_col, alias, min(DEFAULT_TOP_N, point_budget))
+                    note = f"{note}; {reduced}"
+                return grouped, alias, note
+            st.error(f"The aggregate query failed: {result['error']}")
+
+    if len(df) > point_budget:
+        grouped, reduced = aggregate_top_n(df, names_col, values_col, min(DEFAULT_TOP_N, point_budget))
+        return grouped, values_col, reduced or "summed per category"
+    return df, values_col, None
+
+def _chart_frame(data, columns, used, trace_id=None):
+    """
+    Returns the DataFrame of the columns a chart uses.
+
+    Compacted result sets do not keep their DataFrame (see ResultSet.to_dataframe), so the frame
+    of the shown result set is kept in the session instead of being expanded again on every rerun.
+    Only the chart's columns are expanded, and a session keeps one such frame. Building it is
+    timed as the 'dataframe' stage of the query's trace.
+    """
+    used = list(dict.fromkeys(used))
+    cached = st.session_state.get('chart_frame')
+    if cached is not None and cached[0]() is data and cached[1] == used:
+        return cached[2]
+    with default_registry.span(trace_id, 'dataframe'):
+        frame = as_dataframe(data, columns, usecols=used)
+    try:
+        st.session_state['chart_frame'] = (weakref.ref(data), used, frame)
+    except TypeError:  # Rows held as a list cannot be referenced weakly; they are cheap to convert again
+        pass
+    return frame
+
+def visualize_data(data, columns, viz_type, point_budget=DEFAULT_POINT_BUDGET, endpoint=None, query=None,
+                   trace_id=None):
+    """
+    Renders the query results as a table or chart.
+
+    Charts never send more than point_budget points to the browser: line charts are downsampled
+    (LTTB or min/max) and drawn with WebGL, bar and pie charts of larger results are aggregated
+    per category with the smallest categories folded into "Other". A caption says when the view
+    is reduced. When the endpoint and query that produced the results are given, bar and pie
+    charts can be aggregated by the endpoint instead. With a trace_id, building the chart's
+    DataFrame and rendering are timed as the 'dataframe' and 'render' stages of that query.
+    """
+    # The table pages through the result columns; charts need a DataFrame of their axis columns
+    if viz_type == "Table":
+        with default_registry.span(trace_id, 'render'):
+            show_table(data, columns)
+        return
     
     # Generate the appropriate plot based on the visualization type and selected axes
-    if viz_type == "Table":
-        filtered_df = dataframe_explorer(df, case=False)
-        st.dataframe(filtered_df, use_container_width=True)
-    elif viz_type in ["Line Chart", "Bar Chart"]:
+    if viz_type in ["Line Chart", "Bar Chart"]:
         x_axis = st.selectbox("Choose the X-axis variable:", columns, key="x_axis_" + viz_type)
         y_axis = st.selectbox("Choose the Y-axis variable:", columns, index=1 if len(columns) > 1 else 0, key="y_axis_" + viz_type)
         
@@ -55,26 +174,39 @@ def visualize_data(data, columns, viz_type):
             color = st.color_picker('Pick a color', '#00f900')  # Default to neon green
         else:
             color = None
+        point_budget, method = _rendering_options(viz_type, point_budget)
+        df = _chart_frame(data, columns, [x_axis, y_axis], trace_id)
         
-        if viz_type == "Line Chart":
-            fig = px.line(df, x=x_axis, y=y_axis, line_shape='linear', color_discrete_sequence=[color] if color else None)
-            st.plotly_chart(fig)
-        elif viz_type == "Bar Chart":
-            fig = px.bar(df, x=x_axis, y=y_axis, color_discrete_sequence=[color] if color else None)
-            st.plotly_chart(fig)
+        with default_registry.span(trace_id, 'render'):
+            if viz_type == "Line Chart":
+                plot_df, reduced = downsample_line(df, x_axis, y_axis, point_budget, method)
+                fig = px.line(plot_df, x=x_axis, y=y_axis, line_shape='linear', color_discrete_sequence=[color] if color else None,
+                              render_mode='webgl' if len(plot_df) > WEBGL_THRESHOLD else 'auto')
+                st.plotly_chart(fig)
+            elif viz_type == "Bar Chart":
+                plot_df, y_values, reduced = _grouped_frame(df, x_axis, y_axis, point_budget, endpoint, query, viz_type)
+                fig = px.bar(plot_df, x=x_axis, y=y_values, color_discrete_sequence=[color] if color else None)
+                st.plotly_chart(fig)
+            if reduced:
+                st.caption(reduction_note(len(plot_df), len(df), reduced))
     elif viz_type == "Pie Chart":
         x_axis = st.selectbox("Choose the segment names column:", columns, key="x_axis_pie")
         # Automatically use the second column as values if available, for the pie chart
         if len(columns) > 1:
             values_col = columns[1]  # Assumes the second column is appropriate for values
-            fig = px.pie(df, names=x_axis, values=values_col)
-            st.plotly_chart(fig)
+            point_budget, _ = _rendering_options(viz_type, point_budget)
+            df = _chart_frame(data, columns, [x_axis, values_col], trace_id)
+            with default_registry.span(trace_id, 'render'):
+                plot_df, values_col, reduced = _grouped_frame(df, x_axis, values_col, point_budget, endpoint, query, viz_type)
+                fig = px.pie(plot_df, names=x_axis, values=values_col)
+                st.plotly_chart(fig)
+                if reduced:
+                    st.caption(reduction_note(len(plot_df), len(df), reduced))
         else:
             st.warning("Not enough columns for a pie chart. Please select a different visualization type.")
     else:
         st.warning("Unsupported visualization type selected.")
 
 def export_to_csv(data, columns):
-    df = pd.DataFrame(data, columns=columns)
-    csv = df.to_csv(index=False)
-    st.download_button(label="Download CSV", data=csv, file_name="query_results.csv", mime='text/csv')
+    # Kept for existing callers; the export layer lives in results_export
+    download_button(data, columns, 'CSV', label="Download CSV")
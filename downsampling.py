@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_POINT_BUDGET = 5000  # Points sent to the browser per chart
+DEFAULT_TOP_N = 30  # Categories shown individually in bar and pie charts; the rest become "Other"
+WEBGL_THRESHOLD = 1000  # Above this many points, scatter and line traces are drawn with WebGL
+OTHER_LABEL = 'Other'
+
+
+def _numeric_axis(series):
+    """
+    Returns a float array for a numeric or datetime column, or None for anything else.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype='datetime64[ns]').astype('int64').astype(float)
+        values[series.isna().to_numpy()] = np.nan
+        return values
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.to_numpy(dtype=float, na_value=np.nan)
+    return None
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Selects threshold points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are always kept; from every bucket in between the point forming
+    the largest triangle with the previously kept point and the next bucket's mean is chosen,
+    which preserves peaks and the overall shape of the line.
+
+    Parameters:
+    - x, y: Float arrays of equal length, x in drawing order.
+    - threshold: Number of points to keep (at least 3).
+
+    Returns:
+    A sorted array of row positions.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)  # threshold - 2 buckets between the end points
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_x = x[stop:edges[bucket + 2]].mean()
+            next_y = y[stop:edges[bucket + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        areas = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """
+    Keeps the minimum and maximum of threshold // 2 equal buckets, which never hides a spike.
+
+    Returns:
+    A sorted array of row positions.
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    buckets = pd.Series(y).groupby(np.arange(n) * max(1, threshold // 2) // n)
+    return np.unique(np.concatenate([buckets.idxmin().to_numpy(), buckets.idxmax().to_numpy()]))
+
+
+def downsample_line(df, x_col, y_col, point_budget=DEFAULT_POINT_BUDGET, method='lttb'):
+    """
+    Reduces a DataFrame to at most point_budget rows for a line chart of y_col against x_col.
+
+    Numeric and datetime x columns are sorted first; any other x column is taken in row order.
+    A y column that is not numeric is thinned by taking every k-th row.
+
+    Parameters:
+    - df: The DataFrame to plot.
+    - x_col, y_col: The axis columns.
+    - point_budget: Maximum number of rows returned.
+    - method: 'lttb' (shape preserving) or 'minmax' (keeps every extreme).
+
+    Returns:
+    A (DataFrame, description) tuple; description is None when no rows were dropped.
+    """
+    if len(df) <= point_budget:
+        return df, None
+    y = _numeric_axis(df[y_col])
+    if y is None:
+        step = -(-len(df) // point_budget)
+        return df.iloc[::step], f"every {step}th row"
+
+    x = _numeric_axis(df[x_col])
+    if x is not None and not df[x_col].is_monotonic_increasing:
+        order = np.argsort(x, kind='stable')
+        df, x, y = df.iloc[order], x[order], y[order]
+    valid = ~np.isnan(y) & (~np.isnan(x) if x is not None else True)
+    positions = np.flatnonzero(valid)
+    x = x[positions] if x is not None else positions.astype(float)
+    y = y[positions]
+    if method == 'minmax':
+        keep = minmax_indices(y, point_budget)
+        description = "min/max per bucket"
+    else:
+        keep = lttb_indices(x, y, point_budget)
+        description = "LTTB downsampled"
+    return df.iloc[positions[keep]], description
+
+
+def aggregate_top_n(df, names_col, values_col, top_n=DEFAULT_TOP_N):
+    """
+    Sums values_col per distinct names_col value and folds everything past the top_n largest
+    sums into a single "Other" row, as a bar or pie chart would display them anyway.
+
+    A values column that is not numeric is replaced by the number of rows per name.
+
+    Returns:
+    A (DataFrame, description) tuple; description is None when the chart shows exactly what the
+    full data would.
+    """
+    if names_col == values_col:
+        # Nothing to aggregate a column against itself; draw a sample instead
+        return df.iloc[sample_positions(len(df), top_n)], "random sample"
+    values = _numeric_axis(df[values_col])
+    if values is None:
+        totals = df.groupby(df[names_col].astype(object), sort=False, dropna=False).size().rename(values_col)
+        counted = True
+    else:
+        totals = pd.Series(values, index=df.index).groupby(df[names_col].astype(object), sort=False, dropna=False).sum().rename(values_col)
+        counted = False
+    description = "row counts per category" if counted else None
+    folded = len(totals) > top_n
+    if folded:
+        ranked = totals.sort_values(ascending=False, kind='stable')
+        totals = pd.concat([ranked.iloc[:top_n], pd.Series({OTHER_LABEL: ranked.iloc[top_n:].sum()}, name=values_col)])
+        note = f"top {top_n} of {len(ranked):,} categories, the rest as \"{OTHER_LABEL}\""
+        description = f"{description}, {note}" if description else note
+    aggregated = totals.rename_axis(names_col).reset_index()
+    if folded:
+        aggregated[names_col] = aggregated[names_col].astype(str)  # One axis type for the names and "Other"
+    return aggregated, description
+
+
+def sample_positions(n, point_budget=DEFAULT_POINT_BUDGET, seed=0):
+    """
+    Returns sorted row positions of a uniform random sample of at most point_budget rows.
+    """
+    if n <= point_budget:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, point_budget, replace=False))
+
+
+def reduction_note(shown, total, description):
+    """
+    Formats the caption shown under a chart whose data was reduced.
+    """
+    return f"Showing {shown:,} of {total:,} points ({description})."
@@ -0,0 +1,175 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SPARQL_JSON = 'application/sparql-results+json'
+
+DEFAULT_POOL_SIZE = 8  # Kept-alive connections per endpoint; callers running more queries at once ask for more
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # Base delay in seconds, doubled on every retry
+MAX_BACKOFF = 30
+MAX_RETRY_AFTER = 120  # Longer Retry-After requests are reported instead of waited out
+DEFAULT_TIMEOUT = (10, 600)  # Connect and read timeouts in seconds
+MAX_GET_URL_LENGTH = 2048  # Longer queries are sent as a form-encoded POST
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class TransportError(Exception):
+    """Raised when the endpoint answers with an error status that is not (or no longer) retried."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _retry_after(response):
+    """
+    Returns the delay in seconds requested by a Retry-After header, or None.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SparqlTransport:
+    """
+    Reusable HTTP client for one SPARQL endpoint.
+
+    Connections are pooled and kept alive between queries, responses are negotiated with
+    gzip/deflate compression, short queries go out as GET and long ones as POST, and transient
+    failures (connection errors, connect timeouts, 429/502/503/504) are retried with jittered exponential
+    backoff, honouring Retry-After.
+    """
+
+    def __init__(self, endpoint, pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+        self.endpoint = endpoint
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.pool_size = 0
+        self.session = requests.Session()
+        self.session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size):
+        """
+        Grows the connection pool to at least pool_size connections. Connections beyond the pool
+        size are closed after use instead of being kept alive, so callers that run several
+        requests at once size the pool for them.
+        """
+        if pool_size <= self.pool_size:
+            return
+        # Requests in flight finish on the previous adapter; new ones use the larger pool
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool_size = pool_size
+
+    def _delay(self, attempt):
+        # "Full jitter": spread retries uniformly so parallel clients do not retry in lockstep
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    def _request(self, query, accept, timeout):
+        encoded = urlencode({'query': query})
+        headers = {'Accept': accept}
+        if len(self.endpoint) + 1 + len(encoded) <= MAX_GET_URL_LENGTH:
+            separator = '&' if '?' in self.endpoint else '?'
+            return self.session.get(f"{self.endpoint}{separator}{encoded}", headers=headers,
+                                    stream=True, timeout=timeout)
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return self.session.post(self.endpoint, data=encoded, headers=headers, stream=True, timeout=timeout)
+
+    def query(self, query, accept=SPARQL_JSON, timeout=None):
+        """
+        Sends a query and returns the streaming response once the endpoint has accepted it.
+
+        The body has not been read yet: read it from response.raw (which decompresses
+        transparently) and hand the response back to release() when done.
+
+        Parameters:
+        - query: The SPARQL query as a string.
+        - accept: The Accept header, i.e. the requested results format(s).
+        - timeout: Optional (connect, read) timeout overriding the transport default.
+
+        Returns:
+        A requests.Response with a 2xx status.
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            try:
+                response = self._request(query, accept, timeout)
+            except requests.ConnectionError as e:
+                # Includes connect timeouts; a read timeout means the query itself is slow and is not retried
+                if attempt >= self.retries:
+                    raise
+                delay = self._delay(attempt)
+                logging.warning(f"Request to {self.endpoint} failed ({e}); retrying in {delay:.1f} s")
+            else:
+                if response.status_code < 400:
+                    response.raw.decode_content = True
+                    return response
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = self._delay(attempt)
+                retryable = response.status_code in RETRY_STATUSES and delay <= MAX_RETRY_AFTER
+                if attempt >= self.retries or not retryable:
+                    message = response.text[:1000].strip()
+                    response.close()
+                    raise TransportError(f"HTTP {response.status_code} from {self.endpoint}: {message}",
+                                         status=response.status_code)
+                self.release(response)
+                logging.warning(f"{self.endpoint} answered HTTP {response.status_code}; retrying in {delay:.1f} s")
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def release(response):
+        """
+        Finishes reading a response so its connection goes back to the pool for reuse.
+        """
+        try:
+            response.raw.drain_conn()
+        except Exception:
+            pass
+        response.close()
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(endpoint, pool_size=None):
+    """
+    Returns the shared transport for an endpoint, creating it on first use.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - pool_size: Connections the caller may use at once; the pool grows to it if it is smaller.
+    """
+    endpoint = endpoint.strip()
+    with _transports_lock:
+        transport = _transports.get(endpoint)
+        if transport is None:
+            transport = _transports[endpoint] = SparqlTransport(endpoint)
+        if pool_size is not None:
+            transport.ensure_pool_size(pool_size)
+        return transport
@@ -0,0 +1,241 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from query_cache import cache_key
+from query_executor import DEFAULT_MAX_WORKERS, QueryCancelled, execute_query, reserve_connections
+
+DEFAULT_JOB_WORKERS = 8  # Queries running at the same time, across all sessions
+DEFAULT_JOB_TIMEOUT = 600  # Seconds before a running query is abandoned
+DEFAULT_JOB_HISTORY = 100  # Finished jobs kept for polling
+POLL_INTERVAL = 0.5  # Seconds between status refreshes in the app
+
+# Job states; the last four are final
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT = 'queued', 'running', 'done', 'failed', 'cancelled', 'timed out'
+FINAL_STATES = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+def job_key(endpoint, query, variant='', results_format='json'):
+    """
+    Identity of a query for single flight and for sharing its results (see result_store.py).
+    """
+    return cache_key(endpoint, query, f"{variant}|{results_format}")
+
+
+class JobProgress:
+    """
+    Progress and cancellation of one running query, shared with the threads fetching it.
+
+    execute_query reports the bytes read and the rows of every page to it, and calls check()
+    before each request and each read of a response body, which raises QueryCancelled once the
+    job has been cancelled or has run past its deadline.
+    """
+
+    def __init__(self, deadline=None):
+        self.rows = 0
+        self.bytes = 0
+        self.deadline = deadline  # time.monotonic() value, or None
+        self.timed_out = False
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+
+    def add_rows(self, count):
+        with self._lock:
+            self.rows += count
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise QueryCancelled("The query was cancelled.")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.timed_out = True
+            raise QueryCancelled("The query timed out.")
+
+
+class Job:
+    """
+    A query submitted to a JobManager. Read its state through JobManager.status().
+    """
+
+    def __init__(self, key, endpoint, query, timeout):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.endpoint = endpoint
+        self.query = query
+        self.timeout = timeout
+        self.state = QUEUED
+        self.submitted_at = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.subscribers = 1  # Submissions coalesced into this job that have not cancelled it
+        self.progress = JobProgress()
+        self.done = threading.Event()
+
+
+class JobManager:
+    """
+    Runs queries on a thread pool so the Streamlit script never waits on an endpoint: submit()
+    returns a job id at once and the app polls status() until the job is final.
+
+    Identical queries submitted while one is queued or running are coalesced into that job
+    (single flight), so repeated clicks and other sessions asking the same question share one
+    request. Queries are identified like cache entries (endpoint and canonical query, see
+    query_cache.cache_key), plus a variant for results that differ beyond the query text.
+
+    Parameters:
+    - max_workers: Jobs running at the same time.
+    - history: Finished jobs kept for status().
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, history=DEFAULT_JOB_HISTORY):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='query-job')
+        self.max_workers = max_workers
+        self.history = history
+        self._jobs = OrderedDict()
+        self._in_flight = {}  # Single-flight key -> job
+        self._lock = threading.Lock()
+
+    def submit(self, endpoint, query, timeout=DEFAULT_JOB_TIMEOUT, runner=None, variant='', **execute_options):
+        """
+        Queues a query, or joins an identical one already queued or running.
+
+        Parameters:
+        - endpoint, query: As for execute_query.
+        - timeout: Seconds the query may run once started; it is then abandoned as timed out.
+        - runner: Function called as runner(endpoint, query, progress=..., timeout=..., **options)
+          instead of execute_query, e.g. for partitioned runs.
+        - variant: Distinguishes jobs with the same query text whose results differ (e.g. a
+          different runner); the results format is taken into account automatically.
+        - execute_options: Passed on to the runner.
+
+        Returns:
+        The job id.
+        """
+        key = job_key(endpoint, query, variant, execute_options.get('results_format', 'json'))
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                return job.id
+            job = Job(key, endpoint, query, timeout)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            self._trim()
+        # Every worker may be running a query against this endpoint
+        reserve_connections(endpoint, self.max_workers, paged=execute_options.get('paged', False),
+                            max_workers=execute_options.get('max_workers', DEFAULT_MAX_WORKERS))
+        self.pool.submit(self._run, job, runner or execute_query, execute_options)
+        return job.id
+
+    def _run(self, job, runner, execute_options):
+        job.started = time.perf_counter()
+        job.progress.deadline = time.monotonic() + job.timeout if job.timeout else None
+        try:
+            if job.progress.cancelled.is_set():
+                raise QueryCancelled("The query was cancelled.")
+            job.state = RUNNING
+            result = runner(job.endpoint, job.query, progress=job.progress, timeout=job.timeout, **execute_options)
+        except Exception as e:
+            result = {'success': False, 'columns': [], 'data': [], 'error': str(e),
+                      'execution_time': time.perf_counter() - job.started, 'cached': False}
+        with self._lock:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            job.result = result
+            job.finished = time.perf_counter()
+            if job.progress.timed_out:
+                job.state = TIMED_OUT
+                job.result['error'] = f"The query timed out after {job.timeout} seconds."
+            elif job.progress.cancelled.is_set():
+                job.state = CANCELLED
+            else:
+                job.state = DONE if result['success'] else FAILED
+        job.done.set()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINAL_STATES]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def cancel(self, job_id):
+        """
+        Withdraws one submission of a job. The query itself is stopped once every submission
+        coalesced into it has been withdrawn: a queued job never starts, a running one stops
+        at its next read from the endpoint (and its connection is closed). From then on the job
+        no longer takes part in single flight, so submitting the same query again (e.g. a
+        re-click of Run) starts a new job instead of joining the cancelled one.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state in FINAL_STATES:
+                return
+            job.subscribers -= 1
+            if job.subscribers <= 0:
+                job.progress.cancelled.set()
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+
+    def release_result(self, job_id):
+        """
+        Lets go of the data of a finished job once it has been handed over (e.g. to
+        result_store), so that the job history does not keep results alive after the store
+        spills or drops them. The job's result then has 'data' None; sessions collecting it
+        later find the results under the job's key instead.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state in FINAL_STATES and job.result is not None:
+                job.result = dict(job.result, data=None)
+
+    def wait(self, job_id, timeout=None):
+        """
+        Blocks until a job is final (or timeout seconds have passed) and returns its status.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return self.status(job_id)
+
+    def status(self, job_id):
+        """
+        Returns a snapshot of a job, or None for an unknown (or expired) id.
+
+        Returns:
+        A dictionary with 'id', 'key' (see job_key), 'endpoint', 'query', 'state', 'rows' and 'bytes' received so far
+        (rows are counted per page), 'elapsed' seconds since the job started, 'subscribers' and,
+        once final, 'result': the execute_query result dictionary.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            end = job.finished or time.perf_counter()
+            return {
+                'id': job.id,
+                'key': job.key,
+                'endpoint': job.endpoint,
+                'query': job.query,
+                'state': job.state,
+                'rows': job.progress.rows,
+                'bytes': job.progress.bytes,
+                'elapsed': end - job.started if job.started else 0.0,
+                'subscribers': job.subscribers,
+                'result': job.result if job.state in FINAL_STATES else None,
+            }
+
+    def active_jobs(self):
+        """
+        Returns the status of every queued or running job.
+        """
+        with self._lock:
+            job_ids = [job_id for job_id, job in self._jobs.items() if job.state not in FINAL_STATES]
+        return [status for status in map(self.status, job_ids) if status is not None]
+
+
+default_manager = JobManager()
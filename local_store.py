@@ -0,0 +1,612 @@
+"""
+Embedded SPARQL engine over local RDF dumps.
+
+A LocalStore is a directory holding a term dictionary and the triples as term ids, sorted three
+ways (SPO, POS and OSP) so every triple pattern is answered by a binary search on one index.
+The files are memory-mapped when a store is opened, so reopening a large store is immediate and
+only the pages a query touches are read. SPARQL queries are evaluated by rdflib's query engine,
+which asks the store for triple patterns.
+
+execute_query runs against a store when the endpoint is given as 'local:<directory>'. Dumps are
+loaded from the command line or the app:
+
+    python local_store.py data/store dumps/notices.nt.gz dumps/extra.ttl --workers 8
+"""
+import argparse
+import datetime
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from query_analysis import prepare_query
+from results_parser import ColumnBuffers
+
+LOCAL_SCHEME = 'local:'
+FORMAT_VERSION = 1
+# Index name -> positions of subject (0), predicate (1) and object (2) in its sort order
+INDEX_ORDERS = {'spo': (0, 1, 2), 'pos': (1, 2, 0), 'osp': (2, 0, 1)}
+DEFAULT_LOAD_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_CHUNK_LINES = 50000  # Lines of N-Triples parsed per worker task
+TERM_CACHE_SIZE = 1 << 17  # Decoded terms kept per store
+# Dumps parsed line by line (in parallel) and dumps handed to rdflib's parsers
+LINE_FORMATS = {'.nt': 'nt', '.nq': 'nquads'}
+RDFLIB_FORMATS = {'.ttl': 'turtle'}
+
+_IRI = r'<[^>]*>'
+_BNODE = r'_:(?:[^\s.<>"]|\.(?=[^\s.<>"]))+'
+_LITERAL = r'"(?:[^"\\]|\\.)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*|\^\^<[^>]*>)?'
+_STATEMENT_PATTERN = re.compile(
+    rf'\s*({_IRI}|{_BNODE})\s*({_IRI})\s*({_IRI}|{_BNODE}|{_LITERAL})\s*(?:(?:{_IRI}|{_BNODE})\s*)?\.\s*(?:#.*)?$'
+)
+_LITERAL_PATTERN = re.compile(r'"((?:[^"\\]|\\.)*)"(?:@([A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^<([^>]*)>)?', re.DOTALL)
+_ESCAPE_PATTERN = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+class LoadError(ValueError):
+    """Raised when a dump cannot be parsed."""
+
+
+def _require_rdflib():
+    try:
+        import rdflib
+    except ImportError:
+        raise ImportError("The local engine needs the 'rdflib' package (pip install rdflib).")
+    return rdflib
+
+
+def is_local_endpoint(endpoint):
+    return endpoint.strip().startswith(LOCAL_SCHEME)
+
+
+def _unescape(text):
+    def _replace(match):
+        code = match.group(1) or match.group(2)
+        return chr(int(code, 16)) if code else _ESCAPES.get(match.group(3), match.group(0))
+    return _ESCAPE_PATTERN.sub(_replace, text) if '\\' in text else text
+
+
+def format_term(term):
+    """
+    Returns the canonical N-Triples text of an rdflib term, the form stored in the dictionary.
+    """
+    rdflib = _require_rdflib()
+    if isinstance(term, rdflib.URIRef):
+        return f"<{term}>"
+    if isinstance(term, rdflib.BNode):
+        return f"_:{term}"
+    value = str(term).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    if term.language:
+        return f'"{value}"@{term.language}'
+    if term.datatype:
+        return f'"{value}"^^<{term.datatype}>'
+    return f'"{value}"'
+
+
+def parse_term(text):
+    """
+    Returns the rdflib term for an N-Triples term.
+    """
+    rdflib = _require_rdflib()
+    if text[0] == '<':
+        return rdflib.URIRef(_unescape(text[1:-1]))
+    if text[0] == '_':
+        return rdflib.BNode(text[2:])
+    match = _LITERAL_PATTERN.fullmatch(text)
+    if match is None:
+        raise LoadError(f"Not an N-Triples term: {text[:80]}")
+    lexical, language, datatype = match.groups()
+    return rdflib.Literal(_unescape(lexical), lang=language,
+                          datatype=rdflib.URIRef(datatype) if datatype else None)
+
+
+def _canonical(text, scope):
+    """
+    Canonical dictionary text of a term as written in a dump. Literals go through rdflib so that
+    equal values written differently ("01" and "1" as xsd:integer) share one id, as they would in
+    query constants. Blank node labels are prefixed with the scope of their file, since labels are
+    only meaningful within one document.
+    """
+    if text[0] == '_':
+        return f"_:{scope}{text[2:]}"
+    if text[0] == '<':
+        return text if '\\' not in text else f"<{_unescape(text[1:-1])}>"
+    return format_term(parse_term(text))
+
+
+def _parse_lines(lines, first_line, scope):
+    """
+    Parses a chunk of N-Triples/N-Quads lines (the graph of a quad is ignored).
+
+    Returns:
+    A tuple (terms, triples): the canonical text of the distinct terms of the chunk, and an
+    (n, 3) array of indices into terms.
+    """
+    local_ids = {}
+    rows = []
+    for offset, line in enumerate(lines):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        match = _STATEMENT_PATTERN.match(line)
+        if match is None:
+            raise LoadError(f"Line {first_line + offset}: not an N-Triples statement: {line[:80]}")
+        row = []
+        for text in match.group(1, 2, 3):
+            term_id = local_ids.get(text)
+            if term_id is None:
+                term_id = local_ids[text] = len(local_ids)
+            row.append(term_id)
+        rows.append(row)
+    terms = [_canonical(text, scope) for text in local_ids]
+    return terms, np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+
+def _encode_graph(triples, scope):
+    """
+    Like _parse_lines, for rdflib (subject, predicate, object) tuples.
+    """
+    rdflib = _require_rdflib()
+    local_ids = {}
+    rows = []
+    for triple in triples:
+        row = []
+        for term in triple:
+            text = f"_:{scope}{term}" if isinstance(term, rdflib.BNode) else format_term(term)
+            term_id = local_ids.get(text)
+            if term_id is None:
+                term_id = local_ids[text] = len(local_ids)
+            row.append(term_id)
+        rows.append(row)
+    return list(local_ids), np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+
+def dump_format(path):
+    """
+    Returns the format of a dump from its extension ('nt', 'nquads' or 'turtle'), ignoring '.gz'.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension in LINE_FORMATS:
+        return LINE_FORMATS[extension]
+    if extension in RDFLIB_FORMATS:
+        return RDFLIB_FORMATS[extension]
+    raise LoadError(f"Unsupported dump {path!r}; expected one of "
+                    f"{', '.join(sorted(LINE_FORMATS) + sorted(RDFLIB_FORMATS))} (optionally .gz).")
+
+
+def _open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _parsed_chunks(pool, path, scope, chunk_lines, max_workers):
+    """
+    Yields (terms, triples) chunks of a dump in file order. Line-based dumps are read lazily and
+    parsed by the worker pool, with a bounded number of chunks in flight.
+    """
+    if dump_format(path) == 'turtle':
+        graph = _require_rdflib().Graph()
+        with _open_dump(path) as handle:
+            graph.parse(handle, format='turtle')
+        triples = list(graph)
+        for start in range(0, len(triples), chunk_lines):
+            yield _encode_graph(triples[start:start + chunk_lines], scope)
+        return
+
+    pending = deque()
+    with _open_dump(path) as handle:
+        line_number = 1
+        while True:
+            lines = [line for _, line in zip(range(chunk_lines), handle)]
+            if not lines:
+                break
+            pending.append(pool.submit(_parse_lines, lines, line_number, scope))
+            line_number += len(lines)
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _mapped(path):
+    """
+    Memory-maps a .npy file as a plain read-only ndarray (np.memmap adds overhead to every slice).
+    """
+    return np.load(path, mmap_mode='r').view(np.ndarray)
+
+
+def _write_array(path, array):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as handle:
+        np.save(handle, array)
+    return temporary
+
+
+class LocalStore:
+    """
+    A persistent triple store in a directory.
+
+    Files:
+    - manifest.json: format version, revision (incremented by every load) and counts.
+    - terms.bin, terms_offsets.npy: the term dictionary; term i is the canonical N-Triples text
+      terms.bin[offsets[i]:offsets[i + 1]].
+    - terms_sorted.npy: term ids in byte order of their text, to look terms up by binary search.
+    - spo.npy, pos.npy, osp.npy: the distinct triples as term ids, shape (3, n), each sorted by
+      its own key order.
+
+    Parameters:
+    - directory: The store directory; created by the first load.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._running = threading.local()  # Progress object of the query evaluated by each thread
+        self._open()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open(self):
+        manifest_path = self._path('manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as handle:
+                manifest = json.load(handle)
+            if manifest.get('version') != FORMAT_VERSION:
+                raise LoadError(f"{self.directory} holds a store of format {manifest.get('version')}; "
+                                f"expected {FORMAT_VERSION}. Reload the dumps into a new directory.")
+            self._manifest_mtime = os.path.getmtime(manifest_path)
+        else:
+            manifest = {'revision': 0, 'terms': 0, 'triples': 0}
+            self._manifest_mtime = None
+        self.revision = manifest['revision']
+        self.term_count = manifest['terms']
+        self.triple_count = manifest['triples']
+
+        self._terms = b''
+        if self.term_count:
+            with open(self._path('terms.bin'), 'rb') as handle:
+                self._terms = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            self._offsets = _mapped(self._path('terms_offsets.npy'))
+            self._sorted = _mapped(self._path('terms_sorted.npy'))
+        else:
+            self._offsets = np.zeros(1, dtype=np.int64)
+            self._sorted = np.zeros(0, dtype=np.int64)
+        self._indexes = {
+            name: _mapped(self._path(f"{name}.npy")) if self.triple_count else np.zeros((3, 0), dtype=np.int64)
+            for name in INDEX_ORDERS
+        }
+        self.term = lru_cache(maxsize=TERM_CACHE_SIZE)(self._decode)
+        self.lookup = lru_cache(maxsize=TERM_CACHE_SIZE)(self._lookup)
+        self._graph = None
+
+    def __len__(self):
+        return self.triple_count
+
+    def reopen_if_changed(self):
+        """
+        Reopens the store if another process (e.g. the command line loader) has replaced it.
+        """
+        manifest_path = self._path('manifest.json')
+        mtime = os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                self._open()
+
+    def term_text(self, term_id):
+        return self._terms[int(self._offsets[term_id]):int(self._offsets[term_id + 1])].decode('utf-8')
+
+    def _decode(self, term_id):
+        return parse_term(self.term_text(term_id))
+
+    def _lookup(self, text):
+        """
+        Returns the id of a term given its canonical N-Triples text, or None (cached as lookup()).
+        """
+        key = text.encode('utf-8')
+        low, high = 0, len(self._sorted)
+        while low < high:
+            middle = (low + high) // 2
+            term_id = int(self._sorted[middle])
+            if self._terms[int(self._offsets[term_id]):int(self._offsets[term_id + 1])] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._sorted):
+            term_id = int(self._sorted[low])
+            if self._terms[int(self._offsets[term_id]):int(self._offsets[term_id + 1])] == key:
+                return term_id
+        return None
+
+    def match(self, subject=None, predicate=None, object=None):
+        """
+        Returns the triples matching a pattern of term ids (None matches anything) as an (n, 3)
+        array in subject, predicate, object order.
+        """
+        pattern = (subject, predicate, object)
+        bound = {position for position, term_id in enumerate(pattern) if term_id is not None}
+        # The index whose key order starts with exactly the bound positions
+        name, order = next((name, order) for name, order in INDEX_ORDERS.items()
+                           if set(order[:len(bound)]) == bound)
+        index = self._indexes[name]
+        low, high = 0, index.shape[1]
+        for level, position in enumerate(order[:len(bound)]):
+            column = index[level, low:high]
+            key = index.dtype.type(pattern[position])  # A key of another dtype would make numpy convert the column
+            low, high = low + int(column.searchsorted(key, 'left')), low + int(column.searchsorted(key, 'right'))
+        rows = np.empty((high - low, 3), dtype=index.dtype)
+        for level, position in enumerate(order):
+            rows[:, position] = index[level, low:high]
+        return rows
+
+    def load(self, paths, max_workers=DEFAULT_LOAD_WORKERS, chunk_lines=DEFAULT_CHUNK_LINES):
+        """
+        Adds the triples of the given dumps (N-Triples, N-Quads or Turtle, optionally gzipped) and
+        rewrites the indexes.
+
+        N-Triples and N-Quads are streamed: chunks of lines are parsed by max_workers processes while
+        the file is being read. Turtle is parsed by rdflib in this process. Quads are loaded into a
+        single default graph.
+
+        Returns:
+        A dictionary with 'triples' (total distinct triples), 'triples_added', 'terms_added' and
+        'seconds'.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            revision = self.revision + 1
+            texts = [self.term_text(term_id) for term_id in range(self.term_count)]
+            ids = {text: term_id for term_id, text in enumerate(texts)}
+            parts = [np.asarray(self._indexes['spo']).T.astype(np.int64)]
+
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                for file_index, path in enumerate(paths):
+                    scope = f"r{revision}f{file_index}_"
+                    for terms, triples in _parsed_chunks(pool, path, scope, chunk_lines, max_workers):
+                        mapping = np.empty(len(terms), dtype=np.int64)
+                        for position, text in enumerate(terms):
+                            term_id = ids.get(text)
+                            if term_id is None:
+                                term_id = ids[text] = len(texts)
+                                texts.append(text)
+                            mapping[position] = term_id
+                        parts.append(mapping[triples])
+
+            terms_added = len(texts) - self.term_count
+            previous = self.triple_count
+            self._write(texts, np.concatenate(parts), revision)
+            self._open()
+        return {
+            'triples': self.triple_count,
+            'triples_added': self.triple_count - previous,
+            'terms_added': terms_added,
+            'seconds': time.perf_counter() - start,
+        }
+
+    def _write(self, texts, triples, revision):
+        """
+        Writes the dictionary and the three indexes next to the current files and then swaps them
+        in; the manifest is replaced last, so an interrupted load leaves the previous store intact.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        dtype = np.int32 if len(texts) < 2 ** 31 else np.int64
+        encoded = [text.encode('utf-8') for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+        temporary = {}
+        with open(self._path('terms.bin.tmp'), 'wb') as handle:
+            handle.write(b''.join(encoded))
+        temporary['terms.bin'] = self._path('terms.bin.tmp')
+        temporary['terms_offsets.npy'] = _write_array(self._path('terms_offsets.npy'), offsets)
+        order = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=dtype)
+        temporary['terms_sorted.npy'] = _write_array(self._path('terms_sorted.npy'), order)
+
+        count = 0
+        for name, key_order in INDEX_ORDERS.items():
+            keyed = triples[:, key_order]
+            keyed = keyed[np.lexsort((keyed[:, 2], keyed[:, 1], keyed[:, 0]))]
+            if name == 'spo':
+                distinct = np.ones(len(keyed), dtype=bool)
+                distinct[1:] = np.any(keyed[1:] != keyed[:-1], axis=1)
+                triples = keyed = keyed[distinct]  # The other indexes are built from the distinct triples
+                count = len(keyed)
+            temporary[f"{name}.npy"] = _write_array(self._path(f"{name}.npy"), np.ascontiguousarray(keyed.T, dtype=dtype))
+
+        for name, path in temporary.items():
+            os.replace(path, self._path(name))
+        manifest = {'version': FORMAT_VERSION, 'revision': revision, 'terms': len(texts), 'triples': count}
+        with open(self._path('manifest.json.tmp'), 'w') as handle:
+            json.dump(manifest, handle)
+        os.replace(self._path('manifest.json.tmp'), self._path('manifest.json'))
+
+    def graph(self):
+        """
+        Returns an rdflib Graph backed by this store.
+        """
+        if self._graph is None:
+            rdflib = _require_rdflib()
+            self._graph = rdflib.Graph(store=_graph_store_class()(self))
+        return self._graph
+
+    def query(self, query, progress=None):
+        """
+        Evaluates a SPARQL query over the store. A progress object (see query_executor.execute_query)
+        is checked at every triple pattern lookup, so a cancelled query stops early.
+
+        Returns:
+        A dictionary shaped like results_parser.parse_json_results(): 'columns', 'buffers',
+        'boolean', 'has_bindings' and 'bytes_read'. CONSTRUCT and DESCRIBE results come back as
+        subject, predicate and object columns.
+        """
+        rdflib = _require_rdflib()
+        # rdflib would parse the text itself, outside the lock that keeps pyparsing single-threaded
+        prepared = prepare_query(query)
+        self._running.progress = progress
+        try:
+            result = self.graph().query(prepared)
+            if result.type == 'SELECT':
+                result.bindings  # Evaluates the (lazy) solutions now, while progress is still set
+        finally:
+            self._running.progress = None
+        buffers = ColumnBuffers()
+        if result.type == 'ASK':
+            return {'columns': [], 'buffers': buffers, 'boolean': result.askAnswer, 'has_bindings': False,
+                    'bytes_read': 0}
+        columns = [str(name) for name in result.vars] if result.type == 'SELECT' else ['subject', 'predicate', 'object']
+        for name in columns:
+            buffers.add_column(name)
+        for row in result:
+            binding = {}
+            for name, term in zip(columns, row):
+                if term is None:
+                    continue
+                if isinstance(term, rdflib.URIRef):
+                    binding[name] = {'type': 'uri', 'value': str(term)}
+                elif isinstance(term, rdflib.BNode):
+                    binding[name] = {'type': 'bnode', 'value': str(term)}
+                elif term.datatype:
+                    binding[name] = {'type': 'literal', 'value': str(term), 'datatype': str(term.datatype)}
+                else:
+                    binding[name] = {'type': 'literal', 'value': str(term)}
+            buffers.append(binding)
+        return {'columns': columns, 'buffers': buffers, 'boolean': None, 'has_bindings': True, 'bytes_read': 0}
+
+
+def _cast_date(value):
+    """
+    The xsd:date() cast, which endpoints such as Virtuoso support (and the templates use) but
+    rdflib's SPARQL engine lacks.
+    """
+    rdflib = _require_rdflib()
+    from rdflib.plugins.sparql.sparql import SPARQLError
+    XSD = rdflib.XSD
+    if isinstance(value, rdflib.Literal):
+        if value.datatype == XSD.date:
+            return value
+        if value.datatype == XSD.dateTime and isinstance(value.toPython(), datetime.datetime):
+            return rdflib.Literal(value.toPython().date(), datatype=XSD.date)
+        if value.datatype in (None, XSD.string):
+            try:
+                return rdflib.Literal(datetime.date.fromisoformat(str(value).strip()), datatype=XSD.date)
+            except ValueError:
+                pass
+    raise SPARQLError(f"Cannot cast {value!r} to xsd:date")
+
+
+@lru_cache(maxsize=None)
+def _graph_store_class():
+    """
+    Defines (on first use, as rdflib is optional) the rdflib Store that answers triple patterns
+    from a LocalStore's indexes, and registers the xsd:date cast.
+    """
+    from rdflib import XSD
+    from rdflib.plugins.sparql.operators import register_custom_function
+    from rdflib.store import Store
+
+    register_custom_function(XSD.date, _cast_date, override=True)
+
+    class IndexedStore(Store):
+        context_aware = False
+        formula_aware = False
+        transaction_aware = False
+        graph_aware = False
+
+        def __init__(self, local_store):
+            super().__init__()
+            self.local_store = local_store
+
+        def triples(self, pattern, context=None):
+            progress = getattr(self.local_store._running, 'progress', None)
+            if progress is not None:
+                progress.check()
+            ids = []
+            for term in pattern:
+                if term is None:
+                    ids.append(None)
+                    continue
+                term_id = self.local_store.lookup(format_term(term))
+                if term_id is None:
+                    return  # A constant that does not occur in the data matches nothing
+                ids.append(term_id)
+            decode = self.local_store.term
+            for subject, predicate, object in self.local_store.match(*ids).tolist():
+                yield (decode(subject), decode(predicate), decode(object)), iter(())
+
+        def __len__(self, context=None):
+            return len(self.local_store)
+
+    return IndexedStore
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_directory(endpoint):
+    return os.path.abspath(os.path.expanduser(endpoint.strip()[len(LOCAL_SCHEME):].strip()))
+
+
+def open_store(endpoint):
+    """
+    Returns the shared LocalStore for a 'local:<directory>' endpoint, opening it on first use.
+    """
+    directory = store_directory(endpoint)
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            if not os.path.exists(os.path.join(directory, 'manifest.json')):
+                raise LoadError(f"No local store in {directory}; load RDF dumps into it first.")
+            store = _stores[directory] = LocalStore(directory)
+    store.reopen_if_changed()
+    return store
+
+
+def store_revision(endpoint):
+    """
+    Returns the revision of the store of a 'local:<directory>' endpoint, or None if there is none.
+    """
+    try:
+        return open_store(endpoint).revision
+    except LoadError:
+        return None
+
+
+def load_dumps(endpoint, paths, max_workers=DEFAULT_LOAD_WORKERS):
+    """
+    Loads dumps into the store of a 'local:<directory>' endpoint, creating it if needed.
+    """
+    directory = store_directory(endpoint)
+    with _stores_lock:
+        store = _stores.get(directory)
+        if store is None:
+            store = _stores[directory] = LocalStore(directory)
+    return store.load(paths, max_workers=max_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load RDF dumps into a local store for 'local:<directory>' queries.")
+    parser.add_argument('directory', help="Store directory (created if needed).")
+    parser.add_argument('dumps', nargs='+', help="N-Triples (.nt), N-Quads (.nq) or Turtle (.ttl) files, optionally gzipped.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_LOAD_WORKERS, help="Parser processes for line-based dumps.")
+    parser.add_argument('--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES, help="Lines per parser task.")
+    args = parser.parse_args(argv)
+
+    stats = LocalStore(args.directory).load(args.dumps, max_workers=args.workers, chunk_lines=args.chunk_lines)
+    print(f"Loaded {stats['triples_added']} new triples ({stats['terms_added']} new terms) in {stats['seconds']:.1f} s; "
+          f"the store holds {stats['triples']} triples. Query it as {LOCAL_SCHEME}{os.path.abspath(args.directory)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,21 @@
+import functools
+
 import streamlit as st
-from SPARQLWrapper import SPARQLWrapper, JSON
 import pandas as pd
-# Use the following imports for data visualization and export
-from data_visualization import visualize_data
-from query_executor import execute_query  # Import the execute_query function
-from query_templates import query_templates
-from results_export import export_to_csv, export_to_json, export_to_excel
-from regression_analysis import perform_regression
+# Charts (plotly) and regression (statsmodels) are imported where results are shown, so the
+# login page and the query form render without loading them
+from query_executor import iter_query_batches
+from jobs import CANCELLED, FINAL_STATES, POLL_INTERVAL, TIMED_OUT, default_manager, job_key
+from result_store import default_store
+from batch_runner import DEFAULT_CONCURRENCY, run_batch_sync, template_jobs
+from query_templates import DEFAULT_RANGE, parameterized_templates, query_templates
+from local_store import LOCAL_SCHEME, load_dumps
+from query_partitioning import QueryTemplate, run_partitioned
+from query_analysis import SparqlSyntaxError, analyze_query
+from query_rewriting import declared_prefixes
+from results_export import available_formats, download_button
+from metrics import STAGES, default_registry
+from result_set import as_dataframe
 from texts import intro_text
 
 # Default credentials
@@ -20,15 +29,83 @@ def check_login(username, password):
 # Initialize session state for login status and query results
 if 'logged_in' not in st.session_state:
     st.session_state['logged_in'] = False
-if 'query_results' not in st.session_state:
-    st.session_state['query_results'] = None
+if 'results_handle' not in st.session_state:
+    st.session_state['results_handle'] = None  # A result_store.ResultHandle; the results are shared across sessions
 if 'columns' not in st.session_state:
     st.session_state['columns'] = None
 
 
-def is_valid_sparql(query):
-    required_keywords = ['SELECT', 'WHERE', '{', '}']  # Basic elements of a query
-    return all(keyword in query for keyword in required_keywords)
+def _run_partitioned_job(endpoint, query, template, start, end, **options):
+    return run_partitioned(endpoint, template, start, end, **options)
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def show_query_job():
+    """
+    Polls the running query job; once it is final, the whole page is rerun to show its results.
+    """
+    job = default_manager.status(st.session_state['query_job'])
+    if job is None:
+        st.session_state['query_job'] = None
+        return
+    if job['state'] not in FINAL_STATES:
+        st.info(f"Query {job['state']}: {job['rows']} rows, {job['bytes'] / 1e6:.1f} MB received after {job['elapsed']:.0f} seconds.")
+        if st.button('Cancel query'):
+            default_manager.cancel(job['id'])
+        return
+    st.session_state['query_job'] = None
+    st.session_state['finished_job'] = job
+    st.rerun()
+
+
+def show_query_result(job):
+    """
+    Stores the results of a finished query job in the session and reports how the query went.
+    """
+    result = job['result']
+    if job['state'] in (CANCELLED, TIMED_OUT):
+        st.warning(result['error'])
+        return
+    if 'partitions' in result:
+        partitions = result['partitions']
+        st.caption(f"{len(partitions)} monthly partitions: {sum(p['closed'] for p in partitions)} closed, "
+                   f"{sum(p['cached'] for p in partitions)} served from the cache, "
+                   f"{sum(not p['cached'] for p in partitions)} queried.")
+    if result['success']:
+        handle = None
+        if result['data'] is None:
+            # Another session sharing the job has handed its results over to the store already
+            handle = default_store.acquire(job['key'])
+            if handle is None:
+                st.warning("These results are no longer held in memory; please run the query again.")
+                return
+        elif result['data']:
+            # The session keeps a handle; sessions looking at the same query share one copy
+            handle = default_store.put(job['key'], result['data'], replace=not result['cached'],
+                                       prefixes=declared_prefixes(job['query']))
+            default_manager.release_result(job['id'])
+        if handle is not None:
+            st.session_state['results_handle'] = handle
+            st.session_state['columns'] = result['columns']
+            st.session_state['results_query'] = job['query']
+            st.session_state['trace_id'] = result.get('trace_id')  # Partitioned runs have one trace per month
+            # Informing the user about successful execution and execution time
+            if result['cached']:
+                st.success(f"Retrieved {len(handle)} results from the cache in {result['execution_time']:.2f} seconds.")
+            else:
+                st.success(f"Query executed successfully, retrieved {len(handle)} results in {result['execution_time']:.2f} seconds.")
+                stages = result['stages']
+                if result['format'] == 'local':
+                    st.caption(f"Local store: {stages.get('evaluate', 0):.2f} s evaluating, {stages.get('convert', 0):.2f} s building columns.")
+                else:
+                    st.caption(f"Endpoint: {stages.get('ttfb', 0):.2f} s to first byte, {stages.get('transfer', 0):.2f} s receiving "
+                               f"{result['bytes_received'] / 1e6:.1f} MB as {result['format']}. "
+                               f"This app: {stages.get('parse', 0):.2f} s parsing, {stages.get('convert', 0):.2f} s building columns.")
+        else:
+            st.write("No results found.")
+    else:
+        # Handle errors more gracefully
+        st.error(f"An error occurred during query execution: {result['error']}")
 
 # User login form
 # with st.sidebar:
@@ -55,46 +132,144 @@ if st.session_state['logged_in']:
     
     st.subheader("SPARQL Editor & Querier")
     # Input for manually setting the SPARQL endpoint
-    st.session_state['sparql_endpoint'] = st.text_input("SPARQL Endpoint", value=st.session_state.get('sparql_endpoint', ''))
+    st.session_state['sparql_endpoint'] = st.text_input("SPARQL Endpoint", value=st.session_state.get('sparql_endpoint', ''), help="An endpoint URL, or local:<directory> to query RDF dumps loaded into a local store.")
+    # Local engine: dumps loaded here are queried with the same templates, without a remote endpoint
+    with st.expander("Load RDF dumps into a local store"):
+        store_directory = st.text_input("Store directory:", value="local_store")
+        dump_paths = st.text_area("Dump files (one path per line; .nt, .nq or .ttl, optionally .gz):")
+        if st.button('Load dumps') and dump_paths.strip():
+            try:
+                with st.spinner("Loading..."):
+                    load_stats = load_dumps(LOCAL_SCHEME + store_directory, [path.strip() for path in dump_paths.splitlines() if path.strip()])
+                st.session_state['sparql_endpoint'] = LOCAL_SCHEME + store_directory
+                st.success(f"Loaded {load_stats['triples_added']} new triples in {load_stats['seconds']:.1f} seconds; the store holds {load_stats['triples']} triples. "
+                           f"Queries now run against {LOCAL_SCHEME}{store_directory}.")
+            except (OSError, ValueError) as e:
+                st.error(f"Loading failed: {e}")
     
     # Dropdown for selecting query templates
     template_selection = st.selectbox("Query Templates:", list(query_templates.keys()))
     
-    # Text area for inputting or modifying the SPARQL query
-    query_text = st.text_area("SPARQL Query:", height=300, value=query_templates.get(template_selection, ""), help="Enter your SPARQL query here. Make sure to include PREFIX declarations if necessary.")
+    # Text area for inputting or modifying the SPARQL query; ranged templates keep their placeholders
+    template_text = parameterized_templates[template_selection].query if template_selection in parameterized_templates else query_templates.get(template_selection, "")
+    query_text = st.text_area("SPARQL Query:", height=300, value=template_text, help="Enter your SPARQL query here. Make sure to include PREFIX declarations if necessary.")
  
-    # Execute query button
+    # Cached results are reused unless the user explicitly asks for fresh data
+    refresh_cache = st.checkbox("Bypass cache (re-run the query against the endpoint)", value=False)
+    # Paged mode splits large SELECTs into LIMIT/OFFSET windows fetched in parallel
+    # CSV/TSV are smaller to download and faster to parse than JSON; CSV loses datatypes
+    results_format = st.selectbox("Results format:", ["json", "tsv", "csv"], help="TSV keeps datatypes. CSV is the most compact: numbers and dates are recognised from the values, but IRIs and language tags are lost.")
+    paged_fetch = st.checkbox("Fetch large results in pages", value=False, help="Avoids endpoint timeouts and silent result caps on large SELECT queries.")
+
+    # Templates over a date range get their {{start}}/{{end}} bound here; in incremental mode the
+    # range is queried month by month and months that can no longer change come from the cache
+    template = QueryTemplate(query_text, defaults=DEFAULT_RANGE, partition='month')
+    incremental = False
+    if template.is_ranged:
+        start_column, end_column = st.columns(2)
+        range_start = start_column.date_input("From (inclusive):", value=DEFAULT_RANGE['start'])
+        range_end = end_column.date_input("To (exclusive):", value=DEFAULT_RANGE['end'])
+        incremental = st.checkbox("Incremental refresh (re-query only open partitions)", value=False,
+                                  help="Runs the query once per month. Months that ended more than a week ago are cached permanently; with 'Bypass cache' only the recent months are re-queried.")
+
+    # Queries are parsed before they are sent: syntax errors never reach the endpoint, and
+    # queries with a costly shape only run once the user accepts the warnings
+    run_with_hazards = st.checkbox("Run queries despite cost warnings", value=False, help="E.g. a SELECT without LIMIT, triple patterns joined as a cartesian product or a REGEX starting with '.*'.")
+
+    # Execute query button: the query runs as a background job, so the page stays responsive and
+    # repeated clicks (or other sessions running the same query) share one request
     if st.button('Execute Query') and st.session_state['sparql_endpoint']:
-        if not is_valid_sparql(query_text):
-            st.error("The SPARQL query seems to be invalid. Please check the syntax.")
+        rendered_query = template.render(start=range_start, end=range_end) if template.is_ranged else query_text
+        analysis = None
+        if template.is_ranged and range_start >= range_end:
+            st.error("The start of the date range must lie before its end.")
         else:
-            result = execute_query(st.session_state['sparql_endpoint'], query_text)  # Now we get a dictionary back
-            
-            if result['success']:
-                if result['data']:
-                    # Store results in session state
-                    st.session_state['query_results'] = result['data']
-                    st.session_state['columns'] = result['columns']
-                    # Informing the user about successful execution and execution time
-                    st.success(f"Query executed successfully, retrieved {len(result['data'])} results in {result['execution_time']:.2f} seconds.")
-                else:
-                    st.write("No results found.")
+            try:
+                analysis = analyze_query(rendered_query)
+            except SparqlSyntaxError as e:
+                st.error(f"The SPARQL query is invalid: {e}")
+        if analysis and not analysis['parsed']:
+            st.caption("rdflib is not installed, so the query could not be parsed: only its query form was checked.")
+        for hazard in analysis['hazards'] if analysis else []:
+            st.warning(hazard['message'])
+        if analysis and analysis['hazards'] and not run_with_hazards:
+            st.info("The query was not run. Tick 'Run queries despite cost warnings' to run it anyway.")
+        elif analysis:
+            if st.session_state.get('query_job'):
+                default_manager.cancel(st.session_state['query_job'])
+            if incremental:
+                runner = functools.partial(_run_partitioned_job, template=template, start=range_start, end=range_end)
+                st.session_state['query_job'] = default_manager.submit(st.session_state['sparql_endpoint'], rendered_query, runner=runner, variant='incremental', refresh=refresh_cache, paged=paged_fetch, results_format=results_format)
             else:
-                # Handle errors more gracefully
-                st.error(f"An error occurred during query execution: {result['error']}")
+                st.session_state['query_job'] = default_manager.submit(st.session_state['sparql_endpoint'], rendered_query, refresh=refresh_cache, paged=paged_fetch, results_format=results_format)
+
+    if st.session_state.get('query_job'):
+        show_query_job()
+    if st.session_state.get('finished_job'):
+        show_query_result(st.session_state.pop('finished_job'))
     
+    # Batch refresh of every template, e.g. for the morning report
+    st.subheader("Run All Templates")
+    st.write("Execute every query template concurrently against the endpoint. Results appear as each query completes.")
+    batch_concurrency = st.slider("Parallel queries per endpoint:", min_value=1, max_value=8, value=DEFAULT_CONCURRENCY)
+    if st.button('Run all templates') and st.session_state['sparql_endpoint']:
+        jobs = template_jobs(st.session_state['sparql_endpoint'], query_templates)
+        progress_bar = st.progress(0.0)
+        status_table = st.empty()
+        batch_rows = []
+
+        def show_outcome(outcome):
+            result = outcome['result']
+            batch_rows.append({
+                'Template': outcome['name'],
+                'Status': 'OK' if result['success'] else f"Error: {result['error']}",
+                'Rows': len(result['data']),
+                'Seconds': round(outcome['elapsed_time'], 2),
+                'Cached': result['cached'],
+            })
+            progress_bar.progress(len(batch_rows) / len(jobs))
+            status_table.dataframe(pd.DataFrame(batch_rows), use_container_width=True)
+
+        outcomes = run_batch_sync(jobs, on_result=show_outcome, concurrency=batch_concurrency,
+                                  refresh=refresh_cache, paged=paged_fetch, results_format=results_format)
+        st.session_state['batch_results'] = {
+            outcome['name']: dict(outcome['result'], data=default_store.put(
+                job_key(outcome['endpoint'], outcome['query'], results_format=results_format), outcome['result']['data'],
+                replace=not outcome['result']['cached'], prefixes=declared_prefixes(outcome['query'])))
+            if outcome['result']['success'] and outcome['result']['data'] else outcome['result']
+            for outcome in outcomes
+        }
+
+    if st.session_state.get('batch_results'):
+        batch_selection = st.selectbox("Template results to explore:", list(st.session_state['batch_results']))
+        if st.button('Load template results'):
+            result = st.session_state['batch_results'][batch_selection]
+            if result['success'] and result['data']:
+                st.session_state['results_handle'] = result['data']
+                st.session_state['columns'] = result['columns']
+                st.session_state['results_query'] = query_templates[batch_selection]
+                st.session_state['trace_id'] = result.get('trace_id')
+            else:
+                st.warning("That template returned no results.")
+
+    query_results = st.session_state['results_handle'].get() if st.session_state['results_handle'] is not None else None
+
         # Visualization selection and rendering if query results exist
-    if 'query_results' in st.session_state and st.session_state['query_results'] is not None:
+    if query_results is not None:
         st.subheader("Data Visualization")
         st.write("Choose a visualization type to display the results of your SPARQL query.")
         selected_viz = st.selectbox("Select visualization type:", ["Table", "Line Chart", "Bar Chart", "Pie Chart"])
+        from data_visualization import visualize_data
         
         # Call to the visualization function
-        visualize_data(st.session_state['query_results'], st.session_state['columns'], selected_viz)
+        # The endpoint and query let bar and pie charts be aggregated by the endpoint
+        visualize_data(query_results, st.session_state['columns'], selected_viz,
+                       endpoint=st.session_state['sparql_endpoint'], query=st.session_state.get('results_query'),
+                       trace_id=st.session_state.get('trace_id'))
 
 
     # Regression Analysis Section
-    if 'query_results' in st.session_state and st.session_state['query_results'] is not None:
+    if query_results is not None:
         st.subheader("Regression Analysis")
         st.write("Perform a linear regression analysis on the query results.")
 
@@ -103,13 +278,35 @@ if st.session_state['logged_in']:
         indep_vars = st.multiselect("Select the independent variables:", 
                                     [col for col in st.session_state['columns'] if col != dep_var])
 
+        # The streamed fit keeps only running sums, so it also works on results too large to load at once
+        incremental_fit = st.checkbox("Streamed fit (for large results)", value=False, help="Fits the model batch by batch; adds weighted and per-group regression.")
+        if incremental_fit:
+            other_columns = [None] + [col for col in st.session_state['columns'] if col != dep_var and col not in indep_vars]
+            weights_var = st.selectbox("Weights column (optional):", other_columns)
+            group_var = st.selectbox("Fit separately per value of (optional):", other_columns)
+            stream_from_endpoint = st.checkbox("Read the rows from the endpoint page by page", value=False, help="Re-runs the query above in pages instead of using the loaded results.")
+
         # Button to perform regression
         if st.button("Perform Linear Regression"):
-            df = pd.DataFrame(st.session_state['query_results'], columns=st.session_state['columns'])
-            
             # Perform linear regression
             try:
-                result, plot_fig, error = perform_regression(df, dep_var, indep_vars)
+                from regression_analysis import perform_incremental_regression, perform_regression
+
+                regression_span = default_registry.span(st.session_state.get('trace_id'), 'regression')
+                if not incremental_fit:
+                    with default_registry.span(st.session_state.get('trace_id'), 'dataframe'):
+                        df = as_dataframe(query_results, st.session_state['columns'], usecols=[dep_var] + indep_vars)
+                    with regression_span:
+                        result, plot_fig, error = perform_regression(df, dep_var, indep_vars)
+                else:
+                    if stream_from_endpoint:
+                        batches = iter_query_batches(st.session_state['sparql_endpoint'], st.session_state['results_query'], paged=True, results_format=results_format)
+                    elif hasattr(query_results, 'iter_chunks'):
+                        batches = query_results.iter_chunks(100000)
+                    else:
+                        batches = [as_dataframe(query_results, st.session_state['columns'])]
+                    with regression_span:
+                        result, plot_fig, error = perform_incremental_regression(batches, dep_var, indep_vars, weights_var=weights_var, group_var=group_var)
                 if error:
                     st.error(error)
                 else:
@@ -122,14 +319,41 @@ if st.session_state['logged_in']:
 
         # Export Options
         st.subheader("Export Query Results")
-        st.write("Export the results of your SPARQL query to CSV, JSON, or Excel formats for offline analysis.")
+        st.write("Export the results of your SPARQL query to CSV, JSON, NDJSON, Excel, Parquet or Arrow formats for offline analysis.")
         
-        export_format = st.selectbox("Select export format:", ["CSV", "JSON", "Excel"])
+        export_format = st.selectbox("Select export format:", available_formats())
         
-        if export_format == "CSV":
-            export_to_csv(st.session_state['query_results'], st.session_state['columns'])
-        elif export_format == "JSON":
-            export_to_json(st.session_state['query_results'], st.session_state['columns'])
-        elif export_format == "Excel":
-            export_to_excel(st.session_state['query_results'], st.session_state['columns'])
+        # The file is generated when the button is clicked, not on every rerun
+        download_button(query_results, st.session_state['columns'], export_format,
+                        trace_id=st.session_state.get('trace_id'))
+
+    # Stage breakdown of recent queries: shows whether time goes to the endpoint or to this app
+    if st.checkbox("Show performance metrics", value=False):
+        st.subheader("Recent Queries")
+        traces = default_registry.recent_traces()
+        if traces:
+            rows = []
+            for trace in traces:
+                stages = trace['stages']
+                network = sum(stages.get(stage, 0.0) for stage in ('ttfb', 'transfer'))
+                local = sum(seconds for stage, seconds in stages.items() if stage not in ('ttfb', 'transfer'))
+                row = {
+                    'Started': pd.Timestamp(trace['started_at'], unit='s', tz='UTC').strftime('%H:%M:%S'),
+                    'Query': ' '.join(trace['query'].split())[:80],
+                    'Cached': trace.get('cached', False),
+                    'OK': trace.get('success'),
+                    'Rows': trace['counters'].get('rows', 0),
+                    'MB': round(trace['counters'].get('bytes', 0) / 1e6, 2),
+                    'Total s': round(trace.get('total', 0.0), 3),
+                }
+                row.update({f"{stage} s": round(stages[stage], 3) if stage in stages else None for stage in STAGES})
+                row['Endpoint share'] = f"{network / (network + local):.0%}" if network + local else None
+                rows.append(row)
+            st.dataframe(pd.DataFrame(rows), use_container_width=True)
+        else:
+            st.write("No queries executed yet.")
+        store_stats = default_store.stats()
+        st.caption(f"Shared results: {store_stats['entries']} result sets held by {store_stats['handles']} session handles; "
+                   f"{store_stats['memory_bytes'] / 1e6:.1f} of {store_stats['memory_budget'] / 1e6:.0f} MB in memory, "
+                   f"{store_stats['spilled']} spilled to disk.")
 
@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# Stages in pipeline order. Network: time to first byte (connection and server execution) and
+# transfer (waiting on the response body). Ours: parse, convert (typed columns), dataframe (the
+# DataFrame a chart or regression builds from the columns), regression, render and export.
+# 'cache' is the lookup time of a result served from the cache, 'evaluate' the query evaluation
+# of a local store (local_store.py).
+STAGES = ('cache', 'evaluate', 'ttfb', 'transfer', 'parse', 'convert', 'dataframe', 'regression', 'render', 'export')
+NETWORK_STAGES = ('ttfb', 'transfer')
+DEFAULT_HISTORY = 50  # Recent queries kept for the in-app panel
+METRICS_ENV = 'SPARQL_QUERIER_METRICS'  # e.g. "log,jsonl:/tmp/metrics.jsonl,prometheus:/tmp/sparql.prom"
+
+
+class TimedStream:
+    """
+    Wraps a binary stream and measures the time spent blocked in read(), i.e. waiting for the
+    network (and decompression), separately from the time spent parsing what was read.
+
+    An optional progress object (see query_executor.execute_query) is checked before every read
+    and told how many bytes were read.
+    """
+
+    def __init__(self, stream, progress=None):
+        self.stream = stream
+        self.read_time = 0.0
+        self.progress = progress
+
+    def read(self, size=-1):
+        if self.progress is not None:
+            self.progress.check()
+        start = time.perf_counter()
+        try:
+            data = self.stream.read(size)
+        finally:
+            self.read_time += time.perf_counter() - start
+        if self.progress is not None:
+            self.progress.add_bytes(len(data))
+        return data
+
+
+class Trace:
+    """
+    Stage timings and counters of one query, from the request to the export of its results.
+
+    Stage durations come from time.perf_counter() and add up when a stage runs more than once, e.g.
+    once per page of a paged query. Pages fetched concurrently therefore sum to more than the
+    wall-clock 'total'.
+    """
+
+    def __init__(self, endpoint, query):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.query = query
+        self.started_at = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, replace=False):
+        with self._lock:
+            self.stages[stage] = seconds if replace else self.stages.get(stage, 0.0) + seconds
+
+    def count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def network_time(self):
+        return sum(self.stages.get(stage, 0.0) for stage in NETWORK_STAGES)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'endpoint': self.endpoint,
+                'query': self.query,
+                'started_at': self.started_at,
+                'stages': dict(self.stages),
+                'counters': dict(self.counters),
+                **self.attributes,
+            }
+
+
+class LoggingSink:
+    """
+    Writes one log line per finished query and per later stage (DataFrame build, render, export).
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger('sparql_querier.metrics')
+        self.level = level
+
+    def emit(self, event):
+        trace = event['trace']
+        if event['event'] == 'query':
+            stages = ' '.join(f"{stage}={seconds:.3f}s" for stage, seconds in _ordered(trace['stages']))
+            counters = ' '.join(f"{name}={value}" for name, value in trace['counters'].items())
+            self.logger.log(self.level, f"query {trace['id']} endpoint={trace['endpoint']} "
+                                        f"total={trace.get('total', 0.0):.3f}s {stages} {counters}".rstrip())
+        else:
+            self.logger.log(self.level, f"query {trace['id']} {event['stage']}={event['seconds']:.3f}s")
+
+
+class JsonLinesSink:
+    """
+    Appends every event as a JSON object on its own line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        if event['event'] == 'query':
+            record = {'event': 'query', **event['trace']}
+        else:
+            record = {'event': 'stage', 'id': event['trace']['id'], 'stage': event['stage'], 'seconds': event['seconds']}
+        record['time'] = time.time()
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(line + '\n')
+
+
+class PrometheusSink:
+    """
+    Aggregates events into Prometheus metrics: a summary of seconds per endpoint and stage, and
+    counters of queries, rows and bytes. render() returns the text exposition format; with a path
+    the file is rewritten after every event, for node_exporter's textfile collector.
+    """
+
+    def __init__(self, path=None, prefix='sparql_querier'):
+        self.path = path
+        self.prefix = prefix
+        self.stage_seconds = {}  # (endpoint, stage) -> [sum, count]
+        self.queries = {}  # (endpoint, cached, success) -> count
+        self.totals = {}  # (counter, endpoint) -> value
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        trace = event['trace']
+        with self._lock:
+            if event['event'] == 'query':
+                for stage, seconds in trace['stages'].items():
+                    self._observe(trace['endpoint'], stage, seconds)
+                key = (trace['endpoint'], str(trace.get('cached', False)).lower(), str(trace.get('success', True)).lower())
+                self.queries[key] = self.queries.get(key, 0) + 1
+                for name, value in trace['counters'].items():
+                    self.totals[(name, trace['endpoint'])] = self.totals.get((name, trace['endpoint']), 0) + value
+            else:
+                self._observe(trace['endpoint'], event['stage'], event['seconds'])
+            text = self._render()
+        if self.path:
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as handle:
+                handle.write(text)
+            os.replace(temporary, self.path)
+
+    def _observe(self, endpoint, stage, seconds):
+        entry = self.stage_seconds.setdefault((endpoint, stage), [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def render(self):
+        with self._lock:
+            return self._render()
+
+    def _render(self):
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {name} Time spent per query stage.", f"# TYPE {name} summary"]
+        for (endpoint, stage), (total, count) in sorted(self.stage_seconds.items()):
+            labels = _labels(endpoint=endpoint, stage=stage)
+            lines.append(f"{name}_sum{labels} {total:.6f}")
+            lines.append(f"{name}_count{labels} {count}")
+        name = f"{self.prefix}_queries_total"
+        lines += [f"# HELP {name} Queries executed.", f"# TYPE {name} counter"]
+        for (endpoint, cached, success), count in sorted(self.queries.items()):
+            lines.append(f"{name}{_labels(endpoint=endpoint, cached=cached, success=success)} {count}")
+        for counter in sorted({counter for counter, _ in self.totals}):
+            name = f"{self.prefix}_{counter}_total"
+            lines += [f"# TYPE {name} counter"]
+            for (other, endpoint), value in sorted(self.totals.items()):
+                if other == counter:
+                    lines.append(f"{name}{_labels(endpoint=endpoint)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def _ordered(stages):
+    known = [(stage, stages[stage]) for stage in STAGES if stage in stages]
+    return known + [(stage, seconds) for stage, seconds in stages.items() if stage not in STAGES]
+
+
+def sinks_from_spec(spec):
+    """
+    Builds sinks from a comma-separated specification: 'log', 'jsonl:<path>', 'prometheus[:<path>]'.
+    """
+    sinks = []
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        kind, _, argument = entry.partition(':')
+        if kind == 'log':
+            sinks.append(LoggingSink())
+        elif kind == 'jsonl' and argument:
+            sinks.append(JsonLinesSink(argument))
+        elif kind == 'prometheus':
+            sinks.append(PrometheusSink(argument or None))
+        else:
+            raise ValueError(f"Unknown metrics sink {entry!r}; expected log, jsonl:<path> or prometheus[:<path>].")
+    return sinks
+
+
+class MetricsRegistry:
+    """
+    Creates traces, keeps the most recent ones for display and forwards finished queries and
+    later stages to the configured sinks.
+
+    Parameters:
+    - history: Number of recent traces kept.
+    - sinks: Objects with an emit(event) method; see LoggingSink, JsonLinesSink and PrometheusSink.
+    """
+
+    def __init__(self, history=DEFAULT_HISTORY, sinks=None):
+        self.recent = deque(maxlen=history)
+        self.sinks = list(sinks or [])
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        with self._lock:
+            self.sinks.remove(sink)
+
+    def start(self, endpoint, query):
+        trace = Trace(endpoint, query)
+        with self._lock:
+            self.recent.append(trace)
+        return trace
+
+    def find(self, trace_id):
+        with self._lock:
+            return next((trace for trace in self.recent if trace.id == trace_id), None)
+
+    def recent_traces(self):
+        """
+        Returns the recent traces as dictionaries, newest first.
+        """
+        with self._lock:
+            traces = list(self.recent)
+        return [trace.as_dict() for trace in reversed(traces)]
+
+    def finish(self, trace, **attributes):
+        """
+        Records the outcome of a query (total, cached, success, ...) and reports it to the sinks.
+        """
+        trace.attributes.update(attributes)
+        self._emit({'event': 'query', 'trace': trace.as_dict()})
+
+    @contextmanager
+    def span(self, trace_id, stage, replace=True):
+        """
+        Times a stage that runs after the query, such as building a DataFrame or rendering a chart,
+        and records it in the query's trace. Does nothing for an unknown or None trace_id.
+
+        By default the latest measurement replaces earlier ones, since the app re-renders the same
+        results on every interaction; replace=False adds them up instead.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace = self.find(trace_id) if trace_id else None
+            if trace is not None:
+                seconds = time.perf_counter() - start
+                trace.add(stage, seconds, replace)
+                self._emit({'event': 'stage', 'trace': trace.as_dict(), 'stage': stage, 'seconds': seconds})
+
+    def _emit(self, event):
+        with self._lock:
+            sinks = list(self.sinks)
+        for sink in sinks:
+            try:
+                sink.emit(event)
+            except Exception as e:
+                logging.warning(f"Metrics sink {type(sink).__name__} failed: {e}")
+
+
+default_registry = MetricsRegistry(sinks=sinks_from_spec(os.environ.get(METRICS_ENV)))
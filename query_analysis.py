@@ -0,0 +1,372 @@
+"""
+Parsing and static cost checks for SPARQL queries, run before a query is sent to the endpoint.
+
+analyze_query parses a query with rdflib's SPARQL 1.1 parser and translates it to the SPARQL
+algebra, so syntax errors are reported locally with their position. The algebra is then checked
+for shapes that are expensive on any endpoint (see HAZARDS), and serialized to a canonical form
+that ignores comments, whitespace, keyword case and PREFIX names, which query_cache uses for its
+keys. Endpoint-specific syntax outside SPARQL 1.1 (e.g. Virtuoso's DEFINE pragmas) is rejected.
+
+rdflib is in the requirements; should it be missing, queries are not parsed and only the
+lexical checks of query_rewriting are applied (the app and cli.py say so).
+"""
+import re
+import threading
+from functools import lru_cache
+
+from query_rewriting import query_form, split_prologue, strip_comments
+
+# Prefixes most endpoints declare implicitly, so queries relying on them still parse
+PREDECLARED_PREFIXES = {
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+    'owl': 'http://www.w3.org/2002/07/owl#',
+    'bif': 'bif:',
+}
+# Hazard codes and what they mean
+HAZARDS = {
+    'unbounded': "SELECT without LIMIT and without aggregation: every matching row is returned.",
+    'cartesian': "Triple patterns that share no variable: the endpoint joins them as a cartesian product.",
+    'leading_wildcard': "REGEX filter starting with a wildcard: every value has to be scanned.",
+    'optional_heavy': "Many or deeply nested OPTIONAL blocks: each one is a left join over the results so far.",
+}
+MAX_OPTIONALS = 4  # OPTIONAL blocks in a query before it is flagged
+MAX_OPTIONAL_DEPTH = 2  # Nesting of OPTIONAL blocks before it is flagged
+PARSE_CACHE_SIZE = 256  # Parsed queries kept, by query text
+
+# Nodes whose only graph pattern is 'p' and which do not change how its patterns are joined
+_TRANSPARENT = ('Filter', 'Extend', 'Project', 'Distinct', 'Reduced', 'OrderBy', 'Slice', 'Group', 'AggregateJoin')
+_LEADING_WILDCARD_PATTERN = re.compile(r'^\^?\.[*+]')
+_AGGREGATE_PATTERN = re.compile(r'\b(?:COUNT|SUM|AVG|MIN|MAX|SAMPLE|GROUP_CONCAT)\s*\(|\bGROUP\s+BY\b', re.IGNORECASE)
+_LIMIT_PATTERN = re.compile(r'\bLIMIT\s+\d+', re.IGNORECASE)
+_WILDCARD_SELECT_PATTERN = re.compile(r'SELECT\s*(?:(?:DISTINCT|REDUCED)\s+)?\*', re.IGNORECASE)
+
+# pyparsing grammars are not safe to use from several threads at once
+_parse_lock = threading.Lock()
+
+
+class SparqlSyntaxError(ValueError):
+    """
+    Raised when a query does not parse; line and column (1-based) locate the error if known.
+    """
+
+    def __init__(self, message, line=None, column=None):
+        super().__init__(message if line is None else f"{message} (line {line}, column {column})")
+        self.line = line
+        self.column = column
+
+
+def _require_rdflib():
+    try:
+        import rdflib
+    except ImportError:
+        raise ImportError("Parsing SPARQL needs the 'rdflib' package (pip install rdflib).")
+    return rdflib
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_query(query):
+    """
+    Parses a SPARQL query into rdflib's algebra. Results are cached by query text and shared, so
+    they are only read; use prepare_query for a query to evaluate.
+
+    Parameters:
+    - query: The SPARQL query as a string.
+
+    Returns:
+    An rdflib.plugins.sparql.sparql.Query; its 'algebra' attribute is the root of the algebra.
+
+    Raises:
+    SparqlSyntaxError if the query is not valid SPARQL 1.1, ImportError without rdflib.
+    """
+    return prepare_query(query)
+
+
+def prepare_query(query):
+    """
+    Parses a SPARQL query like parse_query, into a new Query object for rdflib to evaluate (e.g.
+    Graph.query). The parse runs under the module's lock, so callers in any thread can use it.
+    """
+    _require_rdflib()
+    from pyparsing import ParseException
+    from rdflib.plugins.sparql.algebra import translateQuery
+    from rdflib.plugins.sparql.parser import parseQuery
+
+    with _parse_lock:
+        try:
+            parsed = parseQuery(query)
+        except ParseException as e:
+            raise SparqlSyntaxError(e.msg, e.lineno, e.col) from None
+    try:
+        return translateQuery(parsed, initNs=PREDECLARED_PREFIXES)
+    except Exception as e:
+        # Unknown prefixes and misplaced aggregates surface as plain Exceptions
+        raise SparqlSyntaxError(str(e)) from None
+
+
+def _is_node(value):
+    return hasattr(value, 'name') and isinstance(value, dict)
+
+
+def _walk(value):
+    """
+    Yields every algebra node (patterns and expressions) below value, depth first.
+    """
+    if _is_node(value):
+        yield value
+        for key, child in value.items():
+            if key != '_vars':
+                yield from _walk(child)
+    elif isinstance(value, (list, tuple)):
+        for child in value:
+            yield from _walk(child)
+
+
+class _AnyBlankNode(dict):
+    """
+    Stands in for the blank node numbering of _canonical when sorting: every blank node reads '_:'.
+    """
+
+    def setdefault(self, key, default=None):
+        return '_:'
+
+
+def _canonical(value, bnodes, ordered=None):
+    """
+    Serializes an algebra value. rdflib builds some lists from sets, so their order changes with
+    the hash seed: the triples of a basic graph pattern are sorted, and so are projections other
+    than ordered, the one whose order gives the result columns.
+    """
+    from rdflib.term import BNode, Identifier
+
+    if _is_node(value):
+        fields = []
+        for key, child in value.items():
+            if key == '_vars':
+                continue
+            if key == 'PV' and child != ordered:
+                child = sorted(child, key=str)
+            elif key == 'triples' and value.name == 'BGP':
+                # Sorted with blank nodes masked, so their numbering follows the sorted order
+                child = sorted(child, key=lambda triple: _canonical(triple, _AnyBlankNode()))
+            fields.append(f"{key}={_canonical(child, bnodes, ordered)}")
+        return f"{value.name}({', '.join(fields)})"
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_canonical(child, bnodes, ordered) for child in value) + ']'
+    if isinstance(value, dict):
+        items = sorted((_canonical(key, bnodes, ordered), _canonical(child, bnodes, ordered))
+                       for key, child in value.items())
+        return '{' + ', '.join(f"{key}: {child}" for key, child in items) + '}'
+    if isinstance(value, BNode):
+        # Blank node labels are generated afresh on every parse
+        return bnodes.setdefault(value, f"_:b{len(bnodes)}")
+    if isinstance(value, Identifier):
+        return value.n3()
+    return repr(value)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def canonical_query(query):
+    """
+    Returns a canonical serialization of a query's algebra: queries that differ only in comments,
+    whitespace, keyword case, PREFIX names or the spelling of literals (1 versus "1"^^xsd:integer)
+    have the same canonical form.
+
+    The form does not depend on the hash seed, so keys derived from it stay valid across
+    processes.
+
+    Raises:
+    SparqlSyntaxError if the query does not parse, ImportError without rdflib.
+    """
+    algebra = parse_query(query).algebra
+    # The projection of SELECT * is collected into a set by rdflib; only an explicit one is ordered
+    _, body = split_prologue(strip_comments(query))
+    ordered = None if _WILDCARD_SELECT_PATTERN.match(body) else algebra.get('PV')
+    return _canonical(algebra, {}, ordered)
+
+
+def _main_pattern(node):
+    """
+    Follows the solution modifiers from the top of a query down to its group pattern, returning
+    whether a LIMIT and an aggregation were seen on the way.
+    """
+    limited = aggregated = False
+    while node.name in _TRANSPARENT:
+        if node.name == 'Slice' and node.get('length') is not None:
+            limited = True
+        if node.name in ('Group', 'AggregateJoin'):
+            aggregated = True
+        node = node.p
+    return node, limited, aggregated
+
+
+def _term_variables(term):
+    from rdflib.term import BNode, Variable
+
+    # Blank nodes in a pattern join like variables
+    return {term} if isinstance(term, (Variable, BNode)) else set()
+
+
+def _output_variables(node):
+    """
+    Variables a nested pattern (subquery, VALUES, UNION, ...) shares with its surroundings.
+    """
+    if node.name == 'values':
+        return {variable for row in node.res for variable in row}
+    if node.name == 'ToMultiSet':
+        return _output_variables(node.p)
+    current = node
+    while current.name in _TRANSPARENT:
+        if current.name == 'Project':
+            return set(current.PV)
+        current = current.p
+    return set(node.get('_vars') or ())
+
+
+def _collect_patterns(node, patterns, nested):
+    """
+    Gathers the variable sets of the patterns a group joins (its triples, and each nested
+    pattern as a whole) into patterns; nested groups analysed on their own go to nested as
+    (node, variables bound around them).
+    """
+    name = node.name
+    if name == 'BGP':
+        for triple in node.triples:
+            patterns.append(set().union(*map(_term_variables, triple)))
+    elif name == 'Join':
+        _collect_patterns(node.p1, patterns, nested)
+        _collect_patterns(node.p2, patterns, nested)
+    elif name in ('LeftJoin', 'Minus'):
+        _collect_patterns(node.p1, patterns, nested)
+        nested.append((node.p2, set(node.p1.get('_vars') or ())))
+    elif name in _TRANSPARENT or name == 'Graph':
+        _collect_patterns(node.p, patterns, nested)
+        if name == 'Graph':
+            patterns.append(_term_variables(node.term))
+    elif name == 'Union':
+        nested.append((node.p1, set()))
+        nested.append((node.p2, set()))
+        patterns.append(_output_variables(node))
+    elif name == 'ToMultiSet':
+        if node.p.name != 'values':
+            nested.append((node.p, set()))
+        patterns.append(_output_variables(node))
+    else:
+        patterns.append(set(node.get('_vars') or ()))
+
+
+def _components(patterns, bound):
+    """
+    Splits patterns into groups connected through shared variables. Patterns sharing a variable
+    with bound (the variables of the enclosing group) are connected through it.
+    """
+    groups = [set(bound)] if bound else []
+    for variables in patterns:
+        if not variables:
+            continue  # A ground pattern only filters
+        merged = set(variables)
+        remaining = []
+        for group in groups:
+            if group & merged:
+                merged |= group
+            else:
+                remaining.append(group)
+        groups = remaining + [merged]
+    return groups
+
+
+def _cartesian_products(root):
+    """
+    Returns descriptions of the unconnected parts of every group pattern whose patterns are
+    not all connected.
+    """
+    found = []
+    pending = [(root, set())]
+    while pending:
+        node, bound = pending.pop()
+        patterns = []
+        nested = []
+        _collect_patterns(node, patterns, nested)
+        groups = _components(patterns, bound)
+        if len(groups) > 1:
+            found.append([
+                'the enclosing pattern' if bound and bound <= group else
+                '{' + ', '.join(sorted(variable.n3() for variable in group)) + '}'
+                for group in groups
+            ])
+        pending.extend(nested)
+    return found
+
+
+def _optional_depth(node, depth=0):
+    if not _is_node(node):
+        return depth
+    if node.name == 'LeftJoin':
+        return max(_optional_depth(node.p1, depth), _optional_depth(node.p2, depth + 1))
+    return max([depth] + [_optional_depth(child, depth) for key, child in node.items()
+                          if key != '_vars' and _is_node(child)])
+
+
+def _hazard(code, detail=None):
+    message = HAZARDS[code] if detail is None else f"{HAZARDS[code]} {detail}"
+    return {'code': code, 'message': message}
+
+
+def _algebra_hazards(algebra):
+    hazards = []
+    pattern, limited, aggregated = _main_pattern(algebra.p)
+    if algebra.name == 'SelectQuery' and not limited and not aggregated:
+        hazards.append(_hazard('unbounded'))
+
+    for groups in _cartesian_products(pattern):
+        hazards.append(_hazard('cartesian', f"Unconnected groups: {' and '.join(groups)}."))
+
+    for node in _walk(algebra):
+        if node.name == 'Builtin_REGEX' and _LEADING_WILDCARD_PATTERN.match(str(node.pattern)):
+            hazards.append(_hazard('leading_wildcard', f"Pattern: \"{node.pattern}\"."))
+
+    optionals = sum(1 for node in _walk(algebra) if node.name == 'LeftJoin')
+    depth = _optional_depth(algebra)
+    if optionals > MAX_OPTIONALS or depth > MAX_OPTIONAL_DEPTH:
+        hazards.append(_hazard('optional_heavy', f"{optionals} OPTIONAL blocks, nested {depth} deep."))
+    return hazards
+
+
+def _lexical_hazards(query):
+    _, body = split_prologue(strip_comments(query))
+    if query_form(query) == 'SELECT' and not _LIMIT_PATTERN.search(body) and not _AGGREGATE_PATTERN.search(body):
+        return [_hazard('unbounded')]
+    return []
+
+
+def analyze_query(query):
+    """
+    Parses a query and checks it for cost hazards before it is executed.
+
+    Parameters:
+    - query: The SPARQL query as a string.
+
+    Returns:
+    A dictionary with 'form' ('SELECT', 'CONSTRUCT', 'ASK' or 'DESCRIBE'), 'hazards' (a list of
+    dictionaries with a 'code' from HAZARDS and a 'message'), 'canonical' (see canonical_query;
+    None without rdflib) and 'parsed' (False without rdflib, in which case only a missing query
+    form is rejected and only an unbounded SELECT is detected, lexically).
+
+    Raises:
+    SparqlSyntaxError if the query does not parse.
+    """
+    try:
+        parsed = parse_query(query)
+    except ImportError:
+        form = query_form(query)
+        if form is None:
+            raise SparqlSyntaxError("No SELECT, CONSTRUCT, ASK or DESCRIBE query form found.")
+        return {'form': form, 'hazards': _lexical_hazards(query), 'canonical': None, 'parsed': False}
+    algebra = parsed.algebra
+    return {
+        'form': algebra.name[:-len('Query')].upper(),
+        'hazards': _algebra_hazards(algebra),
+        'canonical': canonical_query(query),
+        'parsed': True,
+    }
@@ -0,0 +1,405 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from query_analysis import SparqlSyntaxError, canonical_query
+
+# Default location of the on-disk cache tier, overridable through the environment
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SPARQL_QUERIER_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'sparql_querier')
+)
+DEFAULT_TTL = 3600  # Seconds a cached result stays valid unless the endpoint has its own TTL
+DEFAULT_MEMORY_ENTRIES = 32
+# Bytes of results the memory tier holds itself; beyond that it only references them weakly
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024
+ENDPOINT_TTL = object()  # Marker for put(): use the endpoint's TTL rather than a per-entry one
+
+# Tokens that matter when normalizing a query: string literals and IRIs are kept verbatim,
+# comments and whitespace runs are collapsed to a single space.
+_TOKEN_PATTERN = re.compile(
+    r'(?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\''
+    r'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<iri><[^<>"{}|^`\\\x00-\x20]*>)'
+    r'|(?P<comment>#[^\n]*)'
+    r'|(?P<space>\s+)'
+)
+_PROLOGUE_PATTERN = re.compile(
+    r'^\s*(?:(?P<prefix>PREFIX\s*(?P<name>[^\s:]*):\s*<(?P<iri>[^>]*)>)|(?P<base>BASE\s*<(?P<base_iri>[^>]*)>))',
+    re.IGNORECASE
+)
+
+
+def normalize_query(query):
+    """
+    Normalizes a SPARQL query so that cosmetic differences do not produce distinct cache entries.
+
+    Comments are removed, whitespace runs are collapsed and the PREFIX declarations are put in a
+    canonical order. String literals and IRIs are left untouched.
+
+    Parameters:
+    - query: The SPARQL query as a string.
+
+    Returns:
+    The normalized query text.
+    """
+    def _replace(match):
+        if match.lastgroup in ('comment', 'space'):
+            return ' '
+        return match.group(0)
+
+    text = _TOKEN_PATTERN.sub(_replace, query).strip()
+
+    # Pull the prologue apart so that reordering PREFIX lines yields the same key
+    prefixes = []
+    bases = []
+    while True:
+        match = _PROLOGUE_PATTERN.match(text)
+        if not match:
+            break
+        if match.group('prefix'):
+            prefixes.append(f"PREFIX {match.group('name')}: <{match.group('iri')}>")
+        else:
+            bases.append(f"BASE <{match.group('base_iri')}>")
+        text = text[match.end():]
+    return ' '.join(bases + sorted(prefixes) + [text.strip()]).strip()
+
+
+def cache_form(query):
+    """
+    Returns the text a query is identified by in cache keys: its canonical algebra (see
+    query_analysis.canonical_query), so that e.g. renamed prefixes or reformatted filters still
+    hit the cache, or its normalized text when it cannot be parsed (or rdflib is not installed).
+    """
+    try:
+        return canonical_query(query)
+    except (ImportError, SparqlSyntaxError):
+        return normalize_query(query)
+
+
+def cache_key(endpoint, query, variant=''):
+    """
+    Builds the cache key for an endpoint/query pair.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - query: The SPARQL query as a string.
+    - variant: Optional tag for results of the same query that are not interchangeable,
+      e.g. CSV results (types inferred from the values) versus typed JSON results.
+
+    Returns:
+    A hex digest identifying the query (see cache_form) against that endpoint.
+    """
+    payload = endpoint.strip() + '\n' + cache_form(query)
+    if variant:
+        payload += '\n' + variant
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _result_bytes(entry):
+    data = entry['result'].get('data')
+    return data.nbytes() if hasattr(data, 'nbytes') else 0
+
+
+class MemoryTier:
+    """
+    Bounded in-memory LRU of cached results.
+
+    The tier holds results up to max_bytes in total (as estimated by ResultSet.nbytes()); the
+    least recently used beyond that are only referenced weakly. They are still served from
+    memory while something else keeps them alive, such as the app's result_store, but the cache
+    never keeps a large result alive on its own: whoever holds it decides when its memory is
+    released. Weakly held results that are gone count as misses (QueryCache then reads the
+    disk tier).
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES, max_bytes=DEFAULT_MEMORY_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0  # Bytes of the results held
+        self._entries = OrderedDict()  # key -> (entry, bytes, weak reference to its data or None if held)
+
+    def get(self, key):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        entry, _, data_ref = item
+        if data_ref is not None:
+            data = data_ref()
+            if data is None:
+                del self._entries[key]
+                return None
+            entry = dict(entry, result=dict(entry['result'], data=data))
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.remove(key)
+        size = _result_bytes(entry)
+        self._entries[key] = (entry, size, None)
+        self.nbytes += size
+        while len(self._entries) > self.max_entries:
+            _, (_, size, data_ref) = self._entries.popitem(last=False)
+            if data_ref is None:
+                self.nbytes -= size
+        # Least recently used first
+        for key, (entry, size, data_ref) in list(self._entries.items()):
+            if self.nbytes <= self.max_bytes:
+                break
+            if data_ref is None:
+                self._weaken(key, entry, size)
+
+    def _weaken(self, key, entry, size):
+        self.nbytes -= size
+        try:
+            data_ref = weakref.ref(entry['result']['data'])
+        except TypeError:
+            del self._entries[key]  # Rows held as a plain list cannot be referenced weakly
+            return
+        self._entries[key] = (dict(entry, result=dict(entry['result'], data=None)), size, data_ref)
+
+    def remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None and item[2] is None:
+            self.nbytes -= item[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+class DiskTier:
+    """
+    Pickled results stored one file per key, evicted least-recently-used once the directory
+    grows past max_bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as handle:
+                entry = pickle.load(handle)
+            os.utime(path)  # Touch the file so eviction sees it as recently used
+            return entry
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Discarding unreadable cache file {path}: {e}")
+            self.remove(key)
+            return None
+
+    def write(self, key, entry):
+        """
+        Pickles an entry into a temporary file next to its final path and returns that path;
+        commit() then moves it into place. Nothing is left behind if pickling fails.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as handle:
+                pickle.dump(entry, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+        return tmp_path
+
+    def commit(self, key, tmp_path):
+        try:
+            os.replace(tmp_path, self._path(key))  # Atomic so concurrent readers never see a partial file
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+
+    @staticmethod
+    def discard(tmp_path):
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, key, entry):
+        self.commit(key, self.write(key, entry))
+        self.evict()
+
+    def remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name, _, _ in self._files():
+            self.remove(name[:-len('.pkl')])
+
+    def _files(self):
+        files = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return files
+        for name in names:
+            if not name.endswith('.pkl'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((name, stat.st_size, stat.st_mtime))
+        return files
+
+    def evict(self):
+        """
+        Removes the least recently used files until the directory fits in max_bytes.
+        """
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        # Oldest access first
+        for name, size, _ in sorted(files, key=lambda item: item[2]):
+            if total <= self.max_bytes:
+                break
+            self.remove(name[:-len('.pkl')])
+            total -= size
+
+
+class QueryCache:
+    """
+    Two-tier cache of query results keyed by endpoint and normalized query text.
+
+    Lookups go to the in-memory LRU first and fall back to the disk tier, promoting disk hits
+    into memory. Entries expire after the TTL configured for their endpoint (None means never),
+    unless they were stored with a TTL of their own.
+    """
+
+    def __init__(self, memory_entries=DEFAULT_MEMORY_ENTRIES, disk_dir=DEFAULT_CACHE_DIR,
+                 disk_max_bytes=DEFAULT_DISK_MAX_BYTES, default_ttl=DEFAULT_TTL, endpoint_ttls=None,
+                 memory_bytes=DEFAULT_MEMORY_BYTES):
+        """
+        Parameters:
+        - memory_entries: Maximum number of results kept in memory.
+        - memory_bytes: Bytes of results the memory tier holds itself (see MemoryTier).
+        - disk_dir: Directory of the on-disk tier, or None to disable it.
+        - disk_max_bytes: Size budget of the on-disk tier.
+        - default_ttl: Lifetime in seconds of cached results (None for no expiry).
+        - endpoint_ttls: Optional mapping of endpoint URL to its own TTL in seconds.
+        """
+        self.memory = MemoryTier(memory_entries, memory_bytes)
+        self.disk = DiskTier(disk_dir, disk_max_bytes) if disk_dir else None
+        self.default_ttl = default_ttl
+        self.endpoint_ttls = dict(endpoint_ttls or {})
+        self._lock = threading.Lock()
+        self._generation = 0  # Incremented by invalidate() and clear(), to drop reads racing them
+        self._pending_writes = {}  # Key -> token of the put() writing its file
+
+    def set_ttl(self, endpoint, ttl):
+        """Sets the TTL in seconds used for results from the given endpoint."""
+        self.endpoint_ttls[endpoint.strip()] = ttl
+
+    def ttl_for(self, endpoint):
+        return self.endpoint_ttls.get(endpoint.strip(), self.default_ttl)
+
+    def _is_fresh(self, entry, endpoint):
+        # A per-entry TTL (possibly None, i.e. permanent) wins over the endpoint's
+        ttl = entry['ttl'] if 'ttl' in entry else self.ttl_for(endpoint)
+        return ttl is None or time.time() - entry['stored_at'] <= ttl
+
+    def get(self, endpoint, query, variant=''):
+        """
+        Returns the cached result for the query, or None on a miss or an expired entry.
+        """
+        key = cache_key(endpoint, query, variant)
+        with self._lock:
+            entry = self.memory.get(key)
+            generation = self._generation
+        if entry is None and self.disk is not None:
+            # Read outside the lock, so lookups from other sessions do not wait for the file
+            entry = self.disk.get(key)
+            with self._lock:
+                if self._generation != generation:
+                    entry = None  # Invalidated while it was being read
+                elif entry is not None:
+                    # A result stored meanwhile is newer than the file
+                    entry = self.memory.get(key) or entry
+                    self.memory.put(key, entry)
+        if entry is None:
+            return None
+        if not self._is_fresh(entry, endpoint):
+            self.invalidate(endpoint, query, variant)
+            return None
+        return entry['result']
+
+    def put(self, endpoint, query, result, variant='', ttl=ENDPOINT_TTL):
+        """
+        Stores a result for the query in both tiers.
+
+        ttl optionally gives this entry its own lifetime in seconds (None for no expiry), e.g. for
+        results over a time range that can no longer change. The result is pickled for the disk
+        tier without holding the cache's lock; the lock only covers moving the file into place.
+        """
+        key = cache_key(endpoint, query, variant)
+        entry = {'endpoint': endpoint, 'stored_at': time.time(), 'result': result}
+        if ttl is not ENDPOINT_TTL:
+            entry['ttl'] = ttl
+        with self._lock:
+            self.memory.put(key, entry)
+            if self.disk is None:
+                return
+            token = self._pending_writes[key] = object()
+        try:
+            tmp_path = self.disk.write(key, entry)
+            with self._lock:
+                # Skipped if the key was invalidated or stored again while the file was written
+                current = self._pending_writes.get(key) is token
+                if current:
+                    del self._pending_writes[key]
+                    self.disk.commit(key, tmp_path)
+            if not current:
+                self.disk.discard(tmp_path)
+            self.disk.evict()
+        except Exception as e:
+            with self._lock:
+                if self._pending_writes.get(key) is token:
+                    del self._pending_writes[key]
+            logging.warning(f"Could not write query result to the disk cache: {e}")
+
+    def invalidate(self, endpoint, query, variant=''):
+        """
+        Drops any cached result for the query.
+        """
+        key = cache_key(endpoint, query, variant)
+        with self._lock:
+            self._generation += 1
+            self._pending_writes.pop(key, None)
+            self.memory.remove(key)
+            if self.disk is not None:
+                self.disk.remove(key)
+
+    def clear(self):
+        """
+        Empties both tiers.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pending_writes.clear()
+            self.memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+
+# Process-wide cache shared by every call to execute_query
+default_cache = QueryCache()
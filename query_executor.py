@@ -1,69 +1,315 @@
-from SPARQLWrapper import SPARQLWrapper, JSON
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import time  # Import the time module
+from http_transport import get_transport
+from local_store import is_local_endpoint, open_store, store_revision
+from metrics import TimedStream, default_registry
+from query_cache import ENDPOINT_TTL, default_cache
+from query_rewriting import paginate_query, query_form
+from results_parser import parse_delimited_results, parse_json_results
+from result_set import ResultSet
 
 # Setup basic configuration for logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def execute_query(endpoint, query):
+# Paged mode defaults: windows no larger than the common 10k public-endpoint cap, a few in flight
+DEFAULT_PAGE_SIZE = 10000
+DEFAULT_MAX_WORKERS = 4
+
+# Accept headers per requested results format. CSV and TSV list JSON as a fallback so endpoints
+# without support for them still answer; the response Content-Type decides how it is parsed.
+RESULTS_FORMATS = {
+    'json': 'application/sparql-results+json',
+    'tsv': 'text/tab-separated-values, application/sparql-results+json;q=0.5',
+    'csv': 'text/csv, application/sparql-results+json;q=0.5',
+}
+
+def execute_query(endpoint, query, use_cache=True, refresh=False, cache=None,
+                  paged=False, page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS, timeout=None,
+                  results_format='json', cache_ttl=ENDPOINT_TTL, progress=None):
     """
     Executes a SPARQL query against a specified endpoint and returns the results along with execution time.
+
+    Successful results are cached by endpoint and normalized query text, so repeated runs of the
+    same query are answered without contacting the endpoint until the cached entry expires.
     
     Parameters:
-    - endpoint: The SPARQL endpoint URL as a string.
+    - endpoint: The SPARQL endpoint URL as a string, or 'local:<directory>' to query a local
+      store of loaded RDF dumps (see local_store.py).
     - query: The SPARQL query as a string.
+    - use_cache: Whether to read from and write to the result cache.
+    - refresh: Skip the cache lookup and re-run the query, replacing any cached result.
+    - cache: The QueryCache to use (defaults to the process-wide cache).
+    - paged, page_size, max_workers: Windowed, concurrent fetching; see iter_query_batches.
+    - timeout: Optional read timeout in seconds for each HTTP request (transport default otherwise).
+    - results_format: Wire format to request: 'json' (default), 'tsv' (compact, keeps datatypes)
+      or 'csv' (most compact; numbers, booleans and dates are inferred from the values). See
+      RESULTS_FORMATS.
+    - cache_ttl: Lifetime in seconds of the cached result (None for no expiry); the endpoint's
+      TTL by default.
+    - progress: Optional object receiving add_bytes(n) and add_rows(n) while results arrive, whose
+      check() raises QueryCancelled to stop the query (see jobs.JobProgress).
     
     Returns:
     A dictionary with the following keys:
     - 'success': A boolean indicating if the query was executed successfully.
     - 'columns': A list of column names from the query results (empty if unsuccessful).
-    - 'data': A list of rows with each row being a list of values corresponding to the columns (empty if unsuccessful or no results).
+    - 'data': A ResultSet with typed columns (see result_set.py); it also behaves as a list of rows (empty if unsuccessful or no results).
     - 'error': An error message if the query execution was unsuccessful (None if successful).
     - 'execution_time': The execution time of the query in seconds.
+    - 'cached': True if the result was served from the cache.
+    - 'format': The wire format(s) the endpoint answered with.
+    - 'bytes_received': Size of the (decompressed) response bodies.
+    - 'parse_time': Seconds spent reading and parsing the response bodies.
+    - 'stages': Seconds per stage ('cache', 'ttfb', 'transfer', 'parse', 'convert'); see metrics.py.
+    - 'trace_id': Identifier of the query's trace in metrics.default_registry, for timing later
+      stages (DataFrame build, rendering, export) against the same query.
+    """
+    cache = cache if cache is not None else default_cache
+    # CSV results lose term types and language tags, so they are not interchangeable with typed ones
+    cache_variant = 'csv' if results_format == 'csv' else ''
+    if is_local_endpoint(endpoint):
+        # Results of a local store are valid until its next load
+        cache_variant = f"local-r{store_revision(endpoint)}"
+    start_time = time.perf_counter()  # Monotonic clock: immune to system clock adjustments
+    trace = default_registry.start(endpoint, query)
+    if use_cache and not refresh:
+        with trace.span('cache'):
+            cached = cache.get(endpoint, query, cache_variant)
+        if cached is not None:
+            result = dict(cached, cached=True, execution_time=time.perf_counter() - start_time,
+                          trace_id=trace.id, stages=dict(trace.stages))
+            trace.count('rows', len(result['data']))
+            if progress is not None:
+                progress.add_rows(len(result['data']))
+            default_registry.finish(trace, total=result['execution_time'], cached=True, success=True)
+            return result
+
+    result = _run_query(endpoint, query, start_time, trace=trace, paged=paged, page_size=page_size,
+                        max_workers=max_workers, timeout=timeout, results_format=results_format, progress=progress)
+    result['trace_id'] = trace.id
+    result['stages'] = dict(trace.stages)
+    default_registry.finish(trace, total=result['execution_time'], cached=False, success=result['success'],
+                            error=result['error'])
+    if use_cache and result['success']:
+        cache.put(endpoint, query, result, cache_variant, ttl=cache_ttl)
+    return result
+
+def reserve_connections(endpoint, queries, paged=False, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Sizes the connection pool of an endpoint for a caller running several queries against it at
+    once (see http_transport.get_transport). A paged query uses up to max_workers connections.
+    Local stores need none.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - queries: Queries the caller runs at the same time.
+    - paged, max_workers: The execute_query options of those queries.
+    """
+    if not is_local_endpoint(endpoint):
+        get_transport(endpoint, pool_size=queries * (max_workers if paged else 1))
+
+class NoResultsError(Exception):
+    """Raised when the endpoint response carries no result bindings."""
+
+class QueryCancelled(Exception):
+    """Raised by a progress object's check() to stop a query that was cancelled or timed out."""
+
+def _response_format(response):
+    content_type = response.headers.get('Content-Type', '').lower()
+    if 'tab-separated' in content_type:
+        return 'tsv'
+    if 'csv' in content_type:
+        return 'csv'
+    return 'json'
+
+def _fetch_result_set(endpoint, query, timeout=None, results_format='json', trace=None, progress=None):
+    """
+    Sends a single query to the endpoint and returns its results as a ResultSet.
+
+    The request goes through the endpoint's pooled transport (keep-alive, compression, retries).
+    A JSON response is parsed incrementally off the HTTP stream into column buffers, so the
+    full bindings tree is never built; the buffers are then converted into typed columns using
+    the datatypes reported in the bindings. CSV/TSV responses are read by pandas' C parser.
+
+    With a metrics Trace, the time to first byte, the time spent waiting on the body (transfer),
+    parsing and column conversion are recorded separately, along with bytes and rows.
+
+    With a progress object, bytes are reported as they are read and the query stops with
+    QueryCancelled at the first read after a cancellation; the connection is then closed rather
+    than drained, so the rest of the body is not downloaded.
     """
-    start_time = time.time()  # Capture start time
+    if progress is not None:
+        progress.check()
+    if is_local_endpoint(endpoint):
+        return _fetch_local_result_set(endpoint, query, trace, progress)
+    if query_form(query) != 'SELECT':
+        results_format = 'json'  # CSV/TSV only describe SELECT results
+    transport = get_transport(endpoint)
+    request_start = time.perf_counter()
+    response = transport.query(query, accept=RESULTS_FORMATS[results_format],
+                               timeout=(transport.timeout[0], timeout) if timeout else None)
+    received_format = _response_format(response)
+    parse_start = time.perf_counter()
+    body = TimedStream(response.raw, progress)
+    cancelled = False
     try:
-        sparql = SPARQLWrapper(endpoint)
-        sparql.setQuery(query)
-        sparql.setReturnFormat(JSON)
-        results = sparql.query().convert()
-        end_time = time.time()  # Capture end time after query execution
-
-        if 'results' in results and 'bindings' in results['results']:
-            rows = results['results']['bindings']
-            if rows:
-                columns = list(results['head']['vars'])
-                data = [[row[col]['value'] if col in row else "" for col in columns] for row in rows]
-                return {
-                    'success': True, 
-                    'columns': columns, 
-                    'data': data, 
-                    'error': None,
-                    'execution_time': end_time - start_time  # Calculate execution time
-                }
-            else:
-                return {
-                    'success': True, 
-                    'columns': [], 
-                    'data': [], 
-                    'error': None,
-                    'execution_time': end_time - start_time
-                }
+        if received_format == 'json':
+            parsed = parse_json_results(body)
         else:
-            return {
-                'success': False, 
-                'columns': [], 
-                'data': [], 
-                'error': 'No results returned from the query.',
-                'execution_time': end_time - start_time
-            }
+            parsed = parse_delimited_results(body, received_format)
+    except QueryCancelled:
+        cancelled = True
+        raise
+    finally:
+        if cancelled:
+            response.close()
+        else:
+            transport.release(response)
+
+    convert_start = time.perf_counter()
+    if received_format == 'json':
+        if not parsed['has_bindings']:
+            raise NoResultsError('No results returned from the query.')
+        result_set = ResultSet.from_buffers(parsed['buffers'], parsed['columns'])
+        convert_time = time.perf_counter() - convert_start
+    else:
+        result_set = parsed['result_set']
+        convert_time = parsed['convert_time']
+    end = time.perf_counter()
+    result_set.stats = {
+        'format': received_format,
+        'bytes_received': parsed['bytes_read'],
+        'parse_time': end - parse_start,
+    }
+    if trace is not None:
+        trace.add('ttfb', parse_start - request_start)
+        trace.add('transfer', body.read_time)
+        trace.add('parse', max(0.0, convert_start - parse_start - body.read_time
+                               - (convert_time if received_format != 'json' else 0.0)))
+        trace.add('convert', convert_time)
+        trace.count('requests', 1)
+        trace.count('bytes', parsed['bytes_read'])
+        trace.count('rows', len(result_set))
+    if progress is not None:
+        progress.add_rows(len(result_set))
+    return result_set
+
+def _fetch_local_result_set(endpoint, query, trace=None, progress=None):
+    """
+    Evaluates a query over a local store (see local_store.py) and returns its results as a
+    ResultSet. The evaluation time is recorded as the 'evaluate' stage.
+    """
+    evaluate_start = time.perf_counter()
+    parsed = open_store(endpoint).query(query, progress)
+    convert_start = time.perf_counter()
+    if not parsed['has_bindings']:
+        raise NoResultsError('No results returned from the query.')
+    result_set = ResultSet.from_buffers(parsed['buffers'], parsed['columns'])
+    end = time.perf_counter()
+    result_set.stats = {'format': 'local', 'bytes_received': 0, 'parse_time': 0.0}
+    if trace is not None:
+        trace.add('evaluate', convert_start - evaluate_start)
+        trace.add('convert', end - convert_start)
+        trace.count('requests', 1)
+        trace.count('rows', len(result_set))
+    if progress is not None:
+        progress.add_rows(len(result_set))
+    return result_set
+
+def iter_query_batches(endpoint, query, paged=False, page_size=DEFAULT_PAGE_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+                       timeout=None, results_format='json', trace=None, progress=None):
+    """
+    Executes a SPARQL query and yields its results as batches of rows.
+
+    In paged mode a SELECT query is rewritten into ORDER BY/LIMIT/OFFSET windows of page_size rows,
+    and up to max_workers windows are fetched concurrently. Batches are still yielded in result order;
+    fetching stops at the first window that comes back short. page_size should not exceed the
+    endpoint's own result cap, otherwise a capped window is mistaken for the last one.
+    Other query forms, queries to a local store, and paged=False, are sent as a single request.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - query: The SPARQL query as a string.
+    - paged: Whether to split a SELECT query into windows.
+    - page_size: Number of rows per window.
+    - max_workers: Maximum number of windows requested at the same time.
+    - timeout: Optional read timeout in seconds for each HTTP request.
+    - results_format: Wire format to request ('json', 'tsv' or 'csv').
+    - trace: Optional metrics Trace collecting the stage timings of every request.
+    - progress: Optional progress object (see execute_query) shared by every request.
+
+    Yields:
+    ResultSet batches. The first batch is always yielded, even when it holds no rows.
+    """
+    if not paged or is_local_endpoint(endpoint) or query_form(query) != 'SELECT':
+        yield _fetch_result_set(endpoint, query, timeout, results_format, trace, progress)
+        return
+
+    reserve_connections(endpoint, 1, paged=True, max_workers=max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending = {}
+    next_page = 0
+
+    def submit_next():
+        nonlocal next_page
+        page_query = paginate_query(query, page_size, next_page)
+        if page_query is not None:
+            pending[next_page] = pool.submit(_fetch_result_set, endpoint, page_query, timeout, results_format, trace,
+                                             progress)
+            next_page += 1
+
+    try:
+        for _ in range(max_workers):
+            submit_next()
+        page = 0
+        while page in pending:
+            batch = pending.pop(page).result()
+            if len(batch) or page == 0:
+                yield batch
+            if len(batch) < page_size:
+                break
+            page += 1
+            submit_next()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _run_query(endpoint, query, start_time, **fetch_options):
+    """
+    Collects every batch of the query into the execute_query result dictionary.
+    """
+    try:
+        data = ResultSet.concat(iter_query_batches(endpoint, query, **fetch_options))
+        end_time = time.perf_counter()  # Capture end time after query execution
+
+        return {
+            'success': True, 
+            'columns': data.columns if len(data) else [], 
+            'data': data, 
+            'error': None,
+            'execution_time': end_time - start_time,  # Calculate execution time
+            'cached': False,
+            'format': data.stats.get('format'),
+            'bytes_received': data.stats.get('bytes_received', 0),
+            'parse_time': data.stats.get('parse_time', 0.0)
+        }
+    except (NoResultsError, QueryCancelled) as e:
+        return {
+            'success': False, 
+            'columns': [], 
+            'data': [], 
+            'error': str(e),
+            'execution_time': time.perf_counter() - start_time,
+            'cached': False
+        }
     except Exception as e:
-        end_time = time.time()  # Ensure end time is captured even on exception
+        end_time = time.perf_counter()  # Ensure end time is captured even on exception
         logging.error(f"Query execution failed: {str(e)}")
         return {
             'success': False, 
             'columns': [], 
             'data': [], 
             'error': str(e),
-            'execution_time': end_time - start_time
+            'execution_time': end_time - start_time,
+            'cached': False
         }
@@ -0,0 +1,213 @@
+import datetime
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from query_cache import ENDPOINT_TTL
+from query_executor import DEFAULT_MAX_WORKERS, execute_query, reserve_connections
+from result_set import ResultSet
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+PARTITIONS = ('day', 'month', 'year')
+DEFAULT_PARTITION_WORKERS = 4
+# Notices can be published days after their dispatch date, so a partition is only treated as
+# final once this many days have passed since it ended
+DEFAULT_SETTLE_DAYS = 7
+
+# {{name}} placeholders; the double braces cannot occur in SPARQL syntax
+_PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+def sparql_literal(value):
+    """
+    Renders a Python value as a SPARQL term: dates and datetimes as typed literals, numbers and
+    booleans bare, anything else as an escaped string literal.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, datetime.datetime):
+        return f'"{value.isoformat()}"^^<{XSD}dateTime>'
+    if isinstance(value, datetime.date):
+        return f'"{value.isoformat()}"^^<{XSD}date>'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return json.dumps(str(value), ensure_ascii=False)
+
+
+def template_parameters(query):
+    """
+    Returns the names of the {{name}} placeholders in a query, in order of appearance.
+    """
+    names = []
+    for name in _PLACEHOLDER_PATTERN.findall(query):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def render_template(query, **values):
+    """
+    Substitutes every {{name}} placeholder with the SPARQL rendering of values[name].
+
+    Raises:
+    KeyError if a placeholder has no value.
+    """
+    def _replace(match):
+        name = match.group(1)
+        if name not in values:
+            raise KeyError(f"No value for template parameter {{{{{name}}}}}.")
+        return sparql_literal(values[name])
+    return _PLACEHOLDER_PATTERN.sub(_replace, query)
+
+
+class QueryTemplate:
+    """
+    A query with {{name}} placeholders, optionally restricted to a date range through {{start}}
+    (inclusive) and {{end}} (exclusive) and splittable into partitions of that range.
+
+    Parameters:
+    - query: The query text.
+    - defaults: Default parameter values, e.g. {'start': date(2022, 1, 1), 'end': date(2023, 1, 1)}.
+    - partition: Partition size for incremental runs ('day', 'month' or 'year'), or None.
+    """
+
+    def __init__(self, query, defaults=None, partition=None):
+        if partition is not None and partition not in PARTITIONS:
+            raise ValueError(f"Unsupported partition {partition!r}; expected one of {', '.join(PARTITIONS)}.")
+        self.query = query
+        self.defaults = dict(defaults or {})
+        self.partition = partition
+
+    @property
+    def parameters(self):
+        return template_parameters(self.query)
+
+    @property
+    def is_ranged(self):
+        return {'start', 'end'} <= set(self.parameters)
+
+    def render(self, **values):
+        """
+        Returns the query with the given values (or the defaults) substituted. For a range, the
+        year and month of the start are available as {{year}} and {{month}}.
+        """
+        values = {**self.defaults, **values}
+        if isinstance(values.get('start'), datetime.date):
+            values.setdefault('year', values['start'].year)
+            values.setdefault('month', values['start'].month)
+        return render_template(self.query, **values)
+
+
+def _next_boundary(day, partition):
+    if partition == 'day':
+        return day + datetime.timedelta(days=1)
+    if partition == 'month':
+        return datetime.date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return datetime.date(day.year + 1, 1, 1)
+
+
+def partition_ranges(start, end, partition='month'):
+    """
+    Splits [start, end) into consecutive [start, end) ranges aligned to calendar days, months or
+    years. The first and last range are clipped to the requested bounds.
+    """
+    ranges = []
+    current = start
+    while current < end:
+        boundary = min(_next_boundary(current, partition), end)
+        ranges.append((current, boundary))
+        current = boundary
+    return ranges
+
+
+def is_closed(range_end, today=None, settle_days=DEFAULT_SETTLE_DAYS):
+    """
+    Whether a range ending (exclusively) at range_end can no longer receive new data.
+    """
+    today = today or datetime.date.today()
+    return range_end + datetime.timedelta(days=settle_days) <= today
+
+
+def run_partitioned(endpoint, template, start=None, end=None, refresh=False, refresh_closed=False,
+                    settle_days=DEFAULT_SETTLE_DAYS, max_workers=DEFAULT_PARTITION_WORKERS, today=None,
+                    **execute_options):
+    """
+    Runs a ranged template once per partition of [start, end) and merges the results.
+
+    Closed partitions (see is_closed) are cached without expiry: they are only queried again if
+    the cache evicts them to stay within its size limits. Open partitions use the normal cache
+    TTL. With refresh=True only the open partitions are re-queried, which makes a daily refresh
+    touch just the current month.
+    The partition results are concatenated in range order, so the template should group by a
+    key that includes the partition (e.g. year and month) for the merged rows to stay distinct.
+
+    Parameters:
+    - endpoint: The SPARQL endpoint URL as a string.
+    - template: A QueryTemplate with {{start}} and {{end}} placeholders.
+    - start, end: The date range (defaults from the template).
+    - refresh: Re-query the open partitions instead of using their cached results.
+    - refresh_closed: Re-query the closed partitions as well, e.g. after a backfill.
+    - settle_days: Days after its end before a partition counts as closed.
+    - max_workers: Partitions queried at the same time.
+    - today: Reference date for closing partitions (today by default).
+    - execute_options: Passed on to execute_query (e.g. results_format, paged, timeout).
+
+    Returns:
+    An execute_query-style dictionary ('success', 'columns', 'data', 'error', 'execution_time',
+    'cached', 'format', 'bytes_received', 'parse_time', 'stages') plus 'partitions': one
+    dictionary per range with 'start', 'end', 'closed', 'cached', 'rows' and 'execution_time'.
+    """
+    start_time = time.perf_counter()
+    start = start if start is not None else template.defaults.get('start')
+    end = end if end is not None else template.defaults.get('end')
+    if not template.is_ranged or start is None or end is None:
+        raise ValueError("The template needs {{start}} and {{end}} placeholders and a date range.")
+
+    def run(bounds):
+        range_start, range_end = bounds
+        closed = is_closed(range_end, today, settle_days)
+        query = template.render(start=range_start, end=range_end)
+        return closed, execute_query(endpoint, query, refresh=refresh_closed if closed else refresh,
+                                     cache_ttl=None if closed else ENDPOINT_TTL, **execute_options)
+
+    ranges = partition_ranges(start, end, template.partition or 'month')
+    reserve_connections(endpoint, min(max_workers, len(ranges)), paged=execute_options.get('paged', False),
+                        max_workers=execute_options.get('max_workers', DEFAULT_MAX_WORKERS))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        outcomes = list(pool.map(run, ranges))
+
+    partitions = []
+    parts = []
+    stages = {}
+    error = None
+    for (range_start, range_end), (closed, result) in zip(ranges, outcomes):
+        partitions.append({
+            'start': range_start,
+            'end': range_end,
+            'closed': closed,
+            'cached': result['cached'],
+            'rows': len(result['data']),
+            'execution_time': result['execution_time'],
+        })
+        if not result['success']:
+            error = error or f"Partition {range_start} to {range_end}: {result['error']}"
+            continue
+        parts.append(result['data'])
+        for stage, seconds in result.get('stages', {}).items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    data = ResultSet.concat(parts) if parts else ResultSet([])
+    return {
+        'success': error is None,
+        'columns': data.columns if len(data) else [],
+        'data': data,
+        'error': error,
+        'execution_time': time.perf_counter() - start_time,
+        'cached': all(partition['cached'] for partition in partitions),
+        'format': data.stats.get('format'),
+        'bytes_received': sum(part.stats.get('bytes_received', 0) for part in parts),
+        'parse_time': sum(part.stats.get('parse_time', 0.0) for part in parts),
+        'stages': stages,
+        'partitions': partitions,
+    }
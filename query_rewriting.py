@@ -0,0 +1,265 @@
+import re
+
+# String literals and IRIs are opaque to the rewriting helpers below: a '}' or '#' inside them
+# must not be mistaken for query structure.
+_LEXICAL_PATTERN = re.compile(
+    r'(?P<string>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\''
+    r'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')'
+    r'|(?P<iri><[^<>"{}|^`\\\x00-\x20]*>)'
+    r'|(?P<comment>#[^\n]*)'
+)
+_PROLOGUE_PATTERN = re.compile(
+    r'\s*(?:PREFIX\s*[^\s:]*:\s*<[^>]*>|BASE\s*<[^>]*>)',
+    re.IGNORECASE
+)
+_PREFIX_DECLARATION_PATTERN = re.compile(r'PREFIX\s*([^\s:]*):\s*<([^>]*)>', re.IGNORECASE)
+_QUERY_FORM_PATTERN = re.compile(r'\b(SELECT|ASK|CONSTRUCT|DESCRIBE)\b', re.IGNORECASE)
+_VARIABLE_PATTERN = re.compile(r'[?$]([A-Za-z0-9_·À-￿]+)')
+# FROM and FROM NAMED clauses; IRIs are matched in their masked form (see _mask_literals)
+_DATASET_CLAUSE_PATTERN = re.compile(r'\bFROM\s+(?:NAMED\s+)?(?:<[^>]*>|[^\s{]+)', re.IGNORECASE)
+_VALUES_PATTERN = re.compile(r'\bVALUES\b', re.IGNORECASE)
+_MODIFIER_PATTERNS = {
+    'limit': re.compile(r'\bLIMIT\s+(\d+)', re.IGNORECASE),
+    'offset': re.compile(r'\bOFFSET\s+(\d+)', re.IGNORECASE),
+    'order_by': re.compile(r'\bORDER\s+BY\b', re.IGNORECASE),
+}
+
+
+def strip_comments(query):
+    """
+    Removes '#' comments from a SPARQL query, leaving string literals and IRIs untouched.
+
+    Parameters:
+    - query: The SPARQL query as a string.
+
+    Returns:
+    The query text without comments.
+    """
+    return _LEXICAL_PATTERN.sub(lambda m: '' if m.lastgroup == 'comment' else m.group(0), query)
+
+
+def _mask_literals(text):
+    """
+    Returns a copy of text where string literals and IRIs are replaced by filler characters of the
+    same length, so structural searches can run on it and positions map back to the original.
+    """
+    return _LEXICAL_PATTERN.sub(lambda m: m.group(0)[0] + '_' * (len(m.group(0)) - 2) + m.group(0)[-1], text)
+
+
+def split_prologue(query):
+    """
+    Splits a SPARQL query into its prologue (PREFIX and BASE declarations) and the query body.
+
+    Parameters:
+    - query: The SPARQL query as a string, without comments.
+
+    Returns:
+    A tuple (prologue, body) of strings.
+    """
+    position = 0
+    while True:
+        match = _PROLOGUE_PATTERN.match(query, position)
+        if not match:
+            break
+        position = match.end()
+    return query[:position].strip(), query[position:].strip()
+
+
+def declared_prefixes(query):
+    """
+    Returns the PREFIX declarations of a SPARQL query as a dictionary of prefix name to IRI.
+    """
+    prologue, _ = split_prologue(strip_comments(query))
+    return dict(_PREFIX_DECLARATION_PATTERN.findall(prologue))
+
+
+def query_form(query):
+    """
+    Returns the query form ('SELECT', 'ASK', 'CONSTRUCT' or 'DESCRIBE') of a SPARQL query, or None.
+    """
+    _, body = split_prologue(strip_comments(query))
+    match = _QUERY_FORM_PATTERN.search(_mask_literals(body))
+    return match.group(1).upper() if match else None
+
+
+def _top_level_matches(pattern, masked):
+    """
+    Yields the matches of pattern in a masked query body that lie outside every group, i.e. in
+    the query's own clauses rather than in its WHERE clause or a subquery.
+    """
+    for match in pattern.finditer(masked):
+        if masked.count('{', 0, match.start()) == masked.count('}', 0, match.start()):
+            yield match
+
+
+def _split_solution_modifiers(body):
+    """
+    Splits a query body into the part ending with the closing brace of the WHERE clause, the
+    trailing solution modifiers (GROUP BY, HAVING, ORDER BY, LIMIT, OFFSET) and the trailing
+    VALUES block ('' if the query has none).
+    """
+    masked = _mask_literals(body)
+    values_start = next((match.start() for match in _top_level_matches(_VALUES_PATTERN, masked)), len(body))
+    end = masked.rfind('}', 0, values_start)
+    if end < 0:
+        raise ValueError("The query has no WHERE clause.")
+    return body[:end + 1], body[end + 1:values_start].strip(), body[values_start:].strip()
+
+
+def _split_dataset_clauses(body):
+    """
+    Removes the FROM and FROM NAMED clauses from a query body.
+
+    Returns:
+    A tuple (body without the clauses, the clauses joined by spaces).
+    """
+    clauses = []
+    kept = []
+    position = 0
+    for match in _top_level_matches(_DATASET_CLAUSE_PATTERN, _mask_literals(body)):
+        clauses.append(body[match.start():match.end()])
+        kept.append(body[position:match.start()])
+        position = match.end()
+    kept.append(body[position:])
+    return ''.join(kept), ' '.join(clauses)
+
+
+def projected_variables(query):
+    """
+    Returns the variable names projected by a SELECT query, in order.
+
+    For SELECT * every variable mentioned in the query body is returned.
+    """
+    _, body = split_prologue(strip_comments(query))
+    masked = _mask_literals(_split_dataset_clauses(body)[0])
+    select = re.search(r'\bSELECT\b(?:\s+(?:DISTINCT|REDUCED)\b)?(.*?)(?:\bWHERE\b|\{)', masked,
+                       re.IGNORECASE | re.DOTALL)
+    if not select:
+        return []
+    projection = select.group(1)
+    if projection.strip() == '*':
+        scope = masked[select.end():]
+    else:
+        scope = _projection_targets(projection)
+    names = []
+    for name in _VARIABLE_PATTERN.findall(scope):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _projection_targets(projection):
+    """
+    Reduces a SELECT projection to its output variables: plain variables are kept and each
+    parenthesised (expression AS ?var) is replaced by its ?var.
+    """
+    targets = []
+    depth = 0
+    start = 0
+    for position, char in enumerate(projection):
+        if char == '(':
+            if depth == 0:
+                start = position
+            depth += 1
+        elif char == ')' and depth:
+            depth -= 1
+            if depth == 0:
+                alias = re.search(r'\bAS\s+([?$]\w+)\s*$', projection[start + 1:position], re.IGNORECASE)
+                if alias:
+                    targets.append(alias.group(1))
+        elif depth == 0 and char in '?$':
+            match = _VARIABLE_PATTERN.match(projection, position)
+            if match:
+                targets.append(match.group(0))
+    return ' '.join(targets)
+
+
+def paginate_query(query, page_size, page):
+    """
+    Rewrites a SELECT query so that it returns a single window of its results.
+
+    An ORDER BY over the projected variables is added when the query has none, so that consecutive
+    windows partition the result deterministically. An existing LIMIT/OFFSET is honoured: windows
+    never reach past it. A trailing VALUES block stays last, after the new modifiers.
+
+    Parameters:
+    - query: The SPARQL SELECT query as a string.
+    - page_size: Number of rows per window.
+    - page: Zero-based index of the window.
+
+    Returns:
+    The rewritten query, or None if the window lies entirely past the query's own LIMIT.
+    """
+    prologue, body = split_prologue(strip_comments(query))
+    head, modifiers, values = _split_solution_modifiers(body)
+
+    limit_match = _MODIFIER_PATTERNS['limit'].search(modifiers)
+    offset_match = _MODIFIER_PATTERNS['offset'].search(modifiers)
+    base_offset = int(offset_match.group(1)) if offset_match else 0
+    window_offset = page * page_size
+    window_limit = page_size
+    if limit_match:
+        remaining = int(limit_match.group(1)) - window_offset
+        if remaining <= 0:
+            return None
+        window_limit = min(page_size, remaining)
+
+    modifiers = _MODIFIER_PATTERNS['limit'].sub('', modifiers)
+    modifiers = _MODIFIER_PATTERNS['offset'].sub('', modifiers).strip()
+    if not _MODIFIER_PATTERNS['order_by'].search(modifiers):
+        variables = projected_variables(query)
+        if variables:
+            modifiers = (modifiers + ' ORDER BY ' + ' '.join('?' + name for name in variables)).strip()
+
+    rewritten = f"{head}\n{modifiers}\nLIMIT {window_limit}\nOFFSET {base_offset + window_offset}"
+    if values:
+        rewritten += f"\n{values}"
+    return f"{prologue}\n{rewritten}" if prologue else rewritten
+
+
+AGGREGATES = ('COUNT', 'SUM', 'AVG')
+
+
+def aggregate_query(query, group_by, value=None, aggregate='COUNT'):
+    """
+    Wraps a SELECT query in an outer query that groups its solutions by one variable and
+    aggregates another, so the endpoint returns one row per group instead of every raw row.
+
+    The original query (including its own modifiers such as LIMIT and a trailing VALUES block)
+    becomes a subquery, so the aggregate covers exactly the rows the query would have returned.
+    Subqueries cannot have FROM or FROM NAMED clauses, so those move to the outer query, which
+    evaluates the subquery over the same dataset. Groups are ordered by descending aggregate.
+
+    Parameters:
+    - query: The SPARQL SELECT query as a string.
+    - group_by: Name of the projected variable to group by (without '?').
+    - value: Name of the projected variable to aggregate; COUNT without a value counts rows.
+    - aggregate: One of AGGREGATES.
+
+    Returns:
+    A tuple (rewritten query, name of the aggregate variable).
+    """
+    aggregate = aggregate.upper()
+    if aggregate not in AGGREGATES:
+        raise ValueError(f"Unsupported aggregate {aggregate!r}; expected one of {', '.join(AGGREGATES)}.")
+    if query_form(query) != 'SELECT':
+        raise ValueError("Only SELECT queries can be aggregated.")
+    if value is None and aggregate != 'COUNT':
+        raise ValueError(f"{aggregate} needs a variable to aggregate.")
+    variables = projected_variables(query)
+    for name in (group_by, value):
+        if name is not None and name not in variables:
+            raise ValueError(f"?{name} is not projected by the query.")
+
+    prologue, body = split_prologue(strip_comments(query))
+    body, dataset = _split_dataset_clauses(body)
+    # The alias must not clash with a variable already in scope of the subquery
+    alias = f"{aggregate.lower()}_{value or 'rows'}"
+    while alias in variables or alias == group_by:
+        alias += '_'
+    argument = f"?{value}" if value is not None else '*'
+    dataset = f"{dataset}\n" if dataset else ''
+    rewritten = (f"SELECT ?{group_by} ({aggregate}({argument}) AS ?{alias})\n{dataset}"
+                 f"WHERE {{\n{{\n{body}\n}}\n}}\n"
+                 f"GROUP BY ?{group_by}\nORDER BY DESC(?{alias})")
+    return (f"{prologue}\n{rewritten}" if prologue else rewritten), alias
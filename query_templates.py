@@ -1,3 +1,9 @@
+import datetime
+
+from query_partitioning import QueryTemplate
+
+DEFAULT_RANGE = {'start': datetime.date(2022, 1, 1), 'end': datetime.date(2023, 1, 1)}
+
 # Predefined query templates
 query_templates = {
     "Select a template": "",
@@ -17,8 +23,14 @@ SELECT (COUNT(DISTINCT ?notice) AS ?numberOfNotices)
 WHERE {
     ?notice a epo:Notice .
 }
-""",
-    "Count the number of notices per month":"""
+"""
+}
+
+# Templates over a date range. {{start}} (inclusive) and {{end}} (exclusive) are bound when the
+# query runs, either once for the whole range or once per month in incremental mode (see
+# query_partitioning.py); results are grouped by year and month so the partitions merge cleanly.
+parameterized_templates = {
+    "Count the number of notices per month": QueryTemplate("""
 PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
 PREFIX epo: <http://data.europa.eu/a4g/ontology#>
 PREFIX cccev: <http://data.europa.eu/m8g/>
@@ -30,20 +42,16 @@ PREFIX dct: <http://purl.org/dc/terms/>
 PREFIX dc: <http://purl.org/dc/elements/1.1/>
 PREFIX euvoc: <http://publications.europa.eu/ontology/euvoc#>
 
-SELECT ?monthName (COUNT(DISTINCT ?notice) AS ?numberOfNotices)
+SELECT ?year ?month ?monthName (COUNT(DISTINCT ?notice) AS ?numberOfNotices)
 WHERE {
     ?notice a epo:Notice .
-
+    ?notice epo:hasDispatchDate ?date .
+    FILTER(xsd:date(?date) >= {{start}} && xsd:date(?date) < {{end}})
 
 # YEAR AND MONTH
-    OPTIONAL {
-        ?notice epo:hasDispatchDate ?date .
-    }
-    BIND(IF(BOUND(?date),year(xsd:date(?date)),"") AS ?year)
-    FILTER(?year=2022)
-    BIND(IF(BOUND(?date),month(xsd:date(?date)),"") AS ?month)
-    BIND(IF(!BOUND(?month), "",
-        IF(?month = 1, "January",
+    BIND(year(xsd:date(?date)) AS ?year)
+    BIND(month(xsd:date(?date)) AS ?month)
+    BIND(IF(?month = 1, "January",
         IF(?month = 2, "February",
         IF(?month = 3, "March",
         IF(?month = 4, "April",
@@ -53,11 +61,11 @@ WHERE {
         IF(?month = 8, "August",
         IF(?month = 9, "September",
         IF(?month = 10, "October",
-        IF(?month = 11, "November", "December")))))))))))) AS ?monthName)
-} group by ?monthName
-ORDER BY ?monthName
-""",
-    "Count the number of notices and sum the procurement value per month":"""
+        IF(?month = 11, "November", "December"))))))))))) AS ?monthName)
+} GROUP BY ?year ?month ?monthName
+ORDER BY ?year ?month
+""", defaults=DEFAULT_RANGE, partition='month'),
+    "Count the number of notices and sum the procurement value per month": QueryTemplate("""
 PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
 PREFIX epo: <http://data.europa.eu/a4g/ontology#>
 PREFIX cccev: <http://data.europa.eu/m8g/>
@@ -69,7 +77,7 @@ PREFIX dct: <http://purl.org/dc/terms/>
 PREFIX dc: <http://purl.org/dc/elements/1.1/>
 PREFIX euvoc: <http://publications.europa.eu/ontology/euvoc#>
 
-SELECT ?monthName (ROUND(SUM(?procValue) * 100) / 100 AS ?totalProcurementValueRounded) (COUNT(DISTINCT ?notice) AS ?numberOfNotices)
+SELECT ?year ?month ?monthName (ROUND(SUM(?procValue) * 100) / 100 AS ?totalProcurementValueRounded) (COUNT(DISTINCT ?notice) AS ?numberOfNotices)
 WHERE {
     ?notice a epo:CompetitionNotice .
     ?notice epo:refersToProcedure ?procedure .
@@ -79,14 +87,11 @@ WHERE {
         FILTER(?currencyTypeProcEstimatedValue = <http://publications.europa.eu/resource/authority/currency/EUR>)
         ?procMonetaryValue epo:hasAmountValue ?procValue .
     }
-    OPTIONAL {
-        ?notice epo:hasDispatchDate ?date .
-    }
-    BIND(IF(BOUND(?date), year(xsd:date(?date)), "") AS ?year)
-    FILTER(?year = 2022)
-    BIND(IF(BOUND(?date), month(xsd:date(?date)), "") AS ?month)
-    BIND(IF(!BOUND(?month), "",
-        IF(?month = 1, "January",
+    ?notice epo:hasDispatchDate ?date .
+    FILTER(xsd:date(?date) >= {{start}} && xsd:date(?date) < {{end}})
+    BIND(year(xsd:date(?date)) AS ?year)
+    BIND(month(xsd:date(?date)) AS ?month)
+    BIND(IF(?month = 1, "January",
         IF(?month = 2, "February",
         IF(?month = 3, "March",
         IF(?month = 4, "April",
@@ -96,8 +101,12 @@ WHERE {
         IF(?month = 8, "August",
         IF(?month = 9, "September",
         IF(?month = 10, "October",
-        IF(?month = 11, "November", "December")))))))))))) AS ?monthName)
-} GROUP BY ?monthName
-ORDER BY ?monthName
-"""
-}
\ No newline at end of file
+        IF(?month = 11, "November", "December"))))))))))) AS ?monthName)
+} GROUP BY ?year ?month ?monthName
+ORDER BY ?year ?month
+""", defaults=DEFAULT_RANGE, partition='month'),
+}
+
+# Parameterized templates are also offered with their default range filled in
+for _name, _template in parameterized_templates.items():
+    query_templates[_name] = _template.render()
@@ -1,18 +1,43 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 import plotly.graph_objs as go
 import io
+from downsampling import DEFAULT_POINT_BUDGET, WEBGL_THRESHOLD, sample_positions
 
-def perform_regression(data, dependent_var, independent_vars):
+def _to_numeric(series):
+    """
+    Converts a column to numbers, parsing each distinct value of a categorical column only once.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        numeric_categories = pd.to_numeric(pd.Series(series.cat.categories, dtype=object), errors='coerce').to_numpy(dtype=float)
+        codes = series.cat.codes.to_numpy()
+        values = np.where(codes >= 0, numeric_categories[codes] if len(numeric_categories) else np.nan, np.nan)
+        return pd.Series(values, index=series.index)
+    return pd.to_numeric(series, errors='coerce')
+
+def _is_numeric_text(series, numeric):
+    """
+    Whether every bound value of a text or categorical column converted to a number, as numbers
+    of results read without datatypes (e.g. CSV) do.
+    """
+    return bool(numeric.notna().sum() == series.notna().sum())
+
+def _scatter_class(points):
+    # WebGL keeps large scatter plots responsive; small ones stay SVG for crisper rendering
+    return go.Scattergl if points > WEBGL_THRESHOLD else go.Scatter
+
+def perform_regression(data, dependent_var, independent_vars, point_budget=DEFAULT_POINT_BUDGET):
     """
     Perform linear regression analysis.
 
+    The model is fitted on every row; the plot shows a random sample of at most point_budget of them.
+
     Args:
         data (DataFrame): Input data.
         dependent_var (str): Name of the dependent variable.
         independent_vars (list): List of names of independent variables.
+        point_budget (int): Maximum number of points drawn in the plot.
 
     Returns:
         tuple: Tuple containing model summary as text, Plotly figure, and potentially an error message.
@@ -23,15 +48,22 @@ def perform_regression(data, dependent_var, independent_vars):
     # Apply conversion to categorical variables and handle exceptions
     try:
         for var in independent_vars:
-            if pd.api.types.is_string_dtype(data_copy[var]):
-                data_copy[var] = pd.Categorical(data_copy[var]).codes
+            if isinstance(data_copy[var].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(data_copy[var]):
+                numeric = _to_numeric(data_copy[var])
+                if _is_numeric_text(data_copy[var], numeric):
+                    data_copy[var] = numeric
+                elif isinstance(data_copy[var].dtype, pd.CategoricalDtype):
+                    # Dictionary-encoded result columns already carry their codes
+                    data_copy[var] = data_copy[var].cat.codes
+                else:
+                    data_copy[var] = pd.Categorical(data_copy[var]).codes
     except Exception as e:
         return None, None, f"Error converting categorical data: {e}"
 
     # Apply numeric conversion to independent and dependent variables and handle exceptions
     try:
         data_copy[independent_vars] = data_copy[independent_vars].apply(pd.to_numeric, errors='coerce')
-        data_copy[dependent_var] = pd.to_numeric(data_copy[dependent_var], errors='coerce')
+        data_copy[dependent_var] = _to_numeric(data_copy[dependent_var])
     except Exception as e:
         return None, None, f"Error converting data to numeric: {e}"
 
@@ -40,6 +72,8 @@ def perform_regression(data, dependent_var, independent_vars):
     if data_copy.empty:
         return None, None, "Data is empty after dropping NaN values."
 
+    import statsmodels.api as sm
+
     # Add a constant for intercept
     X = sm.add_constant(data_copy[independent_vars])
     y = data_copy[dependent_var]
@@ -47,20 +81,22 @@ def perform_regression(data, dependent_var, independent_vars):
     try:
         # Perform linear regression
         model = sm.OLS(y, X).fit()
+        shown = sample_positions(len(y), point_budget)
+        trace_class = _scatter_class(len(shown))
         
         # Create a scatter plot of the independent variable vs the dependent variable
-        scatter_trace = go.Scatter(
-            x=data_copy[independent_vars[0]],
-            y=y,
+        scatter_trace = trace_class(
+            x=data_copy[independent_vars[0]].iloc[shown],
+            y=y.iloc[shown],
             mode='markers',
             marker=dict(color='blue'),
-            name='Data'
+            name='Data' if len(shown) == len(y) else f'Data (sample of {len(shown):,} / {len(y):,})'
         )
         
         # Plot the regression line
-        line_trace = go.Scatter(
-            x=data_copy[independent_vars[0]],
-            y=model.predict(X),
+        line_trace = trace_class(
+            x=data_copy[independent_vars[0]].iloc[shown],
+            y=model.predict(X.iloc[shown]),
             mode='lines',
             line=dict(color='red'),
             name='Fitted line'
@@ -81,6 +117,260 @@ def perform_regression(data, dependent_var, independent_vars):
     except Exception as e:
         return None, None, f"Regression error: {e}"
 
+class IncrementalOLS:
+    """
+    Ordinary or weighted least squares fitted from sufficient statistics.
+
+    Only X'WX, X'Wy, y'Wy and a few sums are kept, so memory is O(k^2) in the number of
+    regressors however many rows are fed through update().
+    """
+
+    def __init__(self, names):
+        """
+        Args:
+            names (list): Names of the regressors, in column order of the X batches.
+        """
+        k = len(names)
+        self.names = list(names)
+        self.xtx = np.zeros((k, k))
+        self.xty = np.zeros(k)
+        self.yty = 0.0
+        self.sum_w = 0.0
+        self.sum_wy = 0.0
+        self.n = 0
+
+    def update(self, X, y, w=None):
+        """
+        Adds a batch of observations.
+
+        Args:
+            X (ndarray): Design matrix of the batch, shape (rows, k).
+            y (ndarray): Dependent variable of the batch.
+            w (ndarray, optional): Observation weights; ordinary least squares if omitted.
+        """
+        if w is None:
+            w = np.ones(len(y))
+        Xw = X * w[:, None]
+        self.xtx += X.T @ Xw
+        self.xty += Xw.T @ y
+        self.yty += float(np.dot(w * y, y))
+        self.sum_w += float(w.sum())
+        self.sum_wy += float(np.dot(w, y))
+        self.n += len(y)
+
+    def fit(self):
+        """
+        Solves the normal equations from the accumulated statistics.
+
+        Returns:
+            dict: 'params', 'bse', 'tvalues', 'pvalues', 'conf_int' (arrays in regressor order),
+            'rsquared', 'rsquared_adj', 'fvalue', 'f_pvalue', 'nobs', 'df_model', 'df_resid'.
+        """
+        from scipy import stats
+
+        k = len(self.names)
+        df_resid = self.n - k
+        if df_resid <= 0:
+            raise ValueError("Not enough observations for the number of variables.")
+        xtx_inv = np.linalg.pinv(self.xtx)
+        params = xtx_inv @ self.xty
+        rss = max(self.yty - float(params @ self.xty), 0.0)
+        tss = self.yty - self.sum_wy ** 2 / self.sum_w  # Weighted, centred around the weighted mean
+        sigma2 = rss / df_resid
+        bse = np.sqrt(np.clip(np.diag(xtx_inv) * sigma2, 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tvalues = params / bse
+        pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid)
+        margin = stats.t.ppf(0.975, df_resid) * bse
+        df_model = k - 1
+        rsquared = 1 - rss / tss if tss > 0 else np.nan
+        rsquared_adj = 1 - (1 - rsquared) * (self.n - 1) / df_resid
+        fvalue = ((tss - rss) / df_model) / sigma2 if df_model > 0 and sigma2 > 0 else np.nan
+        f_pvalue = stats.f.sf(fvalue, df_model, df_resid) if df_model > 0 else np.nan
+        return {
+            'params': params, 'bse': bse, 'tvalues': tvalues, 'pvalues': pvalues,
+            'conf_int': np.column_stack([params - margin, params + margin]),
+            'rsquared': rsquared, 'rsquared_adj': rsquared_adj, 'fvalue': fvalue, 'f_pvalue': f_pvalue,
+            'nobs': self.n, 'df_model': df_model, 'df_resid': df_resid,
+        }
+
+    def summary(self, dependent_var, title='OLS Regression Results'):
+        """
+        Formats the fit like statsmodels' summary().as_text().
+
+        Args:
+            dependent_var (str): Name of the dependent variable.
+            title (str): Title line of the table.
+
+        Returns:
+            str: The summary table.
+        """
+        result = self.fit()
+        model = 'WLS' if self.sum_w != self.n else 'OLS'
+        rule = '=' * 78
+        lines = [
+            title.center(78),
+            rule,
+            f"{'Dep. Variable:':<16}{dependent_var:>22}   {'R-squared:':<20}{result['rsquared']:>17.3f}",
+            f"{'Model:':<16}{model + ' (streamed)':>22}   {'Adj. R-squared:':<20}{result['rsquared_adj']:>17.3f}",
+            f"{'No. Observations:':<16}{result['nobs']:>21}   {'F-statistic:':<20}{result['fvalue']:>17.4g}",
+            f"{'Df Residuals:':<16}{result['df_resid']:>22}   {'Prob (F-statistic):':<20}{result['f_pvalue']:>17.3g}",
+            f"{'Df Model:':<16}{result['df_model']:>22}",
+            rule,
+            f"{'':<16}{'coef':>10}{'std err':>11}{'t':>11}{'P>|t|':>10}{'[0.025':>10}{'0.975]':>10}",
+            '-' * 78,
+        ]
+        for index, name in enumerate(self.names):
+            lines.append(
+                f"{name[:16]:<16}{result['params'][index]:>10.4f}{result['bse'][index]:>11.3f}"
+                f"{result['tvalues'][index]:>11.3f}{result['pvalues'][index]:>10.3f}"
+                f"{result['conf_int'][index, 0]:>10.3f}{result['conf_int'][index, 1]:>10.3f}"
+            )
+        lines.append(rule)
+        return '\n'.join(lines)
+
+def _encode_categories(series, encoder):
+    """
+    Maps a categorical or string column onto integer codes that stay stable across batches.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        codes = series.cat.codes.to_numpy()
+    else:
+        codes, categories = pd.factorize(series)
+    mapping = np.array([encoder.setdefault(value, len(encoder)) for value in categories] + [np.nan], dtype=float)
+    return mapping[codes]  # Code -1 (missing) picks the trailing NaN
+
+def _prepare_batch(frame, dependent_var, independent_vars, weights_var, group_var, encoders):
+    """
+    Turns one batch into (X with a constant column, y, weights, groups), dropping incomplete rows.
+    """
+    columns = {}
+    for var in independent_vars:
+        series = frame[var]
+        if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(series):
+            if var not in encoders and series.notna().any():
+                # Decided on the first batch with values: numbers written as text, or categories
+                encoders[var] = None if _is_numeric_text(series, _to_numeric(series)) else {}
+            if encoders.get(var) is None:
+                columns[var] = _to_numeric(series).to_numpy(dtype=float, na_value=np.nan)
+            else:
+                columns[var] = _encode_categories(series, encoders[var])
+        else:
+            columns[var] = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    y = _to_numeric(frame[dependent_var]).to_numpy(dtype=float, na_value=np.nan)
+    X = np.column_stack([np.ones(len(frame))] + [columns[var] for var in independent_vars])
+    w = _to_numeric(frame[weights_var]).to_numpy(dtype=float, na_value=np.nan) if weights_var else None
+    groups = frame[group_var].astype(object).to_numpy() if group_var else None
+
+    keep = ~np.isnan(y) & ~np.isnan(X).any(axis=1)
+    if w is not None:
+        keep &= ~np.isnan(w) & (w >= 0)
+    if groups is not None:
+        keep &= pd.notna(groups)
+    return X[keep], y[keep], (w[keep] if w is not None else None), (groups[keep] if groups is not None else None)
+
+def perform_incremental_regression(batches, dependent_var, independent_vars, weights_var=None, group_var=None,
+                                   point_budget=DEFAULT_POINT_BUDGET):
+    """
+    Perform linear regression over batches of rows without holding the full design matrix.
+
+    Each batch only updates the sufficient statistics of the fit, so the batches can come from
+    paged query results (query_executor.iter_query_batches) or ResultSet.iter_chunks. Weighted
+    and per-group fits are computed in the same single pass; groups with too few observations
+    for the number of coefficients are skipped and listed after the summaries. The plot shows a
+    fixed-size random sample of the points and the fitted line.
+
+    Args:
+        batches (iterable): ResultSet or DataFrame batches.
+        dependent_var (str): Name of the dependent variable.
+        independent_vars (list): List of names of independent variables.
+        weights_var (str, optional): Column holding observation weights (weighted least squares).
+        group_var (str, optional): Column whose values split the data into separate fits.
+        point_budget (int): Maximum number of points drawn in the plot.
+
+    Returns:
+        tuple: Tuple containing model summary as text, Plotly figure, and potentially an error message.
+    """
+    if not independent_vars:
+        return None, None, "Select at least one independent variable."
+    names = ['const'] + list(independent_vars)
+    used = list(dict.fromkeys([dependent_var, *independent_vars, *filter(None, [weights_var, group_var])]))
+    models = {}
+    encoders = {}
+    rng = np.random.default_rng()
+    sample_x, sample_y = np.empty(0), np.empty(0)
+    seen = 0
+
+    try:
+        for batch in batches:
+            frame = batch.to_dataframe(used) if hasattr(batch, 'to_dataframe') else batch
+            X, y, w, groups = _prepare_batch(frame, dependent_var, independent_vars, weights_var, group_var, encoders)
+            if not len(y):
+                continue
+            if groups is None:
+                models.setdefault(None, IncrementalOLS(names)).update(X, y, w)
+            else:
+                group_codes, group_keys = pd.factorize(groups)
+                for code, key in enumerate(group_keys):
+                    rows = group_codes == code
+                    models.setdefault(key, IncrementalOLS(names)).update(X[rows], y[rows], w[rows] if w is not None else None)
+
+            # Reservoir sampling (Algorithm R, vectorized per batch) for the scatter plot
+            positions = seen + np.arange(len(y))
+            slots = np.where(positions < point_budget, positions, rng.integers(0, positions + 1))
+            take = slots < point_budget
+            if len(sample_x) < point_budget:
+                grow = min(point_budget, seen + len(y)) - len(sample_x)
+                sample_x = np.concatenate([sample_x, np.full(grow, np.nan)])
+                sample_y = np.concatenate([sample_y, np.full(grow, np.nan)])
+            sample_x[slots[take]] = X[take, 1]
+            sample_y[slots[take]] = y[take]
+            seen += len(y)
+    except Exception as e:
+        return None, None, f"Error reading data: {e}"
+
+    if not models:
+        return None, None, "Data is empty after dropping NaN values."
+
+    # Groups with no residual degrees of freedom cannot be fitted; report them instead of failing the call
+    skipped = [key for key, model in models.items() if model.n <= len(names)]
+    if None in skipped:
+        return None, None, "Regression error: Not enough observations for the number of variables."
+    for key in skipped:
+        del models[key]
+    if not models:
+        return None, None, (f"Regression error: every {group_var} group has too few observations "
+                            f"for {len(names)} coefficients.")
+
+    try:
+        heading = 'WLS Regression Results' if weights_var else 'OLS Regression Results'
+        summaries = []
+        for key, model in models.items():
+            title = heading if key is None else f"{heading}: {group_var} = {key}"
+            summaries.append(model.summary(dependent_var, title))
+        if skipped:
+            summaries.append(f"Skipped {len(skipped)} {group_var} group(s) with too few observations for "
+                             f"{len(names)} coefficients: {', '.join(map(str, skipped))}")
+
+        traces = [_scatter_class(len(sample_x))(x=sample_x, y=sample_y, mode='markers', marker=dict(color='blue'),
+                                                name='Data' if seen <= point_budget else f'Data (sample of {point_budget:,} / {seen:,})')]
+        # The fitted line holds the other regressors at zero, as a partial effect of the first one
+        x_range = np.array([np.nanmin(sample_x), np.nanmax(sample_x)])
+        for key, model in models.items():
+            params = model.fit()['params']
+            traces.append(go.Scatter(x=x_range, y=params[0] + params[1] * x_range, mode='lines',
+                                     name='Fitted line' if key is None else f'Fitted line ({key})'))
+        layout = go.Layout(
+            xaxis=dict(title=independent_vars[0]),
+            yaxis=dict(title=dependent_var),
+            legend=dict(x=0.7, y=0.9),
+            title='Linear Regression Analysis'
+        )
+        return '\n\n'.join(summaries), go.Figure(data=traces, layout=layout), None
+    except Exception as e:
+        return None, None, f"Regression error: {e}"
+
 # Example usage in Streamlit app
 if __name__ == "__main__":
     # Sample data
@@ -0,0 +1,516 @@
+import sys
+
+import numpy as np
+
+# pandas takes a third of a second to import, so it is imported by the methods that build pandas
+# objects only: fetching and exporting results does not load it unless it is needed (see cli.py)
+from string_dictionary import StringDictionary
+
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+# Literal datatypes that map onto a native column type. Anything else (IRIs, plain and
+# language-tagged literals, mixed columns) is dictionary-encoded.
+INTEGER_DATATYPES = {XSD + name for name in (
+    'integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger', 'positiveInteger',
+    'nonPositiveInteger', 'negativeInteger', 'unsignedLong', 'unsignedInt', 'unsignedShort',
+    'unsignedByte')}
+FLOAT_DATATYPES = {XSD + name for name in ('decimal', 'double', 'float')}
+BOOLEAN_DATATYPES = {XSD + 'boolean'}
+DATETIME_DATATYPES = {XSD + 'dateTime', XSD + 'dateTimeStamp'}
+DATE_DATATYPES = {XSD + 'date'}
+# Dictionaries smaller than this stay plain lists when a result set is compacted
+MIN_COMPACT_ENTRIES = 1024
+
+
+class Column:
+    """
+    A single result column stored as a contiguous array.
+
+    kind is one of 'integer' (int64), 'float' (float64), 'boolean' (bool), 'datetime'
+    (datetime64[ns], UTC) or 'categorical'. Categorical columns keep int32 codes into a
+    dictionary of distinct strings, with -1 for unbound values. mask is True where the variable
+    was unbound in the row. The dictionary is a list, or a string_dictionary.StringDictionary
+    once the column is compacted.
+    """
+
+    def __init__(self, name, kind, values, mask, dictionary=None, datatype=None, categories=None):
+        self.name = name
+        self.kind = kind
+        self.values = values
+        self.mask = mask
+        self.dictionary = dictionary
+        self.datatype = datatype
+        self._categories = categories  # pandas Index over dictionary, built on first use
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_categories'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_categories', None)  # Pickled before the attribute existed
+
+    @property
+    def is_compact(self):
+        return isinstance(self.dictionary, StringDictionary)
+
+    def categories(self):
+        """
+        Returns the dictionary as a pandas Index (object dtype), built once and shared by slices.
+        A compact dictionary is expanded on every call instead of being kept expanded.
+        """
+        import pandas as pd
+
+        if self.is_compact:
+            return pd.Index(self.dictionary.tolist(), dtype=object)
+        if self._categories is None:
+            self._categories = pd.Index(self.dictionary, dtype=object)
+        return self._categories
+
+    def compact(self, prefixes=None):
+        """
+        Replaces a large list dictionary by a StringDictionary, in place.
+
+        Parameters:
+        - prefixes: Namespace IRIs by prefix name (e.g. the query's PREFIX declarations) used for
+          values whose own namespace is rare.
+        """
+        if self.kind != 'categorical' or self.is_compact or len(self.dictionary) < MIN_COMPACT_ENTRIES:
+            return
+        dictionary = StringDictionary.from_strings(self.dictionary, prefixes)
+        if dictionary is not None:
+            self.dictionary = dictionary
+            self._categories = None
+
+    def _decoded(self):
+        """
+        Returns (codes, categories) for a categorical column. For a compact dictionary only the
+        entries the rows use are expanded, with the codes renumbered accordingly.
+        """
+        if not self.is_compact:
+            return self.values, self.categories()
+        used = np.unique(self.values)
+        used = used[used >= 0]
+        if len(used) == len(self.dictionary):
+            return self.values, self.categories()
+        import pandas as pd
+
+        codes = np.searchsorted(used, self.values).astype(np.int32)
+        codes[self.values < 0] = -1
+        return codes, pd.Index(self.dictionary.take(used), dtype=object)
+
+    def __len__(self):
+        return len(self.values)
+
+    def nbytes(self):
+        """
+        Approximate memory held by the column: its arrays plus the strings of its dictionary.
+        """
+        total = self.values.nbytes + self.mask.nbytes
+        if self.dictionary is not None:
+            if self.is_compact:
+                total += self.dictionary.nbytes()
+            else:
+                total += sum(map(sys.getsizeof, self.dictionary)) + 8 * len(self.dictionary)
+        return total
+
+    @classmethod
+    def nulls(cls, name, length):
+        """Returns an all-unbound column."""
+        return cls(name, 'categorical', np.full(length, -1, dtype=np.int32),
+                   np.ones(length, dtype=bool), dictionary=[])
+
+    def is_all_null(self):
+        return bool(self.mask.all())
+
+    def to_pandas(self):
+        """
+        Returns the column as a pandas array without going through Python objects.
+        """
+        import pandas as pd
+
+        has_nulls = bool(self.mask.any())
+        if self.kind == 'categorical':
+            codes, categories = self._decoded()
+            return pd.Categorical.from_codes(codes, categories=categories)
+        if self.kind == 'integer':
+            return pd.arrays.IntegerArray(self.values, self.mask) if has_nulls else self.values
+        if self.kind == 'boolean':
+            return pd.arrays.BooleanArray(self.values, self.mask) if has_nulls else self.values
+        # Floats hold NaN and datetimes NaT at unbound positions already
+        return self.values
+
+    def slice(self, start, stop):
+        """
+        Returns a view of the rows in [start, stop); the dictionary is shared, not copied.
+        """
+        return Column(self.name, self.kind, self.values[start:stop], self.mask[start:stop],
+                      dictionary=self.dictionary, datatype=self.datatype,
+                      categories=self.categories() if self.kind == 'categorical' and not self.is_compact else None)
+
+    def take(self, indices):
+        """
+        Returns a new column with the rows at the given positions; position -1 yields unbound.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        missing = indices < 0
+        if len(self) == 0:
+            return Column.nulls(self.name, len(indices))
+        positions = np.where(missing, 0, indices)
+        values = self.values[positions]
+        mask = self.mask[positions] | missing
+        if missing.any():
+            if self.kind == 'categorical':
+                values[mask] = -1
+            elif self.kind == 'float':
+                values[mask] = np.nan
+            elif self.kind == 'datetime':
+                values[mask] = np.datetime64('NaT')
+        return Column(self.name, self.kind, values, mask, dictionary=self.dictionary, datatype=self.datatype,
+                      categories=self._categories)
+
+    def item(self, index):
+        """
+        Returns a single value as a Python object (None if unbound).
+        """
+        if self.mask[index]:
+            return None
+        if self.kind == 'categorical':
+            return self.dictionary[self.values[index]]
+        if self.kind == 'datetime':
+            return self.values[index].astype('datetime64[us]').item()
+        return self.values[index].item()
+
+    def to_list(self):
+        """
+        Returns the column as Python values, with None for unbound entries.
+        """
+        if self.kind == 'categorical':
+            return self.to_objects().tolist()
+        if self.kind == 'datetime':
+            items = self.values.astype('datetime64[us]').tolist()
+        else:
+            items = self.values.tolist()
+        if self.mask.any():
+            items = [None if missing else item for item, missing in zip(items, self.mask.tolist())]
+        return items
+
+    def to_objects(self):
+        """
+        Returns a categorical column as an object array of strings, with None for unbound entries.
+        """
+        codes, categories = self._decoded()
+        if not len(categories):
+            return np.full(len(codes), None, dtype=object)
+        values = categories.to_numpy()[np.where(codes < 0, 0, codes)]
+        values[codes < 0] = None
+        return values
+
+    def to_strings(self):
+        """
+        Returns the column as strings (None for unbound entries), the common denominator used
+        when columns of different kinds have to be merged.
+        """
+        if self.kind == 'categorical':
+            return self.to_list()
+        if self.kind == 'datetime':
+            return [None if item is None else item.isoformat() for item in self.to_list()]
+        if self.kind == 'boolean':
+            return [None if item is None else str(item).lower() for item in self.to_list()]
+        return [None if item is None else str(item) for item in self.to_list()]
+
+
+def _dictionary_encode(name, values):
+    lookup = {}
+    codes = np.fromiter(
+        (-1 if value is None else lookup.setdefault(value, len(lookup)) for value in values),
+        dtype=np.int32, count=len(values))
+    return Column(name, 'categorical', codes, codes < 0, dictionary=list(lookup))
+
+
+def _numeric_column(name, values, mask, kind, datatype):
+    filled = ['0' if value is None else value for value in values]
+    if kind == 'integer':
+        array = np.array(filled, dtype=np.str_).astype(np.int64)
+    else:
+        array = np.array(filled, dtype=np.str_).astype(np.float64)
+        array[mask] = np.nan
+    return Column(name, kind, array, mask, datatype=datatype)
+
+
+def _boolean_column(name, values, mask, datatype):
+    array = np.fromiter((value in ('true', '1') for value in values), dtype=bool, count=len(values))
+    if not all(value in ('true', 'false', '1', '0') for value in values if value is not None):
+        raise ValueError(f"Invalid xsd:boolean in column {name}")
+    return Column(name, 'boolean', array, mask, datatype=datatype)
+
+
+def _datetime_column(name, values, mask, date_only, datatype):
+    import pandas as pd
+
+    if date_only:
+        # xsd:date may carry a timezone suffix ("2022-01-01+02:00"); the calendar date is what matters
+        values = [None if value is None else value[:10] for value in values]
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format='ISO8601', errors='coerce')
+    if (parsed.isna().to_numpy() & ~mask).any():
+        raise ValueError(f"Invalid date/time literal in column {name}")
+    array = parsed.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+    return Column(name, 'datetime', array, mask, datatype=datatype)
+
+
+def build_column(name, values, kinds):
+    """
+    Builds a typed column from raw binding values.
+
+    Parameters:
+    - name: The variable name.
+    - values: List of value strings, None where unbound.
+    - kinds: Set of the datatype IRIs (or term types for non-typed terms) seen in the column.
+
+    Returns:
+    A Column. Columns whose datatypes do not all map onto one native type, or whose values fail
+    to parse, are dictionary-encoded.
+    """
+    mask = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    datatype = next(iter(kinds)) if len(kinds) == 1 else None
+    try:
+        if kinds and kinds <= INTEGER_DATATYPES:
+            try:
+                return _numeric_column(name, values, mask, 'integer', datatype)
+            except OverflowError:
+                return _numeric_column(name, values, mask, 'float', datatype)
+        if kinds and kinds <= INTEGER_DATATYPES | FLOAT_DATATYPES:
+            return _numeric_column(name, values, mask, 'float', datatype)
+        if kinds and kinds <= BOOLEAN_DATATYPES:
+            return _boolean_column(name, values, mask, datatype)
+        if kinds and kinds <= DATETIME_DATATYPES | DATE_DATATYPES:
+            return _datetime_column(name, values, mask, kinds <= DATE_DATATYPES, datatype)
+    except (ValueError, TypeError):
+        pass  # Malformed literal: keep the lexical forms instead
+    column = _dictionary_encode(name, values)
+    column.datatype = datatype
+    return column
+
+
+def _concat_columns(name, parts):
+    """
+    Concatenates the pieces of one column coming from consecutive batches.
+    """
+    typed = [part for part in parts if not part.is_all_null()]
+    kinds = {part.kind for part in typed}
+    if kinds == {'integer', 'float'}:
+        kinds = {'float'}  # As build_column does for integer and decimal literals in one batch
+    if len(kinds) == 1 and 'categorical' not in kinds:
+        kind = kinds.pop()
+        template = next(part for part in typed if part.kind == kind)
+        pieces = []
+        for part in parts:
+            if part.kind == kind:
+                pieces.append(part.values)
+            elif kind == 'float' and part.kind == 'integer':
+                pieces.append(np.where(part.mask, np.nan, part.values.astype(np.float64)))
+            else:
+                pieces.append(np.zeros(len(part), dtype=template.values.dtype))
+                if kind == 'float':
+                    pieces[-1][:] = np.nan
+                elif kind == 'datetime':
+                    pieces[-1][:] = np.datetime64('NaT')
+        datatypes = {part.datatype for part in typed}
+        return Column(name, kind, np.concatenate(pieces), np.concatenate([part.mask for part in parts]),
+                      datatype=datatypes.pop() if len(datatypes) == 1 else None)
+
+    if all(part.kind == 'categorical' for part in parts):
+        # Merge the dictionaries and remap each batch's codes into the merged one
+        lookup = {}
+        pieces = []
+        for part in parts:
+            mapping = np.array([lookup.setdefault(value, len(lookup)) for value in part.dictionary] + [-1],
+                               dtype=np.int32)
+            pieces.append(mapping[part.values])  # Code -1 picks the trailing -1
+        datatypes = {part.datatype for part in typed}
+        return Column(name, 'categorical', np.concatenate(pieces) if pieces else np.empty(0, dtype=np.int32),
+                      np.concatenate([part.mask for part in parts]) if parts else np.empty(0, dtype=bool),
+                      dictionary=list(lookup), datatype=datatypes.pop() if len(datatypes) == 1 else None)
+
+    # Kinds disagree between batches: fall back to the lexical forms
+    values = []
+    for part in parts:
+        values.extend(part.to_strings())
+    return _dictionary_encode(name, values)
+
+
+class ResultSet:
+    """
+    Columnar, typed query result.
+
+    Columns are available by name through column(); to_dataframe() builds (once) a DataFrame
+    over the typed arrays. For compatibility with code written against the list-of-rows API,
+    a ResultSet also behaves as a read-only sequence of rows.
+    """
+
+    def __init__(self, columns, stats=None):
+        self._columns = {column.name: column for column in columns}
+        self.columns = [column.name for column in columns]
+        self.row_count = len(columns[0]) if columns else 0
+        # Transfer statistics: 'format', 'bytes_received' and 'parse_time' (seconds)
+        self.stats = stats or {}
+        self._frame = None
+
+    @classmethod
+    def from_buffers(cls, buffers, columns):
+        """
+        Builds a ResultSet from filled results_parser.ColumnBuffers.
+        """
+        return cls([build_column(name, buffers.values[name], buffers.kinds[name]) for name in columns])
+
+    @classmethod
+    def concat(cls, result_sets):
+        """
+        Concatenates result sets row-wise. Columns missing from a part are treated as unbound.
+        """
+        result_sets = list(result_sets)
+        if len(result_sets) == 1:
+            return result_sets[0]
+        names = []
+        for result_set in result_sets:
+            names.extend(name for name in result_set.columns if name not in names)
+        formats = []
+        for result_set in result_sets:
+            if result_set.stats.get('format') and result_set.stats['format'] not in formats:
+                formats.append(result_set.stats['format'])
+        stats = {
+            'format': '+'.join(formats) or None,
+            'bytes_received': sum(result_set.stats.get('bytes_received', 0) for result_set in result_sets),
+            'parse_time': sum(result_set.stats.get('parse_time', 0.0) for result_set in result_sets),
+        }
+        return cls([
+            _concat_columns(name, [
+                result_set._columns.get(name) or Column.nulls(name, len(result_set))
+                for result_set in result_sets
+            ])
+            for name in names
+        ], stats=stats)
+
+    @classmethod
+    def from_rows(cls, rows, columns):
+        """
+        Builds a ResultSet from a list of rows of strings, the representation used before typed
+        results. Every column is dictionary-encoded.
+        """
+        return cls([
+            build_column(name, [None if row[index] in (None, "") else row[index] for row in rows], set())
+            for index, name in enumerate(columns)
+        ])
+
+    def column(self, name):
+        return self._columns[name]
+
+    def slice(self, start, stop):
+        """
+        Returns the rows in [start, stop) as a ResultSet sharing this one's arrays.
+        """
+        return ResultSet([self._columns[name].slice(start, stop) for name in self.columns], stats=self.stats)
+
+    def take(self, indices):
+        """
+        Returns the rows at the given positions as a new ResultSet.
+        """
+        return ResultSet([self._columns[name].take(indices) for name in self.columns], stats=self.stats)
+
+    def iter_chunks(self, chunk_size):
+        """
+        Yields consecutive ResultSet slices of at most chunk_size rows.
+        """
+        for start in range(0, self.row_count, chunk_size):
+            yield self.slice(start, start + chunk_size)
+
+    def to_dataframe(self, columns=None):
+        """
+        Returns the results as a DataFrame with typed columns. The frame is built once and reused,
+        unless the result set is compacted: its frame would hold every string expanded again.
+
+        Parameters:
+        - columns: Only build these columns, in this order (all columns if omitted). Views that use
+          a few columns of a compacted result set expand only those.
+        """
+        if self._frame is not None:
+            return self._frame if columns is None else self._frame[list(columns)]
+        import pandas as pd
+
+        names = self.columns if columns is None else list(columns)
+        frame = pd.DataFrame({name: self._columns[name].to_pandas() for name in names}, columns=names)
+        if columns is None and not self.is_compact:
+            self._frame = frame
+        return frame
+
+    @property
+    def is_compact(self):
+        return any(column.is_compact for column in self._columns.values())
+
+    def compact(self, prefixes=None):
+        """
+        Compresses the dictionaries of large categorical columns in place (see
+        string_dictionary.StringDictionary) and drops the cached DataFrame. Values are expanded
+        again only when rows are read, so slices for display or export stay cheap.
+
+        Parameters:
+        - prefixes: Namespace IRIs by prefix name, e.g. from the query's PREFIX declarations.
+
+        Returns:
+        The result set itself.
+        """
+        for column in self._columns.values():
+            column.compact(prefixes)
+        if self.is_compact:
+            self._frame = None
+        return self
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_frame'] = None  # Rebuilt on demand rather than stored in caches
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('stats', {})  # Pickled before transfer statistics existed
+
+    def __len__(self):
+        return self.row_count
+
+    def nbytes(self):
+        """
+        Approximate memory held by the columns (the cached DataFrame mostly shares their arrays).
+        """
+        return sum(column.nbytes() for column in self._columns.values())
+
+    def __iter__(self):
+        return iter(self.to_rows())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.to_rows()[index]
+        return [self._columns[name].item(index) for name in self.columns]
+
+    def to_rows(self):
+        """
+        Returns the results as a list of rows of Python values (None where unbound).
+        """
+        return [list(row) for row in zip(*(self._columns[name].to_list() for name in self.columns))]
+
+
+def as_dataframe(data, columns, usecols=None):
+    """
+    Returns a DataFrame for query results held either as a ResultSet or as a list of rows.
+
+    Parameters:
+    - data: A ResultSet or a list of rows.
+    - columns: The column names of the rows.
+    - usecols: Only return these columns (all columns if omitted).
+    """
+    if isinstance(data, ResultSet):
+        return data.to_dataframe(usecols)
+    import pandas as pd
+
+    frame = pd.DataFrame(data, columns=columns)
+    return frame if usecols is None else frame[list(usecols)]
@@ -0,0 +1,284 @@
+import atexit
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+# Memory the shared results may occupy before the least recently used are spilled to disk,
+# overridable through the environment (in bytes)
+DEFAULT_MEMORY_BUDGET = int(os.environ.get('SPARQL_QUERIER_RESULT_MEMORY', 1024 * 1024 * 1024))
+
+
+def _remove_path(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ResultHandle:
+    """
+    A session's reference to a result set in a ResultStore.
+
+    Sessions keep handles rather than the results themselves: get() returns the shared ResultSet,
+    loading it back from disk if it was spilled. The reference is released when the handle is
+    garbage collected (e.g. when the session ends or stores other results) or by release().
+    """
+
+    def __init__(self, store, key, columns, row_count):
+        self.key = key
+        self.columns = columns
+        self.row_count = row_count
+        self._store = store
+        self._finalizer = weakref.finalize(self, store._release, key)
+
+    def get(self):
+        return self._store._get(self.key)
+
+    def release(self):
+        self._finalizer()
+
+    def __len__(self):
+        return self.row_count
+
+
+class _Entry:
+    def __init__(self, key, result_set):
+        self.key = key
+        self.result_set = result_set  # None while spilled
+        self.columns = list(result_set.columns)
+        self.row_count = len(result_set)
+        self.nbytes = result_set.nbytes()
+        self.path = None  # Spill file, written on first spill
+        self.spilling = False  # A spill file is being written, outside the store lock
+        self.load_lock = threading.Lock()  # One reload from the spill file at a time
+        self.refs = 0
+        self.last_used = time.monotonic()
+
+
+class ResultStore:
+    """
+    Process-wide store of query results shared by every session of the app.
+
+    Results are stored once per key (normally the query cache key, see query_cache.cache_key), so
+    users looking at the same query share one copy and hold ResultHandles to it. Entries count
+    their live handles. When the results in memory exceed the budget, entries nobody holds are
+    dropped, then the least recently used entries still held are spilled to disk and loaded again
+    on their next get(). Spill files are written and read outside the store lock, so other
+    sessions keep reading their results meanwhile.
+
+    The store is meant to be the only long-lived holder of the results it manages, so that
+    spilling or dropping an entry does release its memory: the memory tier of query_cache holds
+    at most query_cache.DEFAULT_MEMORY_BYTES of results itself and references larger ones weakly,
+    and the app lets go of a job's results once they are stored (see JobManager.release_result).
+
+    Parameters:
+    - memory_budget: Bytes of results (as estimated by ResultSet.nbytes()) kept in memory.
+    - spill_dir: Directory for spilled results; a private temporary directory by default,
+      removed when the process exits.
+    - compact: Compress the strings of stored results, expanding them only when read.
+    """
+
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None, compact=True):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='result-compact') if compact else None
+        self._entries = {}
+        self._lock = threading.RLock()
+
+    def put(self, key, result_set, replace=False, prefixes=None):
+        """
+        Stores a result set and returns a handle to it.
+
+        New results are compacted in the background (see ResultSet.compact), with prefixes
+        (e.g. the query's PREFIX declarations) helping to compress their IRIs.
+
+        If the key is already stored, the existing copy is shared instead, unless replace=True
+        (e.g. for freshly re-run results): the new results then take its place, and existing
+        handles see them from their next get(). Sessions that received the same result set
+        object (a coalesced job or a cache hit) always share it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (replace and entry.result_set is not result_set):
+                if entry is not None:
+                    self._remove_file(entry)
+                new_entry = _Entry(key, result_set)
+                new_entry.refs = entry.refs if entry is not None else 0
+                self._entries[key] = entry = new_entry
+                if self._compactor is not None and not result_set.is_compact:
+                    self._compactor.submit(self._compact, entry, prefixes)
+            handle = self._handle(entry)
+            spills = self._enforce_budget(keep=entry)
+        self._write_spills(spills)
+        return handle
+
+    def _compact(self, entry, prefixes):
+        result_set = entry.result_set
+        if result_set is None:
+            return  # Spilled or replaced in the meantime
+        try:
+            result_set.compact(prefixes)
+        except Exception:
+            logging.exception(f"Could not compact result {entry.key}")
+            return
+        with self._lock:
+            entry.nbytes = result_set.nbytes()
+            if self._entries.get(entry.key) is not entry or entry.result_set is None:
+                return  # Replaced, or spilled while it was compacted
+            # A spill file written before compaction would bring the expanded strings back
+            self._remove_file(entry)
+            entry.path = None
+            spills = self._enforce_budget()
+        self._write_spills(spills)
+
+    def acquire(self, key):
+        """
+        Returns a new handle to a stored result, or None if the key is not stored.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._handle(entry) if entry is not None else None
+
+    def _handle(self, entry):
+        entry.refs += 1
+        entry.last_used = time.monotonic()
+        return ResultHandle(self, entry.key, entry.columns, entry.row_count)
+
+    def _get(self, key):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    raise KeyError(f"Result {key} is no longer stored.")
+                entry.last_used = time.monotonic()
+                if entry.result_set is not None:
+                    return entry.result_set
+            result_set = self._load(entry)
+            if result_set is not None:
+                return result_set
+            # The entry was replaced or dropped while it was being read: look the key up again
+
+    def _load(self, entry):
+        """
+        Reads a spilled entry back from disk, outside the store lock. Returns None if the entry
+        was replaced or dropped in the meantime.
+        """
+        with entry.load_lock:
+            with self._lock:
+                if entry.result_set is not None:
+                    return entry.result_set  # Loaded by another session while this one waited
+                path = entry.path
+            try:
+                with open(path, 'rb') as handle:
+                    result_set = pickle.load(handle)
+            except FileNotFoundError:
+                return None
+            with self._lock:
+                if self._entries.get(entry.key) is not entry:
+                    return None
+                entry.result_set = result_set
+                entry.last_used = time.monotonic()
+                spills = self._enforce_budget(keep=entry)
+        self._write_spills(spills)
+        return result_set
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            # Unreferenced results stay in memory (for the next session asking) until the budget
+            # needs the room; spilled ones are only worth keeping while someone holds them
+            if entry.refs <= 0 and entry.result_set is None:
+                self._drop(entry)
+
+    def _enforce_budget(self, keep=None):
+        """
+        Frees memory until the resident results fit the budget; called with the lock held.
+        Returns the entries that have to be written to disk first, for _write_spills to do once
+        the lock is released.
+        """
+        resident = [entry for entry in self._entries.values() if entry.result_set is not None and not entry.spilling]
+        used = sum(entry.nbytes for entry in resident)
+        spills = []
+        # Results nobody holds go first, then the least recently used
+        for entry in sorted(resident, key=lambda entry: (entry.refs > 0, entry.last_used)):
+            if used <= self.memory_budget:
+                break
+            if entry is keep:
+                continue
+            if entry.refs <= 0:
+                self._drop(entry)
+            elif entry.path is not None:
+                entry.result_set = None  # Spilled before and reloaded since: the file is still current
+            else:
+                entry.spilling = True
+                spills.append(entry)
+            used -= entry.nbytes
+        return spills
+
+    def _write_spills(self, entries):
+        """
+        Writes entries chosen by _enforce_budget to disk and then releases their results. The
+        results stay readable while they are written.
+        """
+        for entry in entries:
+            with self._lock:
+                path = os.path.join(self._spill_directory(), f"{entry.key}.{id(entry):x}.pkl")
+            try:
+                with open(path, 'wb') as handle:
+                    pickle.dump(entry.result_set, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                logging.exception(f"Could not spill result {entry.key}")
+                path = None
+            with self._lock:
+                entry.spilling = False
+                if path is not None and self._entries.get(entry.key) is entry:
+                    entry.path = path
+                    entry.result_set = None
+                    logging.info(f"Spilled result {entry.key} ({entry.nbytes / 1e6:.1f} MB) to disk")
+                    continue
+            if path is not None:
+                _remove_path(path)  # Dropped or replaced while it was written
+
+    def _drop(self, entry):
+        self._remove_file(entry)
+        self._entries.pop(entry.key, None)
+
+    @staticmethod
+    def _remove_file(entry):
+        if entry.path is not None:
+            _remove_path(entry.path)
+
+    def _spill_directory(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix='sparql_querier_results_')
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+        os.makedirs(self.spill_dir, exist_ok=True)
+        return self.spill_dir
+
+    def stats(self):
+        """
+        Returns counts and sizes: 'entries', 'handles', 'resident' and 'spilled' entries,
+        'memory_bytes' in use and the 'memory_budget'.
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+        return {
+            'entries': len(entries),
+            'handles': sum(max(0, entry.refs) for entry in entries),
+            'resident': sum(entry.result_set is not None for entry in entries),
+            'spilled': sum(entry.result_set is None for entry in entries),
+            'memory_bytes': sum(entry.nbytes for entry in entries if entry.result_set is not None),
+            'memory_budget': self.memory_budget,
+        }
+
+
+default_store = ResultStore()
@@ -0,0 +1,225 @@
+"""
+Filtering, sorting and paging of a ResultSet for the results table, run on the column arrays.
+
+The table never builds a DataFrame of the whole result: filters become boolean masks over the
+typed arrays (text conditions are evaluated once per distinct value, on the column dictionary,
+and mapped to the rows through the codes), sorts become a permutation that is computed once per
+column and reused, and only the rows of the visible page are turned into a DataFrame.
+"""
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from result_set import ResultSet
+
+DEFAULT_PAGE_SIZE = 100
+PAGE_SIZES = (25, 50, 100, 500)
+MAX_LISTED_VALUES = 1000  # Categorical columns with more distinct values are filtered by text
+SEARCH_CACHE_SIZE = 64  # Text searches kept per view, so paging through matches does not search again
+_SEPARATOR = '\x00'
+
+
+class _SearchIndex:
+    """
+    A column dictionary lowercased into one string, so a substring search over every distinct
+    value is a single scan; matches are mapped back to dictionary codes through the offsets.
+    """
+
+    def __init__(self, dictionary):
+        values = [value.lower() for value in dictionary]
+        self.text = _SEPARATOR.join(values) + _SEPARATOR
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values)) + 1
+        self.starts = np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(np.int64)
+
+    def codes(self, term):
+        """
+        Returns the sorted codes of the entries containing term (case-insensitive).
+        """
+        term = term.lower()
+        if not term or _SEPARATOR in term:
+            return np.arange(len(self.starts)) if not term else np.empty(0, dtype=np.intp)
+        positions = np.fromiter((match.start() for match in re.finditer(re.escape(term), self.text)), dtype=np.int64)
+        return np.unique(np.searchsorted(self.starts, positions, side='right') - 1)
+
+
+class TableView:
+    """
+    Filters, sorts and pages one ResultSet. Search indexes and sort orders are built on first use
+    and kept for the lifetime of the result set, so later interactions only combine masks and
+    slice; use table_view() to get the shared view of a result set.
+
+    Filters are a dictionary of column name to condition:
+    - {'values': [...]}: the value is one of those listed (categorical and boolean columns);
+    - {'contains': 'text'}: the value contains the text, ignoring case (categorical columns);
+    - {'min': x, 'max': y}: the value lies in the closed range (numeric and date/time columns;
+      either bound may be None).
+    Unbound values never match a condition.
+    """
+
+    def __init__(self, result_set, owned=False):
+        # Shared views only reference their result set weakly so they do not keep it alive
+        self._result_set = (lambda: result_set) if owned else weakref.ref(result_set)
+        self.row_count = len(result_set)
+        self._search_indexes = {}
+        self._matches = OrderedDict()
+        self._sort_keys_by_column = {}
+        self._sort_orders = {}
+        self._lock = threading.Lock()
+
+    @property
+    def result_set(self):
+        result_set = self._result_set()
+        if result_set is None:
+            raise ReferenceError("The results of this table view are no longer available.")
+        return result_set
+
+    def _matching_codes(self, column, term):
+        key = (column.name, term.lower())
+        with self._lock:
+            codes = self._matches.get(key)
+            if codes is not None:
+                self._matches.move_to_end(key)
+                return codes
+            index = self._search_indexes.get(column.name)
+            if index is None:
+                index = self._search_indexes[column.name] = _SearchIndex(column.dictionary)
+        codes = index.codes(term)
+        with self._lock:
+            self._matches[key] = codes
+            while len(self._matches) > SEARCH_CACHE_SIZE:
+                self._matches.popitem(last=False)
+        return codes
+
+    def _codes_mask(self, column, codes):
+        selected = np.zeros(len(column.dictionary) + 1, dtype=bool)  # Last slot: unbound (-1)
+        selected[codes] = True
+        return selected[column.values]
+
+    def _condition_mask(self, column, condition):
+        if column.kind == 'categorical':
+            if 'contains' in condition:
+                return self._codes_mask(column, self._matching_codes(column, condition['contains']))
+            lookup = {value: code for code, value in enumerate(self.distinct_values(column.name))}
+            codes = [lookup[value] for value in condition.get('values', ()) if value in lookup]
+            return self._codes_mask(column, np.array(codes, dtype=np.intp))
+        if 'values' in condition:
+            return np.isin(column.values, list(condition['values'])) & ~column.mask
+        mask = ~column.mask
+        low, high = condition.get('min'), condition.get('max')
+        if column.kind == 'datetime':
+            low = None if low is None else np.datetime64(pd.Timestamp(low).tz_localize(None), 'ns')
+            high = None if high is None else np.datetime64(pd.Timestamp(high).tz_localize(None), 'ns')
+        if low is not None:
+            mask &= column.values >= low
+        if high is not None:
+            mask &= column.values <= high
+        return mask
+
+    def distinct_values(self, name):
+        """
+        Returns the distinct values of a categorical column (its dictionary, in code order).
+        """
+        return list(self.result_set.column(name).dictionary)
+
+    def rows(self, filters=None, search=None, sort=None, descending=False):
+        """
+        Returns the positions of the matching rows, in display order.
+
+        Parameters:
+        - filters: Conditions by column name, see the class description.
+        - search: Text that at least one categorical column of the row must contain, ignoring case.
+        - sort: Column to order by (unbound values last), or None for the result order.
+        - descending: Reverse the sort order.
+        """
+        result_set = self.result_set
+        mask = None
+        for name, condition in (filters or {}).items():
+            condition_mask = self._condition_mask(result_set.column(name), condition)
+            mask = condition_mask if mask is None else mask & condition_mask
+        if search:
+            search_mask = np.zeros(self.row_count, dtype=bool)
+            for name in result_set.columns:
+                column = result_set.column(name)
+                if column.kind == 'categorical' and len(column.dictionary):
+                    search_mask |= self._codes_mask(column, self._matching_codes(column, search))
+            mask = search_mask if mask is None else mask & search_mask
+
+        if sort is None:
+            return np.flatnonzero(mask) if mask is not None else np.arange(self.row_count)
+        order = self._sort_order(result_set.column(sort), descending)
+        return order[mask[order]] if mask is not None else order
+
+    def _sort_keys(self, column):
+        """
+        Returns an array that orders the rows of a column like its values, built once per column.
+        """
+        with self._lock:
+            keys = self._sort_keys_by_column.get(column.name)
+        if keys is not None:
+            return keys
+        if column.kind == 'categorical':
+            # Rank the distinct values once, then sort the rows by the rank of their code
+            dictionary = np.array(list(column.dictionary), dtype=object)
+            ranks = np.empty(len(dictionary) + 1, dtype=np.int64)
+            ranks[np.argsort(dictionary, kind='stable')] = np.arange(len(dictionary))
+            ranks[-1] = len(dictionary)  # Unbound
+            keys = ranks[column.values]
+        elif column.kind == 'datetime':
+            keys = column.values.view(np.int64)
+        elif column.kind == 'boolean':
+            keys = column.values.astype(np.int8)
+        else:
+            keys = column.values
+        with self._lock:
+            self._sort_keys_by_column[column.name] = keys
+        return keys
+
+    def _sort_order(self, column, descending):
+        key = (column.name, descending)
+        with self._lock:
+            order = self._sort_orders.get(key)
+        if order is not None:
+            return order
+        keys = self._sort_keys(column)
+        if descending:
+            keys = -keys
+        # Unbound rows go last in either direction
+        unbound = column.mask
+        order = np.lexsort((keys, unbound)) if unbound.any() else np.argsort(keys, kind='stable')
+        order = order.astype(np.int32 if self.row_count < 2 ** 31 else np.int64)
+        with self._lock:
+            self._sort_orders[key] = order
+        return order
+
+    def page(self, rows, page, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Returns the DataFrame of one page (1-based) of the given row positions, indexed by their
+        position in the results.
+        """
+        selected = rows[(page - 1) * page_size:page * page_size]
+        frame = self.result_set.take(selected).to_dataframe()
+        frame.index = pd.Index(selected, name='row')
+        return frame
+
+
+_views = weakref.WeakKeyDictionary()
+_views_lock = threading.Lock()
+
+
+def table_view(data, columns=None):
+    """
+    Returns the TableView of a ResultSet, shared by every rerun and session showing it. Results
+    held as a list of rows are converted first (and get a view of their own each time).
+    """
+    if not isinstance(data, ResultSet):
+        return TableView(ResultSet.from_rows(data, columns), owned=True)
+    with _views_lock:
+        view = _views.get(data)
+        if view is None:
+            view = _views[data] = TableView(data)
+        return view
+
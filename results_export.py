@@ -1,26 +1,264 @@
-import pandas as pd
-import streamlit as st
-import xlsxwriter
-from io import BytesIO
+import importlib.util
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from metrics import default_registry
+from result_set import ResultSet
+
+DEFAULT_CHUNK_SIZE = 50000  # Rows rendered at a time; bounds the memory used by every writer
+EXCEL_MAX_ROWS = 1048576  # Rows per worksheet, header included
+
+
+def _as_result_set(data, columns):
+    if isinstance(data, ResultSet):
+        return data
+    return ResultSet.from_rows(data, columns)
+
+
+@contextmanager
+def _open_target(target):
+    """
+    Yields a binary file object for a path or an already open binary file.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, 'wb') as handle:
+            yield handle
+    else:
+        yield target
+
+
+def write_csv(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE, header=True):
+    """
+    Writes query results to CSV, rendering chunk_size rows at a time.
+
+    Parameters:
+    - data: A ResultSet or a list of rows.
+    - columns: The column names.
+    - target: A file path or a binary file object.
+    - chunk_size: Number of rows rendered per chunk.
+    - header: Whether to start with the header line (False to append to earlier results).
+    """
+    result_set = _as_result_set(data, columns)
+    with _open_target(target) as handle:
+        if not len(result_set) and header:
+            handle.write((','.join(result_set.columns or columns) + '\n').encode('utf-8'))
+        for index, chunk in enumerate(result_set.iter_chunks(chunk_size)):
+            handle.write(chunk.to_dataframe().to_csv(index=False, header=header and index == 0).encode('utf-8'))
+
+
+def write_ndjson(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results as line-delimited JSON, one object per row.
+
+    Parameters are the same as for write_csv.
+    """
+    result_set = _as_result_set(data, columns)
+    with _open_target(target) as handle:
+        for chunk in result_set.iter_chunks(chunk_size):
+            lines = chunk.to_dataframe().to_json(orient='records', lines=True, date_format='iso')
+            handle.write(lines.rstrip('\n').encode('utf-8') + b'\n')
+
+
+def write_json(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results as a JSON array of row objects, rendering chunk_size rows at a time.
+
+    Parameters are the same as for write_csv.
+    """
+    result_set = _as_result_set(data, columns)
+    with _open_target(target) as handle:
+        handle.write(b'[')
+        for index, chunk in enumerate(result_set.iter_chunks(chunk_size)):
+            records = chunk.to_dataframe().to_json(orient='records', date_format='iso')
+            if index:
+                handle.write(b',')
+            handle.write(records[1:-1].encode('utf-8'))  # Strip the chunk's own brackets
+        handle.write(b']')
+
+
+def write_excel(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results to an .xlsx workbook with xlsxwriter in constant_memory mode, which
+    flushes every row to disk as soon as the next one starts. Results longer than Excel's row
+    limit continue on additional worksheets.
+
+    Parameters are the same as for write_csv.
+    """
+    import xlsxwriter
+
+    result_set = _as_result_set(data, columns)
+    names = result_set.columns or columns
+    with _open_target(target) as handle:
+        workbook = xlsxwriter.Workbook(handle, {'constant_memory': True, 'nan_inf_to_errors': True, 'strings_to_urls': False})
+        header_format = workbook.add_format({'bold': True})
+        date_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+        date_positions = [position for position, name in enumerate(names)
+                          if len(result_set) and result_set.column(name).kind == 'datetime']
+
+        worksheet = None
+        row_index = EXCEL_MAX_ROWS
+        for chunk in result_set.iter_chunks(chunk_size) if len(result_set) else [None]:
+            rows = zip(*(chunk.column(name).to_list() for name in names)) if chunk is not None else []
+            for row in rows:
+                if row_index >= EXCEL_MAX_ROWS:
+                    worksheet = workbook.add_worksheet()
+                    worksheet.write_row(0, 0, names, header_format)
+                    row_index = 1
+                worksheet.write_row(row_index, 0, row)
+                for position in date_positions:
+                    if row[position] is not None:
+                        worksheet.write_datetime(row_index, position, row[position], date_format)
+                row_index += 1
+        if worksheet is None:
+            worksheet = workbook.add_worksheet()
+            worksheet.write_row(0, 0, names, header_format)
+        workbook.close()
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Parquet and Arrow exports need the optional 'pyarrow' package (pip install pyarrow).")
+    return pyarrow
+
+
+def _arrow_batch(pa, chunk):
+    """
+    Converts a ResultSet chunk into an Arrow record batch straight from its column arrays.
+    """
+    arrays = []
+    for name in chunk.columns:
+        column = chunk.column(name)
+        if column.kind == 'categorical':
+            # Compact dictionaries only expand the entries this chunk uses
+            arrays.append(pa.array(column.to_objects(), type=pa.string()))
+        else:
+            arrays.append(pa.array(column.values, mask=column.mask))
+    return pa.RecordBatch.from_arrays(arrays, names=chunk.columns)
+
+
+def _arrow_batches(data, columns, chunk_size):
+    result_set = _as_result_set(data, columns)
+    pa = _require_pyarrow()
+    schema = _arrow_batch(pa, result_set.slice(0, 0)).schema
+    return pa, schema, (_arrow_batch(pa, chunk) for chunk in result_set.iter_chunks(chunk_size))
+
+
+def write_parquet(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results to Parquet, one row group per chunk. Requires pyarrow.
+
+    Parameters are the same as for write_csv.
+    """
+    pa, schema, batches = _arrow_batches(data, columns, chunk_size)
+    import pyarrow.parquet as pq
+    with _open_target(target) as handle:
+        with pq.ParquetWriter(handle, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+
+def write_arrow_ipc(data, columns, target, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results as an Arrow IPC file, one record batch per chunk. Requires pyarrow.
+
+    Parameters are the same as for write_csv.
+    """
+    pa, schema, batches = _arrow_batches(data, columns, chunk_size)
+    with _open_target(target) as handle:
+        with pa.ipc.new_file(handle, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+
+# Format name -> (writer, download file name, MIME type)
+EXPORT_FORMATS = {
+    'CSV': (write_csv, 'query_results.csv', 'text/csv'),
+    'JSON': (write_json, 'query_results.json', 'application/json'),
+    'NDJSON': (write_ndjson, 'query_results.ndjson', 'application/x-ndjson'),
+    'Excel': (write_excel, 'query_results.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': (write_parquet, 'query_results.parquet', 'application/vnd.apache.parquet'),
+    'Arrow': (write_arrow_ipc, 'query_results.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def available_formats():
+    """
+    Returns the export formats usable in this environment (Parquet and Arrow need pyarrow).
+    """
+    has_pyarrow = importlib.util.find_spec('pyarrow') is not None
+    return [name for name in EXPORT_FORMATS if has_pyarrow or name not in ('Parquet', 'Arrow')]
+
+
+def export_to_file(data, columns, export_format, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results to a file on disk without involving Streamlit.
+
+    Parameters:
+    - data: A ResultSet or a list of rows.
+    - columns: The column names.
+    - export_format: One of the EXPORT_FORMATS keys.
+    - path: Destination file path.
+    - chunk_size: Number of rows rendered per chunk.
+    """
+    writer, _, _ = EXPORT_FORMATS[export_format]
+    writer(data, columns, path, chunk_size=chunk_size)
+
+
+def open_export(data, columns, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Writes query results to a temporary file on disk and returns it opened for reading.
+
+    The file is unlinked as soon as it is open, so it disappears from the disk once the
+    returned handle is closed.
+
+    Parameters:
+    - data: A ResultSet or a list of rows.
+    - columns: The column names.
+    - export_format: One of the EXPORT_FORMATS keys.
+    - chunk_size: Number of rows rendered per chunk.
+
+    Returns:
+    - A binary file object positioned at the start of the export.
+    """
+    _, file_name, _ = EXPORT_FORMATS[export_format]
+    handle, path = tempfile.mkstemp(suffix=os.path.splitext(file_name)[1])
+    os.close(handle)
+    try:
+        export_to_file(data, columns, export_format, path, chunk_size=chunk_size)
+        return open(path, 'rb')
+    finally:
+        os.unlink(path)
+
+
+def download_button(data, columns, export_format, label=None, trace_id=None):
+    """
+    Shows a Streamlit download button for the results in the given format.
+
+    The file is only generated when the button is clicked, instead of on every rerun of the
+    script. It is written to disk chunk by chunk and handed to Streamlit as an open file, so
+    the only copy held in memory is the one Streamlit serves. With the trace_id of the query
+    that produced the results, the generation time is recorded as its 'export' stage.
+    """
+    import streamlit as st
+    _, file_name, mime = EXPORT_FORMATS[export_format]
+
+    def generate():
+        with default_registry.span(trace_id, 'export'):
+            return open_export(data, columns, export_format)
+
+    st.download_button(label=label or f"Download as {export_format}", data=generate,
+                       file_name=file_name, mime=mime, on_click='ignore')
+
 
 def export_to_csv(data, columns):
-    df = pd.DataFrame(data, columns=columns)
-    csv = df.to_csv(index=False)
-    st.download_button(label="Download as CSV", data=csv, file_name="query_results.csv", mime='text/csv')
+    download_button(data, columns, 'CSV')
 
 def export_to_json(data, columns):
-    df = pd.DataFrame(data, columns=columns)
-    json = df.to_json(orient='records')
-    st.download_button(label="Download as JSON", data=json, file_name="query_results.json", mime='application/json')
+    download_button(data, columns, 'JSON')
 
 def export_to_excel(data, columns):
-    df = pd.DataFrame(data, columns=columns)
-    # Create a BytesIO buffer
-    output = BytesIO()
-    # Use ExcelWriter, specifying the engine and buffer
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
-    # Important: Seek to the start of the stream
-    output.seek(0)
-    # Use the buffer in Streamlit's download_button
-    st.download_button(label="Download as Excel", data=output, file_name="query_results.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    download_button(data, columns, 'Excel')
@@ -0,0 +1,351 @@
+import codecs
+import csv
+import json
+import re
+import time
+
+from result_set import XSD, ResultSet, build_column
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # Bytes read from the response stream at a time
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+# SPARQL 1.1 TSV results write RDF terms in Turtle syntax; numbers and booleans may appear bare
+_TSV_BARE_TERMS = [
+    (re.compile(r'[+-]?\d+$'), XSD + 'integer'),
+    (re.compile(r'[+-]?\d*\.\d+$'), XSD + 'decimal'),
+    (re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+$'), XSD + 'double'),
+    (re.compile(r'(?:true|false)$'), XSD + 'boolean'),
+]
+# CSV results carry no datatypes: columns whose values all look like numbers, booleans or dates
+# are typed from them. Integers with leading zeros are usually identifiers and stay text.
+_CSV_INFERRED_TERMS = [
+    (re.compile(r'[+-]?(?:0|[1-9]\d*)$'), XSD + 'integer'),
+    (re.compile(r'[+-]?\d*\.\d+$'), XSD + 'decimal'),
+    (re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+$'), XSD + 'double'),
+    (re.compile(r'(?:true|false)$'), XSD + 'boolean'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?$'), XSD + 'dateTime'),
+    (re.compile(r'\d{4}-\d{2}-\d{2}$'), XSD + 'date'),
+]
+_TSV_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+_TSV_ESCAPE_PATTERN = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+
+
+class ResultsParseError(ValueError):
+    """Raised when a response is not a well-formed SPARQL JSON results document."""
+
+
+class ColumnBuffers:
+    """
+    Per-variable value buffers filled one binding at a time.
+
+    Unbound values are stored as None. Variables that first appear part-way through the bindings
+    (or before head.vars has been read) are back-filled so every buffer has row_count entries.
+    kinds records, per variable, the set of literal datatypes (or term types for IRIs, blank
+    nodes and untyped literals) seen, which decides the column type later on.
+    """
+
+    def __init__(self, columns=()):
+        self.values = {}
+        self.kinds = {}
+        self.row_count = 0
+        for name in columns:
+            self.add_column(name)
+
+    def add_column(self, name):
+        if name not in self.values:
+            self.values[name] = [None] * self.row_count
+            self.kinds[name] = set()
+
+    def append(self, binding):
+        for name in binding:
+            if name not in self.values:
+                self.add_column(name)
+        kinds = self.kinds
+        for name, buffer in self.values.items():
+            term = binding.get(name)
+            if term is None:
+                buffer.append(None)
+            else:
+                buffer.append(term['value'])
+                kinds[name].add(term.get('datatype') or term.get('type'))
+        self.row_count += 1
+
+    def columns(self, order=()):
+        """
+        Returns the column names, listing those in order first.
+        """
+        names = [name for name in order if name in self.values]
+        return names + [name for name in self.values if name not in names]
+
+
+class _StreamReader:
+    """
+    Text cursor over a binary stream that pulls more data only when a token is incomplete.
+    """
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.position = 0
+        self.exhausted = False
+        self.bytes_read = 0
+
+    def _fill(self):
+        if self.exhausted:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.exhausted = True
+            self.buffer += self.decoder.decode(b'', final=True)
+            return False
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        self.bytes_read += len(chunk)
+        # Drop the consumed prefix so the buffer stays proportional to the chunk size
+        if self.position > len(self.buffer) // 2:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+        self.buffer += self.decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at end of stream)."""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in _WHITESPACE:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            found = self.peek() or 'end of stream'
+            raise ResultsParseError(f"Expected '{char}' in SPARQL JSON results, found {found!r}.")
+        self.position += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more of the stream as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as e:
+                if not self._fill():
+                    raise ResultsParseError(f"Malformed SPARQL JSON results: {e}") from None
+                continue
+            self.position = end
+            return value
+
+    def members(self):
+        """Iterates over the keys of the object whose '{' has just been consumed."""
+        if self.peek() == '}':
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            separator = self.peek()
+            self.position += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ResultsParseError(f"Expected ',' or '}}' in SPARQL JSON results, found {separator!r}.")
+
+    def elements(self):
+        """Iterates over the values of the array whose '[' has just been consumed."""
+        if self.peek() == ']':
+            self.position += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.position += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ResultsParseError(f"Expected ',' or ']' in SPARQL JSON results, found {separator!r}.")
+
+
+def parse_json_results(stream, buffers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Parses a SPARQL 1.1 JSON results document incrementally from a binary stream.
+
+    Only one binding object is decoded at a time; its values go straight into column buffers, so
+    the full results tree is never held in memory.
+
+    Parameters:
+    - stream: A file-like object with a read(size) method, e.g. an HTTP response.
+    - buffers: Optional ColumnBuffers (or compatible object) to fill.
+    - chunk_size: Number of bytes read from the stream at a time.
+
+    Returns:
+    A dictionary with the following keys:
+    - 'columns': The variable names, in head.vars order.
+    - 'buffers': The filled column buffers.
+    - 'boolean': The answer of an ASK query (None for SELECT results).
+    - 'has_bindings': Whether the document contained results.bindings.
+    - 'bytes_read': Number of bytes consumed from the stream.
+    """
+    reader = _StreamReader(stream, chunk_size)
+    buffers = buffers if buffers is not None else ColumnBuffers()
+    head_vars = []
+    boolean = None
+    has_bindings = False
+
+    reader.expect('{')
+    for key in reader.members():
+        if key == 'head':
+            head = reader.value()
+            head_vars = list(head.get('vars', []))
+            for name in head_vars:
+                buffers.add_column(name)
+        elif key == 'results':
+            reader.expect('{')
+            for results_key in reader.members():
+                if results_key == 'bindings':
+                    has_bindings = True
+                    reader.expect('[')
+                    for binding in reader.elements():
+                        buffers.append(binding)
+                else:
+                    reader.value()
+        elif key == 'boolean':
+            boolean = reader.value()
+        else:
+            reader.value()
+
+    return {
+        'columns': buffers.columns(head_vars),
+        'buffers': buffers,
+        'boolean': boolean,
+        'has_bindings': has_bindings,
+        'bytes_read': reader.bytes_read,
+    }
+
+
+class _CountingStream:
+    """
+    Wraps a binary stream and counts the bytes read through it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def _unescape_tsv(text):
+    def _replace(match):
+        code = match.group(1) or match.group(2)
+        if code:
+            return chr(int(code, 16))
+        return _TSV_ESCAPES.get(match.group(3), match.group(0))
+    return _TSV_ESCAPE_PATTERN.sub(_replace, text)
+
+
+def _parse_tsv_term(term):
+    """
+    Splits one TSV-encoded RDF term into its lexical value and its datatype (or term type).
+    """
+    first = term[0]
+    if first == '<':
+        return term[1:-1], 'uri'
+    if first == '"':
+        end = term.rfind('"')
+        lexical = term[1:end]
+        if '\\' in lexical:
+            lexical = _unescape_tsv(lexical)
+        suffix = term[end + 1:]
+        if suffix.startswith('^^<'):
+            return lexical, suffix[3:-1]
+        return lexical, 'literal'  # Plain or language-tagged
+    if term.startswith('_:'):
+        return term[2:], 'bnode'
+    for pattern, datatype in _TSV_BARE_TERMS:
+        if pattern.match(term):
+            return term, datatype
+    return term, 'literal'
+
+
+def _infer_csv_kinds(values):
+    """
+    Returns the datatypes a CSV column's values look like, or {'literal'} once one is plain text.
+    """
+    kinds = set()
+    for value in values:
+        kind = next((datatype for pattern, datatype in _CSV_INFERRED_TERMS if pattern.match(value)), None)
+        if kind is None:
+            return {'literal'}
+        kinds.add(kind)
+    return kinds
+
+
+def _delimited_column(name, series, parse_terms):
+    """
+    Builds a typed column from one parsed CSV/TSV column.
+
+    The column is factorized first, so term parsing and typing only run once per distinct value;
+    the result is then expanded back to every row through the codes.
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    uniques = uniques.tolist()
+    if parse_terms:
+        kinds = set()
+        lexicals = []
+        for term in uniques:
+            lexical, kind = _parse_tsv_term(term)
+            lexicals.append(lexical)
+            kinds.add(kind)
+    else:
+        kinds = _infer_csv_kinds(uniques)
+        lexicals = uniques
+    return build_column(name, lexicals, kinds).take(codes)
+
+
+def parse_delimited_results(stream, results_format):
+    """
+    Parses SPARQL 1.1 CSV or TSV results with pandas' C reader straight into result columns.
+
+    TSV keeps RDF term syntax, so IRIs, language tags and literal datatypes survive and columns
+    are typed as with JSON results. CSV carries plain strings only: columns whose values all look
+    like numbers, booleans or ISO dates are typed from them (integers with leading zeros excepted),
+    other columns are dictionary-encoded, and empty fields are treated as unbound.
+
+    Parameters:
+    - stream: A binary file-like object, e.g. an HTTP response.
+    - results_format: 'csv' or 'tsv'.
+
+    Returns:
+    A dictionary with 'result_set' (a ResultSet), 'bytes_read' and 'convert_time' (seconds spent
+    turning the parsed text into typed columns).
+    """
+    import pandas as pd
+
+    counting = _CountingStream(stream)
+    options = dict(dtype=str, keep_default_na=False, na_values=[''], header=0, encoding='utf-8')
+    if results_format == 'tsv':
+        options.update(sep='\t', quoting=csv.QUOTE_NONE)
+    try:
+        frame = pd.read_csv(counting, **options)
+    except pd.errors.EmptyDataError:
+        return {'result_set': ResultSet([]), 'bytes_read': counting.bytes_read, 'convert_time': 0.0}
+
+    convert_start = time.perf_counter()
+    columns = []
+    for raw_name in frame.columns:
+        name = raw_name.lstrip('?$') if results_format == 'tsv' else raw_name
+        columns.append(_delimited_column(name, frame[raw_name], parse_terms=results_format == 'tsv'))
+    return {'result_set': ResultSet(columns), 'bytes_read': counting.bytes_read,
+            'convert_time': time.perf_counter() - convert_start}
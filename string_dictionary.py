@@ -0,0 +1,192 @@
+"""
+Compact storage for the dictionaries of categorical result columns.
+
+A column of IRIs such as http://data.europa.eu/a4g/resource/id_2022-... has one dictionary entry
+per distinct value, and as Python strings each entry costs some 50 bytes of object overhead plus
+the full IRI. A StringDictionary keeps the same entries as a namespace id per entry (into a
+NamespaceTable shared by every result of the process) and the remaining local parts as one UTF-8
+buffer, which is typically a quarter of the memory. Entries are expanded back to strings only
+when they are read, e.g. for the rows on display or in an export.
+"""
+import threading
+from collections import Counter
+
+import numpy as np
+
+MAX_NAMESPACES = 65535  # Namespace ids are stored as uint16; id 0 is the empty namespace
+MIN_NAMESPACE_ENTRIES = 2  # Entries that must share a namespace for it to be worth a table slot
+_SEPARATOR = '\x00'  # Between local parts in the buffer, so expanding everything is one split()
+
+
+class NamespaceTable:
+    """
+    Append-only table of IRI namespaces shared by all StringDictionaries, so that each namespace
+    string is held once per process. Ids are stable while the process lives; pickled
+    dictionaries store the namespace strings themselves (see StringDictionary.__getstate__).
+    """
+
+    def __init__(self, capacity=MAX_NAMESPACES):
+        self.capacity = capacity
+        self._namespaces = ['']
+        self._ids = {'': 0}
+        self._lock = threading.Lock()
+
+    def intern(self, namespace):
+        """
+        Returns the id of a namespace, adding it if needed; 0 (no compression) once the table is full.
+        """
+        namespace_id = self._ids.get(namespace)
+        if namespace_id is not None:
+            return namespace_id
+        with self._lock:
+            namespace_id = self._ids.get(namespace)
+            if namespace_id is None:
+                if len(self._namespaces) >= self.capacity:
+                    return 0
+                namespace_id = len(self._namespaces)
+                self._namespaces.append(namespace)
+                self._ids[namespace] = namespace_id
+            return namespace_id
+
+    def __getitem__(self, namespace_id):
+        return self._namespaces[namespace_id]
+
+    def __len__(self):
+        return len(self._namespaces)
+
+
+default_namespaces = NamespaceTable()
+
+
+class StringDictionary:
+    """
+    Read-only sequence of distinct strings stored as namespace ids and UTF-8 local parts; a
+    drop-in for the list dictionaries of result_set.Column.
+
+    Parameters:
+    - namespace_ids: uint16 array, one NamespaceTable id per entry.
+    - offsets: Start of each entry's local part in buffer, plus the end of the buffer.
+    - buffer: The local parts, UTF-8 encoded, each followed by a separator.
+    - namespaces: The NamespaceTable the ids refer to.
+    """
+
+    def __init__(self, namespace_ids, offsets, buffer, namespaces=default_namespaces):
+        self.namespace_ids = namespace_ids
+        self.offsets = offsets
+        self.buffer = buffer
+        self.namespaces = namespaces
+
+    @classmethod
+    def from_strings(cls, values, prefixes=None, namespaces=default_namespaces):
+        """
+        Compresses a list of distinct strings.
+
+        Each entry is split after its last '/' or '#'; namespaces shared by fewer than
+        MIN_NAMESPACE_ENTRIES entries are replaced by the longest matching prefix IRI from
+        prefixes (e.g. the query's PREFIX declarations), or kept in the local part.
+
+        Returns:
+        A StringDictionary, or None if a value contains the NUL separator.
+        """
+        if any(_SEPARATOR in value for value in values):
+            return None
+        # Split after the last '/' (or a '#' after it) without a Python call per value
+        cuts = [value.rfind('/') + 1 for value in values]
+        local_parts = [value[cut:] for value, cut in zip(values, cuts)]
+        for index in [index for index, local in enumerate(local_parts) if '#' in local]:
+            cuts[index] = values[index].rfind('#') + 1
+            local_parts[index] = values[index][cuts[index]:]
+        entry_namespaces = [value[:cut] for value, cut in zip(values, cuts)]
+
+        counts = Counter(entry_namespaces)
+        rare = {namespace for namespace, count in counts.items() if count < MIN_NAMESPACE_ENTRIES}
+        if rare:
+            declared = sorted(set((prefixes or {}).values()), key=len, reverse=True)
+            for index in [index for index, namespace in enumerate(entry_namespaces) if namespace in rare]:
+                value = values[index]
+                namespace = next((prefix for prefix in declared if value.startswith(prefix)), '')
+                entry_namespaces[index] = namespace
+                local_parts[index] = value[len(namespace):]
+
+        ids = {namespace: namespaces.intern(namespace) for namespace in set(entry_namespaces)}
+        namespace_ids = np.array([ids[namespace] for namespace in entry_namespaces], dtype=np.uint16)
+        if any(namespace_id == 0 and namespace for namespace, namespace_id in ids.items()):
+            # The table is full: keep the values of namespaces it could not take whole
+            for index in np.flatnonzero(namespace_ids == 0).tolist():
+                local_parts[index] = values[index]
+
+        text = _SEPARATOR.join(local_parts) + _SEPARATOR if local_parts else ''
+        buffer = text.encode('utf-8')
+        if len(buffer) == len(text):
+            lengths = np.fromiter(map(len, local_parts), dtype=np.int64, count=len(local_parts))
+        else:
+            lengths = np.fromiter((len(part.encode('utf-8')) for part in local_parts), dtype=np.int64,
+                                  count=len(local_parts))
+        offsets = np.zeros(len(local_parts) + 1, dtype=np.int64)
+        np.cumsum(lengths + 1, out=offsets[1:])
+        if offsets[-1] < np.iinfo(np.uint32).max:
+            offsets = offsets.astype(np.uint32)
+        return cls(namespace_ids, offsets, buffer, namespaces)
+
+    def __len__(self):
+        return len(self.namespace_ids)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1]) - 1
+        return self.namespaces[self.namespace_ids[index]] + self.buffer[start:end].decode('utf-8')
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """
+        Expands every entry.
+        """
+        if not len(self):
+            return []
+        table = self.namespaces
+        namespaces = [table[namespace_id] for namespace_id in range(int(self.namespace_ids.max()) + 1)]
+        local_parts = self.buffer.decode('utf-8').split(_SEPARATOR)
+        return [namespaces[namespace_id] + local for namespace_id, local in zip(self.namespace_ids.tolist(), local_parts)]
+
+    def take(self, indices):
+        """
+        Expands the entries at the given positions, as a list.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        if len(indices) * 4 >= len(self):
+            expanded = self.tolist()
+            return [expanded[index] for index in indices.tolist()]
+        return [self[index] for index in indices.tolist()]
+
+    def nbytes(self):
+        return self.namespace_ids.nbytes + self.offsets.nbytes + len(self.buffer)
+
+    def __getstate__(self):
+        # Namespace ids are only meaningful in this process: pickle the namespaces used instead
+        used, local_ids = np.unique(self.namespace_ids, return_inverse=True)
+        return {
+            'namespace_list': [self.namespaces[namespace_id] for namespace_id in used.tolist()],
+            'local_ids': local_ids.astype(np.uint16),
+            'offsets': self.offsets,
+            'buffer': self.buffer,
+        }
+
+    def __setstate__(self, state):
+        self.namespaces = default_namespaces
+        self.offsets = state['offsets']
+        self.buffer = state['buffer']
+        namespace_list = state['namespace_list']
+        mapping = [default_namespaces.intern(namespace) for namespace in namespace_list]
+        if all(namespace_id or not namespace for namespace_id, namespace in zip(mapping, namespace_list)):
+            self.namespace_ids = np.array(mapping, dtype=np.uint16)[state['local_ids']]
+            return
+        # The table of this process is full: compress the entries again, keeping those whole
+        local_parts = self.buffer.decode('utf-8').split(_SEPARATOR)
+        values = [namespace_list[local_id] + local for local_id, local in zip(state['local_ids'].tolist(), local_parts)]
+        self.__dict__.update(StringDictionary.from_strings(values).__dict__)
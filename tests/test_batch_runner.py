@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import batch_runner
+from query_executor import QueryCancelled
+
+
+def fake_execute(durations, stopped):
+    """
+    Stands in for execute_query: each query runs for durations[query] seconds, checking its
+    progress object like a paged query between reads, and records how it ended.
+    """
+    def execute(endpoint, query, timeout=None, progress=None, **options):
+        end = time.monotonic() + durations[query]
+        try:
+            while time.monotonic() < end:
+                progress.check()
+                time.sleep(0.01)
+        except QueryCancelled as e:
+            stopped[query] = 'cancelled'
+            return {'success': False, 'columns': [], 'data': [], 'error': str(e), 'execution_time': 0.0,
+                    'cached': False}
+        stopped[query] = 'finished'
+        return {'success': True, 'columns': [], 'data': [], 'error': None, 'execution_time': durations[query],
+                'cached': False}
+    return execute
+
+
+def jobs(*queries):
+    return [{'name': query, 'endpoint': 'http://example.org/sparql', 'query': query} for query in queries]
+
+
+def test_timed_out_query_is_stopped(monkeypatch):
+    stopped = {}
+    monkeypatch.setattr(batch_runner, 'execute_query', fake_execute({'slow': 5}, stopped))
+    outcomes = batch_runner.run_batch_sync(jobs('slow'), timeout=0.2)
+    assert outcomes[0]['result']['error'] == "Query timed out after 0.2 seconds."
+    deadline = time.monotonic() + 2
+    while 'slow' not in stopped and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stopped['slow'] == 'cancelled'
+
+
+def test_timeout_starts_when_the_query_does(monkeypatch):
+    stopped = {}
+    monkeypatch.setattr(batch_runner, 'execute_query', fake_execute({'first': 0.15, 'second': 0.15}, stopped))
+    outcomes = batch_runner.run_batch_sync(jobs('first', 'second'), concurrency=1, timeout=0.25)
+    assert [outcome['result']['success'] for outcome in outcomes] == [True, True]
+    assert outcomes[1]['queued_time'] >= 0.15
+
+
+def test_slot_is_held_until_a_timed_out_query_stops(monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def execute(endpoint, query, timeout=None, progress=None, **options):
+        with lock:
+            running.append(query)
+            peak.append(len(running))
+        try:
+            # Ignores its deadline for a while, like a blocking read
+            time.sleep(0.3 if query == 'stuck' else 0.05)
+            return {'success': True, 'columns': [], 'data': [], 'error': None, 'execution_time': 0.0,
+                    'cached': False}
+        finally:
+            with lock:
+                running.remove(query)
+
+    monkeypatch.setattr(batch_runner, 'execute_query', execute)
+    outcomes = batch_runner.run_batch_sync(jobs('stuck', 'next'), concurrency=1, timeout=0.1)
+    assert max(peak) == 1
+    assert {outcome['name']: outcome['result']['success'] for outcome in outcomes} == {'stuck': False, 'next': True}
+
+
+def test_closing_the_batch_cancels_running_queries(monkeypatch):
+    stopped = {}
+    monkeypatch.setattr(batch_runner, 'execute_query', fake_execute({'quick': 0.01, 'slow': 5}, stopped))
+
+    async def first_outcome():
+        batch = batch_runner.run_batch(jobs('quick', 'slow'), timeout=30)
+        outcome = await batch.__anext__()
+        await batch.aclose()
+        return outcome
+
+    assert asyncio.run(first_outcome())['name'] == 'quick'
+    deadline = time.monotonic() + 2
+    while 'slow' not in stopped and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stopped['slow'] == 'cancelled'
@@ -0,0 +1,33 @@
+import subprocess
+import sys
+
+from http_transport import DEFAULT_POOL_SIZE, get_transport
+from query_executor import reserve_connections
+
+
+def pool_size(transport):
+    return transport.session.get_adapter(transport.endpoint).poolmanager.connection_pool_kw['maxsize']
+
+
+def test_transport_works_without_higher_level_modules():
+    script = ("import sys, http_transport; t = http_transport.SparqlTransport('http://example.org/sparql'); "
+              "sys.stdout.write(str(t.pool_size))")
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                            cwd=__file__.rsplit('/tests/', 1)[0]).stdout
+    assert output == str(DEFAULT_POOL_SIZE)
+
+
+def test_pool_grows_for_concurrent_paged_queries():
+    endpoint = 'http://pool.example.org/sparql'
+    assert pool_size(get_transport(endpoint)) == DEFAULT_POOL_SIZE
+    reserve_connections(endpoint, 4, paged=True, max_workers=4)
+    assert pool_size(get_transport(endpoint)) == 16
+    reserve_connections(endpoint, 2)
+    assert get_transport(endpoint).pool_size == 16
+
+
+def test_local_stores_get_no_transport():
+    import http_transport
+
+    reserve_connections('local:/tmp/no-such-store', 4, paged=True)
+    assert 'local:/tmp/no-such-store' not in http_transport._transports
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+from jobs import CANCELLED, DONE, JobManager
+
+ENDPOINT = 'http://example.org/sparql'
+QUERY = 'SELECT * WHERE { ?s ?p ?o } LIMIT 10'
+
+
+def blocking_runner(release, calls):
+    """
+    A runner that holds its job running until release is set, honouring cancellation meanwhile.
+    """
+    def runner(endpoint, query, progress=None, timeout=None, **options):
+        calls.append(query)
+        while not release.wait(0.01):
+            progress.check()
+        return {'success': True, 'columns': [], 'data': [], 'error': None, 'execution_time': 0.0, 'cached': False}
+    return runner
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=4)
+    yield manager
+    manager.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def test_identical_submissions_share_one_job(manager):
+    release, calls = threading.Event(), []
+    runner = blocking_runner(release, calls)
+    first = manager.submit(ENDPOINT, QUERY, runner=runner)
+    second = manager.submit(ENDPOINT, QUERY, runner=runner)
+    assert first == second
+    assert manager.status(first)['subscribers'] == 2
+
+    release.set()
+    assert manager.wait(first, timeout=5)['state'] == DONE
+    assert calls == [QUERY]
+
+
+def test_different_variants_run_separately(manager):
+    release, calls = threading.Event(), []
+    runner = blocking_runner(release, calls)
+    first = manager.submit(ENDPOINT, QUERY, runner=runner)
+    second = manager.submit(ENDPOINT, QUERY, runner=runner, variant='incremental')
+    assert first != second
+    release.set()
+    manager.wait(first, timeout=5)
+    manager.wait(second, timeout=5)
+    assert len(calls) == 2
+
+
+def test_job_runs_on_while_a_subscriber_remains(manager):
+    release, calls = threading.Event(), []
+    runner = blocking_runner(release, calls)
+    job_id = manager.submit(ENDPOINT, QUERY, runner=runner)
+    manager.submit(ENDPOINT, QUERY, runner=runner)
+    manager.cancel(job_id)
+
+    release.set()
+    assert manager.wait(job_id, timeout=5)['state'] == DONE
+
+
+def test_resubmitting_after_cancel_starts_a_new_job(manager):
+    release, calls = threading.Event(), []
+    runner = blocking_runner(release, calls)
+    cancelled_id = manager.submit(ENDPOINT, QUERY, runner=runner)
+    manager.cancel(cancelled_id)
+    new_id = manager.submit(ENDPOINT, QUERY, runner=runner)
+    assert new_id != cancelled_id
+    assert manager.wait(cancelled_id, timeout=5)['state'] == CANCELLED
+
+    # The cancelled job finishing must not take the new one out of single flight
+    assert manager.submit(ENDPOINT, QUERY, runner=runner) == new_id
+    release.set()
+    assert manager.wait(new_id, timeout=5)['state'] == DONE
+
+
+def test_released_results_are_no_longer_held(manager):
+    release, calls = threading.Event(), []
+    job_id = manager.submit(ENDPOINT, QUERY, runner=blocking_runner(release, calls))
+    release.set()
+    assert manager.wait(job_id, timeout=5)['result']['data'] == []
+    manager.release_result(job_id)
+    result = manager.status(job_id)['result']
+    assert result['success'] and result['data'] is None
@@ -0,0 +1,133 @@
+import pytest
+
+from local_store import LOCAL_SCHEME, LoadError, LocalStore, format_term, load_dumps, open_store, parse_term
+from query_executor import execute_query
+
+EX = 'http://example.org/'
+DUMP = f"""\
+<{EX}alice> <{EX}name> "Alice" .
+<{EX}alice> <{EX}age> "34"^^<http://www.w3.org/2001/XMLSchema#integer> .
+<{EX}alice> <{EX}knows> <{EX}bob> .
+<{EX}bob> <{EX}name> "Bob \\"the builder\\""@en .
+<{EX}bob> <{EX}age> "29"^^<http://www.w3.org/2001/XMLSchema#integer> .
+<{EX}bob> <{EX}knows> _:someone .
+_:someone <{EX}name> "Carol" .
+<{EX}alice> <{EX}name> "Alice" .
+"""
+
+
+@pytest.fixture
+def dump(tmp_path):
+    path = tmp_path / 'people.nt'
+    path.write_text(DUMP, encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def endpoint(tmp_path, dump):
+    endpoint = LOCAL_SCHEME + str(tmp_path / 'store')
+    load_dumps(endpoint, [dump], max_workers=1)
+    return endpoint
+
+
+def test_load_keeps_distinct_triples(tmp_path, dump):
+    store = LocalStore(str(tmp_path / 'store'))
+    summary = store.load([dump], max_workers=1)
+    assert summary['triples'] == summary['triples_added'] == 7
+    assert len(store) == 7
+    # Blank nodes are scoped to the load they come from: only the two triples of the new one are added
+    again = store.load([dump], max_workers=1)
+    assert again['terms_added'] == 1
+    assert again['triples_added'] == 2
+
+
+def test_store_is_reopened_from_disk(tmp_path, dump):
+    LocalStore(str(tmp_path / 'store')).load([dump], max_workers=1)
+    store = LocalStore(str(tmp_path / 'store'))
+    assert len(store) == 7
+    assert store.revision == 1
+    alice = store._lookup(f"<{EX}alice>")
+    name = store._lookup(f"<{EX}name>")
+    rows = store.match(subject=alice, predicate=name)
+    assert [store.term_text(term_id) for term_id in rows[:, 2]] == ['"Alice"']
+    assert store._lookup(f"<{EX}nobody>") is None
+
+
+def test_terms_round_trip():
+    for text in [f"<{EX}alice>", '"Bob \\"the builder\\""@en', '"34"^^<http://www.w3.org/2001/XMLSchema#integer>']:
+        assert format_term(parse_term(text)) == text
+
+
+def test_select_query(endpoint):
+    result = execute_query(endpoint, f"""
+        PREFIX ex: <{EX}>
+        SELECT ?person ?name ?age WHERE {{ ?person ex:name ?name ; ex:age ?age }} ORDER BY ?age
+    """, use_cache=False)
+    assert result['success'], result['error']
+    assert result['columns'] == ['person', 'name', 'age']
+    frame = result['data'].to_dataframe()
+    assert frame['name'].tolist() == ['Bob "the builder"', 'Alice']
+    assert frame['age'].tolist() == [29, 34]
+    assert frame['person'].tolist() == [f"{EX}bob", f"{EX}alice"]
+
+
+def test_ask_query(endpoint):
+    store = open_store(endpoint)
+    assert store.query(f"ASK {{ <{EX}alice> <{EX}knows> <{EX}bob> }}")['boolean'] is True
+    assert store.query(f"ASK {{ <{EX}bob> <{EX}knows> <{EX}alice> }}")['boolean'] is False
+
+
+def test_results_are_cached_until_the_next_load(endpoint, dump, tmp_path):
+    from query_cache import QueryCache
+
+    cache = QueryCache(disk_dir=None)
+    query = f"SELECT ?s WHERE {{ ?s <{EX}knows> ?o }}"
+    assert not execute_query(endpoint, query, cache=cache)['cached']
+    assert execute_query(endpoint, query, cache=cache)['cached']
+    extra = tmp_path / 'extra.nt'
+    extra.write_text(f"<{EX}carol> <{EX}knows> <{EX}alice> .\n", encoding='utf-8')
+    load_dumps(endpoint, [str(extra)], max_workers=1)
+    result = execute_query(endpoint, query, cache=cache)
+    assert not result['cached']
+    assert len(result['data']) == 3
+
+
+def test_missing_store_is_reported(tmp_path):
+    with pytest.raises(LoadError):
+        open_store(LOCAL_SCHEME + str(tmp_path / 'empty'))
+    result = execute_query(LOCAL_SCHEME + str(tmp_path / 'empty'), 'SELECT * WHERE { ?s ?p ?o }', use_cache=False)
+    assert not result['success']
+    assert 'No local store' in result['error']
+
+
+def test_queries_are_parsed_under_the_shared_lock(endpoint, monkeypatch):
+    import threading
+
+    import query_analysis
+
+    class CountingLock:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.acquired = 0
+
+        def __enter__(self):
+            self.lock.acquire()
+            self.acquired += 1
+
+        def __exit__(self, *exc_info):
+            self.lock.release()
+
+    lock = CountingLock()
+    monkeypatch.setattr(query_analysis, '_parse_lock', lock)
+    open_store(endpoint).query(f"SELECT ?name WHERE {{ <{EX}alice> <{EX}name> ?name }}")
+    assert lock.acquired == 1
+
+
+def test_concurrent_queries(endpoint):
+    from concurrent.futures import ThreadPoolExecutor
+
+    queries = [f"SELECT ?o WHERE {{ ?s <{EX}{predicate}> ?o }}" for predicate in ('name', 'age', 'knows') * 8]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(lambda query: execute_query(endpoint, query, use_cache=False), queries))
+    assert all(result['success'] for result in results)
+    assert [len(result['data']) for result in results[:3]] == [3, 2, 2]
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+from query_analysis import canonical_query
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WILDCARD = "SELECT * WHERE { ?a ?p ?x . ?a ?q ?y . ?y ?r ?z . ?z ?t ?w . ?w ?u [ ?v ?b ] }"
+
+
+def canonical_in_subprocess(query, seed):
+    environment = dict(os.environ, PYTHONHASHSEED=str(seed))
+    script = "import sys; from query_analysis import canonical_query; sys.stdout.write(canonical_query(sys.argv[1]))"
+    return subprocess.run([sys.executable, '-c', script, query], cwd=REPO, env=environment,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def test_canonical_form_does_not_depend_on_the_hash_seed():
+    forms = {canonical_in_subprocess(WILDCARD, seed) for seed in (1, 2, 3)}
+    assert forms == {canonical_query(WILDCARD)}
+
+
+def test_canonical_form_ignores_formatting_and_prefix_names():
+    first = "PREFIX a: <http://example.org/>\nSELECT ?s WHERE { ?s a:p 1 } # comment"
+    second = "prefix b: <http://example.org/> select ?s where {?s b:p \"1\"^^<http://www.w3.org/2001/XMLSchema#integer>}"
+    assert canonical_query(first) == canonical_query(second)
+
+
+def test_explicit_projection_order_is_kept():
+    assert canonical_query("SELECT ?a ?b WHERE { ?a ?p ?b }") != canonical_query("SELECT ?b ?a WHERE { ?a ?p ?b }")
+
+
+def test_triple_order_within_a_pattern_is_ignored():
+    assert (canonical_query("SELECT ?a WHERE { ?a ?p ?b . ?b ?q ?c }")
+            == canonical_query("SELECT ?a WHERE { ?b ?q ?c . ?a ?p ?b }"))
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import pytest
+
+import query_cache
+from query_cache import QueryCache
+
+ENDPOINT = 'http://example.org/sparql'
+QUERY = 'SELECT ?s WHERE { ?s ?p ?o }'
+OTHER = 'SELECT ?o WHERE { ?s ?p ?o }'
+
+
+def result(data):
+    return {'success': True, 'columns': [], 'data': data, 'error': None}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QueryCache(disk_dir=str(tmp_path))
+
+
+def blocking_dump(monkeypatch):
+    """
+    Makes the disk tier's pickle.dump wait until the returned event is set; started is set once
+    a write is waiting.
+    """
+    release, started = threading.Event(), threading.Event()
+    dump = query_cache.pickle.dump
+
+    def wait_then_dump(*args, **kwargs):
+        started.set()
+        assert release.wait(5)
+        return dump(*args, **kwargs)
+
+    monkeypatch.setattr(query_cache.pickle, 'dump', wait_then_dump)
+    return release, started
+
+
+def test_results_survive_a_restart(cache, tmp_path):
+    cache.put(ENDPOINT, QUERY, result([1, 2, 3]))
+    assert QueryCache(disk_dir=str(tmp_path)).get(ENDPOINT, QUERY) == result([1, 2, 3])
+
+
+def test_lookups_do_not_wait_for_disk_writes(cache, monkeypatch):
+    cache.put(ENDPOINT, OTHER, result('other'))
+    release, started = blocking_dump(monkeypatch)
+    writer = threading.Thread(target=cache.put, args=(ENDPOINT, QUERY, result('slow')))
+    writer.start()
+    try:
+        assert started.wait(5)
+        assert cache.get(ENDPOINT, OTHER)['data'] == 'other'
+        assert cache.get(ENDPOINT, QUERY)['data'] == 'slow'  # Already in the memory tier
+    finally:
+        release.set()
+        writer.join()
+
+
+def test_invalidation_during_a_write_drops_the_file(cache, tmp_path, monkeypatch):
+    release, started = blocking_dump(monkeypatch)
+    writer = threading.Thread(target=cache.put, args=(ENDPOINT, QUERY, result('stale')))
+    writer.start()
+    assert started.wait(5)
+    cache.invalidate(ENDPOINT, QUERY)
+    release.set()
+    writer.join()
+    assert cache.get(ENDPOINT, QUERY) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_writes_leave_no_temporary_file(cache, tmp_path):
+    cache.put(ENDPOINT, QUERY, result(lambda: None))  # Cannot be pickled
+    assert os.listdir(tmp_path) == []
+    assert callable(cache.get(ENDPOINT, QUERY)['data'])
+
+
+def test_expired_results_are_dropped(cache, tmp_path):
+    cache.put(ENDPOINT, QUERY, result('old'), ttl=-1)
+    assert cache.get(ENDPOINT, QUERY) is None
+    assert os.listdir(tmp_path) == []
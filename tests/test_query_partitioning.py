@@ -0,0 +1,63 @@
+import datetime
+
+import pytest
+
+import query_partitioning
+from query_partitioning import QueryTemplate, run_partitioned
+from result_set import ResultSet
+
+ENDPOINT = 'http://example.org/sparql'
+
+
+@pytest.fixture
+def template():
+    return QueryTemplate('SELECT ?n WHERE { ?s ?p ?n FILTER(?n >= {{start}} && ?n < {{end}}) }',
+                         defaults={'start': datetime.date(2023, 1, 1), 'end': datetime.date(2023, 4, 1)},
+                         partition='month')
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    """
+    Replaces execute_query with one answering each month from a dictionary of results.
+    """
+    answers = {}
+
+    def execute_query(endpoint, query, **options):
+        month = next(month for month in answers if f'"{month}' in query)
+        return {'cached': False, 'execution_time': 0.0, 'stages': {}, **answers[month]}
+
+    monkeypatch.setattr(query_partitioning, 'execute_query', execute_query)
+    monkeypatch.setattr(query_partitioning, 'reserve_connections', lambda *args, **kwargs: None)
+    return answers
+
+
+def success(rows):
+    data = ResultSet.from_rows(rows, ['n'])
+    return {'success': True, 'columns': data.columns if rows else [], 'data': data, 'error': None}
+
+
+def test_partition_rows_are_concatenated_in_range_order(template, answers):
+    answers.update({'2023-01': success([['1']]), '2023-02': success([]), '2023-03': success([['3'], ['4']])})
+    result = run_partitioned(ENDPOINT, template)
+    assert result['success'] and result['error'] is None
+    assert result['data'].to_rows() == [['1'], ['3'], ['4']]
+    assert [partition['rows'] for partition in result['partitions']] == [1, 0, 2]
+
+
+def test_partitions_without_rows_are_a_successful_empty_result(template, answers):
+    answers.update({'2023-01': success([]), '2023-02': success([]), '2023-03': success([])})
+    result = run_partitioned(ENDPOINT, template)
+    assert result['success'] and result['error'] is None
+    assert isinstance(result['data'], ResultSet) and len(result['data']) == 0
+    assert result['columns'] == []
+
+
+def test_a_failed_partition_fails_the_run_but_data_stays_a_result_set(template, answers):
+    answers.update({'2023-01': success([['1']]),
+                    '2023-02': {'success': False, 'columns': [], 'data': [], 'error': 'Timeout'},
+                    '2023-03': success([['3']])})
+    result = run_partitioned(ENDPOINT, template)
+    assert not result['success']
+    assert result['error'] == 'Partition 2023-02-01 to 2023-03-01: Timeout'
+    assert isinstance(result['data'], ResultSet)
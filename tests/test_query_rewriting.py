@@ -0,0 +1,76 @@
+import pytest
+from rdflib import Dataset, Graph, Literal, URIRef
+import rdflib.plugins.sparql
+
+from query_rewriting import aggregate_query, paginate_query, projected_variables
+
+EX = 'http://example.org/'
+VALUES_QUERY = f'''SELECT ?item ?n WHERE {{ ?item <{EX}n> ?n }}
+VALUES ?item {{ <{EX}a> <{EX}b> <{EX}c> }}'''
+
+
+def rows(graph, query):
+    return [tuple(str(term) for term in row) for row in graph.query(query)]
+
+
+@pytest.fixture
+def graph():
+    graph = Graph()
+    for index in range(12):
+        graph.add((URIRef(EX + 'abcd'[index % 4]), URIRef(EX + 'n'), Literal(index)))
+    return graph
+
+
+@pytest.fixture
+def dataset(monkeypatch):
+    """
+    A dataset with two named graphs, which FROM and FROM NAMED select without loading anything.
+    """
+    monkeypatch.setattr(rdflib.plugins.sparql, 'SPARQL_LOAD_GRAPHS', False)
+    dataset = Dataset()
+    for name, count in (('g1', 5), ('g2', 3)):
+        graph = dataset.graph(URIRef(EX + name))
+        for index in range(count):
+            graph.add((URIRef(EX + 'ab'[index % 2]), URIRef(EX + 'n'), Literal(index)))
+    return dataset
+
+
+def test_pages_of_a_query_with_a_trailing_values_block_cover_its_results(graph):
+    pages = [paginate_query(VALUES_QUERY, 4, page) for page in range(3)]
+    assert all(page.rstrip().endswith('}') and 'VALUES' in page.split('OFFSET')[1] for page in pages)
+    paged = [row for page in pages for row in rows(graph, page)]
+    assert len(paged) == 9
+    assert sorted(paged) == sorted(rows(graph, VALUES_QUERY))
+
+
+def test_pages_honour_a_limit_before_a_trailing_values_block(graph):
+    query = VALUES_QUERY.replace('\nVALUES', ' LIMIT 5\nVALUES')
+    assert len(rows(graph, paginate_query(query, 4, 0))) == 4
+    assert len(rows(graph, paginate_query(query, 4, 1))) == 1
+    assert paginate_query(query, 4, 2) is None
+
+
+def test_aggregating_a_query_with_a_trailing_values_block_keeps_its_rows(graph):
+    rewritten, alias = aggregate_query(VALUES_QUERY, 'item')
+    assert alias == 'count_rows'
+    assert sorted(rows(graph, rewritten)) == [(EX + 'a', '3'), (EX + 'b', '3'), (EX + 'c', '3')]
+
+
+def test_aggregating_moves_dataset_clauses_to_the_outer_query(dataset):
+    query = f'SELECT ?item ?n FROM <{EX}g1> WHERE {{ ?item <{EX}n> ?n }}'
+    rewritten, alias = aggregate_query(query, 'item', 'n', 'SUM')
+    assert rewritten.index(f'FROM <{EX}g1>') < rewritten.index('WHERE')
+    assert rewritten.count('FROM') == 1
+    assert sorted(rows(dataset, rewritten)) == [(EX + 'a', '6'), (EX + 'b', '4')]
+
+
+def test_aggregating_keeps_from_named_graphs(dataset):
+    query = f'''SELECT ?item ?n FROM NAMED <{EX}g1> FROM NAMED <{EX}g2>
+WHERE {{ GRAPH ?g {{ ?item <{EX}n> ?n }} }}'''
+    rewritten, _ = aggregate_query(query, 'item')
+    assert sorted(rows(dataset, rewritten)) == [(EX + 'a', '5'), (EX + 'b', '3')]
+
+
+def test_dataset_clauses_are_not_projected():
+    assert projected_variables(f'PREFIX ex: <{EX}> SELECT * FROM ex:g1 WHERE {{ ?s ?p ?o }}') == ['s', 'p', 'o']
+    assert projected_variables(f'SELECT ?s FROM <{EX}g1> WHERE {{ ?s ?p "FROM <x>" }}') == ['s']
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from regression_analysis import IncrementalOLS, perform_incremental_regression
+
+
+def make_frame(rows=200, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=rows)
+    return pd.DataFrame({'x': x, 'y': 2.0 + 3.0 * x + rng.normal(scale=0.1, size=rows),
+                         'w': rng.uniform(0.5, 2.0, size=rows)})
+
+
+def test_batches_match_a_single_fit():
+    frame = make_frame()
+    whole = IncrementalOLS(['const', 'x'])
+    whole.update(np.column_stack([np.ones(len(frame)), frame['x']]), frame['y'].to_numpy())
+    summary, figure, error = perform_incremental_regression([frame[:50], frame[50:]], 'y', ['x'])
+    assert error is None and figure is not None
+    assert 'OLS Regression Results' in summary
+    params = whole.fit()['params']
+    assert params == pytest.approx([2.0, 3.0], abs=0.05)
+    assert f"{params[1]:.4f}" in summary
+
+
+def test_weighted_fit_is_titled_wls():
+    summary, _, error = perform_incremental_regression([make_frame()], 'y', ['x'], weights_var='w')
+    assert error is None
+    assert 'WLS Regression Results' in summary
+    assert 'OLS Regression Results' not in summary
+
+
+def test_undersized_groups_are_skipped_and_reported():
+    frame = make_frame()
+    frame['region'] = 'large'
+    frame.loc[:1, 'region'] = 'tiny'
+    summary, figure, error = perform_incremental_regression([frame[:100], frame[100:]], 'y', ['x'],
+                                                            group_var='region')
+    assert error is None and figure is not None
+    assert 'region = large' in summary
+    assert 'region = tiny' not in summary
+    assert 'Skipped 1 region group(s)' in summary and summary.endswith('tiny')
+
+
+def test_error_when_every_group_is_undersized():
+    frame = make_frame(rows=4)
+    frame['region'] = ['a', 'a', 'b', 'b']
+    summary, figure, error = perform_incremental_regression([frame], 'y', ['x'], group_var='region')
+    assert summary is None and figure is None
+    assert 'too few observations' in error
+
+
+def test_error_without_enough_rows():
+    _, _, error = perform_incremental_regression([make_frame(rows=2)], 'y', ['x'])
+    assert error.startswith('Regression error: Not enough observations')
+
+
+def test_numbers_held_as_text_are_regressed_as_numbers():
+    from regression_analysis import perform_regression
+
+    frame = make_frame()
+    as_text = frame.assign(x=frame['x'].map(repr).astype('category'))
+    expected, _, _ = perform_regression(frame, 'y', ['x'])
+    summary, _, error = perform_regression(as_text, 'y', ['x'])
+    assert error is None
+    assert summary == expected
+    streamed, _, error = perform_incremental_regression([as_text[:100], as_text[100:]], 'y', ['x'])
+    assert error is None
+    coefficient = [line.split()[1] for line in expected.splitlines() if line.startswith('x ')]
+    assert [line.split()[1] for line in streamed.splitlines() if line.startswith('x ')] == coefficient
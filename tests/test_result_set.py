@@ -0,0 +1,66 @@
+import pandas as pd
+
+from result_set import XSD, ResultSet, as_dataframe, build_column
+
+
+def make_results(rows=100):
+    return ResultSet.from_rows([[f"http://example.org/item/{i}", str(i), f"label {i % 3}"] for i in range(rows)],
+                               ['item', 'number', 'label'])
+
+
+def test_to_dataframe_builds_only_the_requested_columns():
+    results = make_results()
+    frame = results.to_dataframe(['label', 'item'])
+    assert list(frame.columns) == ['label', 'item']
+    assert frame['item'].iloc[5] == 'http://example.org/item/5'
+    assert results._frame is None
+
+
+def test_to_dataframe_subset_of_cached_frame():
+    results = make_results()
+    full = results.to_dataframe()
+    assert results.to_dataframe() is full
+    pd.testing.assert_frame_equal(results.to_dataframe(['number']), full[['number']])
+
+
+def test_compacted_results_do_not_keep_their_frame():
+    results = make_results(2000).compact()
+    assert results.is_compact
+    assert results.to_dataframe() is not results.to_dataframe()
+    assert list(results.to_dataframe(['item'])['item'][:2]) == ['http://example.org/item/0', 'http://example.org/item/1']
+
+
+def test_as_dataframe_of_rows_with_usecols():
+    frame = as_dataframe([['a', '1'], ['b', '2']], ['name', 'value'], usecols=['value'])
+    assert list(frame.columns) == ['value']
+    assert list(frame['value']) == ['1', '2']
+
+
+def make_column(name, values, datatype):
+    return build_column(name, values, {datatype} if any(value is not None for value in values) else set())
+
+
+def test_concat_promotes_integer_and_float_batches_to_float():
+    first = ResultSet([make_column('x', ['1', None, '3'], XSD + 'integer')])
+    second = ResultSet([make_column('x', ['2.5', '4.25'], XSD + 'double')])
+    merged = ResultSet.concat([first, second])
+    assert merged.column('x').kind == 'float'
+    values = merged.to_dataframe()['x']
+    assert values.isna().tolist() == [False, True, False, False, False]
+    assert values.dropna().tolist() == [1.0, 3.0, 2.5, 4.25]
+
+
+def test_concat_keeps_the_kind_of_unbound_batches():
+    first = ResultSet([make_column('x', [None, None], XSD + 'integer')])
+    second = ResultSet([make_column('x', ['7', '8'], XSD + 'integer')])
+    merged = ResultSet.concat([first, second])
+    assert merged.column('x').kind == 'integer'
+    assert merged.to_dataframe()['x'].isna().tolist() == [True, True, False, False]
+
+
+def test_concat_of_unrelated_kinds_falls_back_to_strings():
+    first = ResultSet([make_column('x', ['1', '2'], XSD + 'integer')])
+    second = ResultSet([make_column('x', ['2020-01-01T00:00:00Z'], XSD + 'dateTime')])
+    merged = ResultSet.concat([first, second])
+    assert merged.column('x').kind == 'categorical'
+    assert list(merged.to_dataframe()['x'])[:2] == ['1', '2']
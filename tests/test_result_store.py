@@ -0,0 +1,112 @@
+import gc
+import threading
+import weakref
+
+import pytest
+
+import result_store
+from query_cache import QueryCache
+from result_set import ResultSet
+from result_store import ResultStore
+
+ENDPOINT = 'http://example.org/sparql'
+
+
+def make_results(rows=1000, offset=0):
+    return ResultSet.from_rows([[f"http://example.org/item/{offset + index}", index] for index in range(rows)],
+                               ['item', 'value'])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(memory_budget=10 ** 12, spill_dir=str(tmp_path), compact=False)
+
+
+def test_handles_share_one_copy_and_count_references(store):
+    results = make_results()
+    first = store.put('a', results)
+    second = store.put('a', make_results())
+    assert first.get() is second.get() is results
+    assert store.stats()['handles'] == 2
+
+    first.release()
+    assert store.stats()['handles'] == 1
+    del second
+    gc.collect()
+    assert store.stats()['handles'] == 0
+    assert store.acquire('a').get() is results  # Unreferenced results stay until the budget needs the room
+
+
+def test_replace_swaps_the_results_for_existing_handles(store):
+    handle = store.put('a', make_results())
+    fresh = make_results(offset=5)
+    store.put('a', fresh, replace=True)
+    assert handle.get() is fresh
+
+
+def test_unreferenced_results_are_dropped_first(store):
+    store.memory_budget = make_results().nbytes() * 3 // 2
+    store.put('a', make_results()).release()
+    held = store.put('b', make_results())
+    assert store.acquire('a') is None
+    assert held.get() is not None
+    assert store.stats()['spilled'] == 0
+
+
+def test_held_results_are_spilled_and_reloaded(store):
+    store.memory_budget = make_results().nbytes() * 3 // 2
+    first = store.put('a', make_results())
+    expected = make_results().to_rows()
+    second = store.put('b', make_results(offset=1))
+    assert store.stats()['spilled'] == 1
+
+    assert first.get().to_rows() == expected
+    stats = store.stats()
+    assert (stats['resident'], stats['spilled']) == (1, 1)  # Reloading 'a' spilled 'b'
+    assert second.get().to_rows() == make_results(offset=1).to_rows()
+
+
+def test_spilling_frees_results_also_held_by_the_query_cache(store):
+    cache = QueryCache(disk_dir=None, memory_bytes=0)
+    results = make_results()
+    cache.put(ENDPOINT, 'SELECT * WHERE { ?s ?p ?o } LIMIT 1000', {'success': True, 'data': results})
+    reference = weakref.ref(results)
+    store.memory_budget = results.nbytes() * 3 // 2
+    handle = store.put('a', results)
+    del results
+    store.put('b', make_results(offset=1))
+    gc.collect()
+
+    assert reference() is None
+    assert cache.get(ENDPOINT, 'SELECT * WHERE { ?s ?p ?o } LIMIT 1000') is None
+    assert len(handle.get()) == 1000
+
+
+def test_results_stay_readable_while_they_are_spilled(store, monkeypatch):
+    store.memory_budget = make_results().nbytes() * 3 // 2
+    first = store.put('a', make_results())
+    writing, finish = threading.Event(), threading.Event()
+    dump = result_store.pickle.dump
+
+    def slow_dump(*args, **kwargs):
+        writing.set()
+        finish.wait(5)
+        dump(*args, **kwargs)
+
+    monkeypatch.setattr(result_store.pickle, 'dump', slow_dump)
+    putter = threading.Thread(target=store.put, args=('b', make_results(offset=1)))
+    putter.start()
+    assert writing.wait(5)
+    # The spill of 'a' is being written: neither its readers nor the store's bookkeeping wait for it
+    assert len(first.get()) == 1000
+    assert store.stats()['entries'] == 2
+    finish.set()
+    putter.join(5)
+    assert store.stats()['spilled'] == 1
+
+
+def test_query_cache_keeps_small_results_on_its_own():
+    cache = QueryCache(disk_dir=None)
+    cache.put(ENDPOINT, 'SELECT * WHERE { ?s ?p ?o } LIMIT 10', {'success': True, 'data': make_results(10)})
+    gc.collect()
+    assert len(cache.get(ENDPOINT, 'SELECT * WHERE { ?s ?p ?o } LIMIT 10')['data']) == 10
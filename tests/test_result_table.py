@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from result_set import XSD, ResultSet, build_column
+from result_table import TableView, table_view
+
+
+@pytest.fixture
+def results():
+    names = ['Oak', 'ash', None, 'Birch', 'oak tree', 'Elm']
+    numbers = ['5', '3', '8', None, '1', '3']
+    dates = ['2021-03-01T00:00:00Z', '2020-01-01T00:00:00Z', None,
+             '2022-06-15T00:00:00Z', '2020-07-01T00:00:00Z', '2023-01-01T00:00:00Z']
+    return ResultSet([
+        build_column('name', names, {'literal'}),
+        build_column('count', numbers, {XSD + 'integer'}),
+        build_column('updated', dates, {XSD + 'dateTime'}),
+    ])
+
+
+def test_without_conditions_rows_keep_the_result_order(results):
+    assert TableView(results).rows().tolist() == [0, 1, 2, 3, 4, 5]
+
+
+def test_search_ignores_case(results):
+    view = TableView(results)
+    assert view.rows(search='OAK').tolist() == [0, 4]
+    assert view.rows(search='missing').tolist() == []
+
+
+def test_filters_combine(results):
+    view = TableView(results)
+    assert view.rows(filters={'name': {'values': ['Elm', 'ash']}}).tolist() == [1, 5]
+    assert view.rows(filters={'name': {'contains': 'oak'}}).tolist() == [0, 4]
+    assert view.rows(filters={'count': {'min': 3, 'max': 5}}).tolist() == [0, 1, 5]
+    assert view.rows(filters={'count': {'min': 3}, 'name': {'values': ['ash']}}).tolist() == [1]
+    assert view.rows(filters={'updated': {'min': '2021-01-01', 'max': None}}).tolist() == [0, 3, 5]
+
+
+def test_unbound_values_never_match(results):
+    view = TableView(results)
+    assert view.rows(filters={'count': {'min': 0}}).tolist() == [0, 1, 2, 4, 5]
+    assert 2 not in view.rows(filters={'updated': {'max': '2030-01-01'}}).tolist()
+    assert 2 not in view.rows(filters={'name': {'contains': ''}}).tolist()
+
+
+def test_sort_puts_unbound_values_last(results):
+    view = TableView(results)
+    assert view.rows(sort='count').tolist() == [4, 1, 5, 0, 2, 3]
+    assert view.rows(sort='count', descending=True).tolist() == [2, 0, 1, 5, 4, 3]
+    assert view.rows(sort='name').tolist() == [3, 5, 0, 1, 4, 2]
+    assert view.rows(sort='updated', descending=True).tolist()[-1] == 2
+
+
+def test_sort_applies_to_filtered_rows(results):
+    rows = TableView(results).rows(filters={'count': {'min': 3}}, sort='count', descending=True)
+    assert rows.tolist() == [2, 0, 1, 5]
+
+
+def test_page_is_indexed_by_row_position(results):
+    view = TableView(results)
+    rows = view.rows(sort='count')
+    frame = view.page(rows, 2, page_size=4)
+    assert frame.index.tolist() == [2, 3]
+    assert frame.index.name == 'row'
+    assert frame['count'].isna().tolist() == [False, True]
+    assert view.page(rows, 1, page_size=4)['name'].tolist() == ['oak tree', 'ash', 'Elm', 'Oak']
+
+
+def test_table_view_is_shared_per_result_set(results):
+    assert table_view(results) is table_view(results)
+    other = ResultSet([build_column('name', ['a'], {'literal'})])
+    assert table_view(other) is not table_view(results)
+
+
+def test_rows_held_as_lists_get_their_own_view():
+    view = table_view([['a', '1'], ['b', '2']], ['letter', 'digit'])
+    assert view.rows(search='b').tolist() == [1]
+    assert isinstance(view.rows(), np.ndarray)
+
+
+def test_view_does_not_keep_its_results_alive():
+    results = ResultSet([build_column('name', ['a'], {'literal'})])
+    view = table_view(results)
+    del results
+    with pytest.raises(ReferenceError):
+        view.rows()
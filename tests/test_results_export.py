@@ -0,0 +1,29 @@
+import io
+import os
+
+import pytest
+
+from result_set import ResultSet
+from results_export import available_formats, export_to_file, open_export
+
+
+@pytest.fixture
+def results():
+    rows = [[f'name {index}', str(index)] for index in range(250)]
+    return ResultSet.from_rows(rows, ['name', 'count'])
+
+
+@pytest.mark.parametrize('export_format', available_formats())
+def test_open_export_matches_the_file_export(tmp_path, results, export_format):
+    path = tmp_path / 'expected'
+    export_to_file(results, results.columns, export_format, path, chunk_size=100)
+    with open_export(results, results.columns, export_format, chunk_size=100) as handle:
+        assert handle.read() == path.read_bytes()
+
+
+def test_open_export_is_a_file_streamlit_reads_and_leaves_nothing_on_disk(tmp_path, monkeypatch, results):
+    monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+    with open_export(results, results.columns, 'CSV') as handle:
+        assert isinstance(handle, io.BufferedReader)
+        assert os.listdir(tmp_path) == []
+        assert handle.readline() == b'name,count\n'
@@ -0,0 +1,42 @@
+import io
+
+from results_parser import parse_delimited_results
+
+CSV = (
+    "item,count,price,flag,updated,day,code,label\r\n"
+    "http://example.org/a,1,2.5,true,2024-01-02T03:04:05Z,2024-01-02,007,x\r\n"
+    "http://example.org/b,,1e3,false,2024-02-03T00:00:00Z,2024-02-03,010,12\r\n"
+    "http://example.org/c,-3,4,true,,2024-03-04,020,y\r\n"
+)
+TSV = (
+    "?item\t?count\t?label\n"
+    "<http://example.org/a>\t1\t\"x\"@en\n"
+    "<http://example.org/b>\t\"2\"^^<http://www.w3.org/2001/XMLSchema#integer>\t\"a \\\"quoted\\\" y\"\n"
+)
+
+
+def parse(text, results_format):
+    return parse_delimited_results(io.BytesIO(text.encode('utf-8')), results_format)['result_set']
+
+
+def test_csv_columns_are_typed_from_their_values():
+    results = parse(CSV, 'csv')
+    kinds = {name: results.column(name).kind for name in results.columns}
+    assert kinds == {'item': 'categorical', 'count': 'integer', 'price': 'float', 'flag': 'boolean',
+                     'updated': 'datetime', 'day': 'datetime', 'code': 'categorical', 'label': 'categorical'}
+    frame = results.to_dataframe()
+    assert frame['count'].isna().tolist() == [False, True, False]
+    assert frame['price'].tolist() == [2.5, 1000.0, 4.0]
+    assert frame['code'].tolist() == ['007', '010', '020']
+    assert frame['label'].tolist() == ['x', '12', 'y']
+
+
+def test_tsv_keeps_term_types():
+    results = parse(TSV, 'tsv')
+    assert results.columns == ['item', 'count', 'label']
+    assert results.column('count').kind == 'integer'
+    assert results.to_dataframe()['label'].tolist() == ['x', 'a "quoted" y']
+
+
+def test_empty_response():
+    assert len(parse('', 'csv')) == 0